@@ -5,9 +5,10 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_mail import Mail, Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
 from dotenv import load_dotenv
-import os, jwt, datetime, random, threading, time
+import os, jwt, datetime, random, threading, time, inspect
 from datetime import timezone
 from db_operations import DatabaseOperations
+from config import STATUS_ALLOWED_ADDRESSES
 
 # ----------------- Load environment variables -----------------
 load_dotenv()
@@ -39,26 +40,51 @@ def init_mail(app):
 serializer = URLSafeTimedSerializer(SECRET_KEY)
 
 # ----------------- JWT Utility -----------------
-def token_required(f):
-    def wrapper(*args, **kwargs):
-        token = None
+def _authenticate_request():
+    """Decode the Bearer token into request.user; returns an error response or None"""
+    token = None
 
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            if auth_header and auth_header.startswith("Bearer "):
-                token = auth_header.split(" ")[1]
+    if 'Authorization' in request.headers:
+        auth_header = request.headers['Authorization']
+        if auth_header and auth_header.startswith("Bearer "):
+            token = auth_header.split(" ")[1]
 
-        if not token:
-            return jsonify({'message': 'Token is missing!'}), 401
+    if not token:
+        return jsonify({'message': 'Token is missing!'}), 401
 
-        try:
-            decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            request.user = decoded
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token has expired!'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Invalid token!'}), 401
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        request.user = decoded
+    except jwt.ExpiredSignatureError:
+        return jsonify({'message': 'Token has expired!'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'message': 'Invalid token!'}), 401
+    return None
+
+def token_required(f):
+    # Async views need an async wrapper so Flask still sees a coroutine function
+    if inspect.iscoroutinefunction(f):
+        async def async_wrapper(*args, **kwargs):
+            error = _authenticate_request()
+            if error is not None:
+                return error
+            return await f(*args, **kwargs)
+        async_wrapper.__name__ = f.__name__
+        return async_wrapper
 
+    def wrapper(*args, **kwargs):
+        error = _authenticate_request()
+        if error is not None:
+            return error
+        return f(*args, **kwargs)
+    wrapper.__name__ = f.__name__
+    return wrapper
+
+def internal_only(f):
+    """Serve only clients in STATUS_ALLOWED_ADDRESSES (monitoring endpoints)"""
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in STATUS_ALLOWED_ADDRESSES:
+            return jsonify({'message': 'Forbidden'}), 403
         return f(*args, **kwargs)
     wrapper.__name__ = f.__name__
     return wrapper
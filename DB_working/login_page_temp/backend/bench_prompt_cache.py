@@ -0,0 +1,97 @@
+# bench_prompt_cache.py
+# Measures llama.cpp prompt-processing time for the summary prompt laid out three ways:
+#   variable-first: the document ahead of the instructions, so no two requests share a
+#           prefix and every request processes the whole prompt (the layout to avoid)
+#   before: the request the app used to send: a single user message holding the
+#           instructions followed by the document and " /no-think", no cache_prompt
+#           field (the server's default applies)
+#   after:  static instructions as the system message, the document as the user
+#           message, cache_prompt on (the layout create_master_prompt now produces)
+# The original layout already put the instructions first, so "before" vs "after" only
+# measures the explicit cache_prompt and the system/user split; on a server that caches
+# prompts by default expect close to 1x there. "variable-first" vs "after" shows what a
+# stable prefix itself saves.
+# Usage: python bench_prompt_cache.py --url http://127.0.0.1:8080 --rounds 5
+import argparse
+import statistics
+import requests
+from chat_prompts import MASTER_SYSTEM_PROMPT, create_master_prompt
+
+SAMPLE_DOCUMENTS = [
+    "Chapter {n}: Gradient descent iteratively updates parameters against the gradient of the loss. "
+    "Learning rate schedules, momentum and Adam trade stability for speed of convergence.",
+    "Chapter {n}: TCP provides reliable, ordered delivery using sequence numbers, acknowledgements "
+    "and retransmission, with congestion control adapting the sending window to the network.",
+]
+
+def baseline_master_prompt(document):
+    """The summary prompt as the original create_master_prompt built it"""
+    return f"{MASTER_SYSTEM_PROMPT}### CONTENT TO BE SUMMARIZED ###\n{document}\n"
+
+def variable_first_payload(document):
+    return {
+        "messages": [{"role": "user", "content": f"### CONTENT TO BE SUMMARIZED ###\n{document}\n{MASTER_SYSTEM_PROMPT}"}],
+        "chat_template_kwargs": {"enable_thinking": False},
+        "cache_prompt": True
+    }
+
+def before_payload(document):
+    # The original client appended " /no-think" to suppress the thinking block
+    return {"messages": [{"role": "user", "content": baseline_master_prompt(document) + " /no-think"}]}
+
+def after_payload(document):
+    system_prompt, prompt = create_master_prompt(document)
+    return {
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ],
+        "chat_template_kwargs": {"enable_thinking": False},
+        "cache_prompt": True
+    }
+
+def run(session, url, build_payload, rounds, id_slot):
+    """Send `rounds` distinct documents; returns [(prompt_n, prompt_ms)] from llama.cpp timings"""
+    results = []
+    for n in range(rounds):
+        document = SAMPLE_DOCUMENTS[n % len(SAMPLE_DOCUMENTS)].format(n=n)
+        data = build_payload(document)
+        # One output token: we only care about prompt ingestion
+        data.update({"model": "local-model", "max_tokens": 1, "temperature": 0.0})
+        if id_slot is not None:
+            data["id_slot"] = id_slot
+        response = session.post(url.rstrip("/") + "/v1/chat/completions", json=data, timeout=600)
+        response.raise_for_status()
+        timings = response.json().get("timings", {})
+        results.append((timings.get("prompt_n"), timings.get("prompt_ms")))
+    return results
+
+def report(label, results):
+    # The first request of each layout pays the full prefix; later ones show the steady state
+    print(f"\n{label}")
+    for i, (prompt_n, prompt_ms) in enumerate(results):
+        print(f"  request {i + 1}: {prompt_n} prompt tokens processed in {prompt_ms:.1f} ms")
+    steady = [ms for _, ms in results[1:]] or [results[0][1]]
+    print(f"  median after warm-up: {statistics.median(steady):.1f} ms")
+    return statistics.median(steady)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare prompt processing with and without prefix reuse")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="llama-server base URL")
+    parser.add_argument("--rounds", type=int, default=5, help="requests per layout")
+    parser.add_argument("--slot", type=int, default=None, help="pin every request to this slot (id_slot)")
+    args = parser.parse_args()
+
+    session = requests.Session()
+    variable_first = report("variable-first (document then instructions)",
+                            run(session, args.url, variable_first_payload, args.rounds, args.slot))
+    before = report("before (one user message, instructions then document)",
+                    run(session, args.url, before_payload, args.rounds, args.slot))
+    after = report("after (static system prefix, cache_prompt on)",
+                   run(session, args.url, after_payload, args.rounds, args.slot))
+    if after:
+        print(f"\nStable prefix vs variable-first: {variable_first / after:.1f}x")
+        print(f"Explicit cache_prompt and system message vs the original layout: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    main()
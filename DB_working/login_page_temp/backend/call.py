@@ -1,10 +1,20 @@
-from flask import Flask
+from flask import Flask, Response, jsonify
 from flask_cors import CORS
 from threading import Thread
-from auth_routes import auth_bp, init_mail, cleanup_unverified_users
+from auth_routes import auth_bp, init_mail, cleanup_unverified_users, internal_only
 from chatbot_routes import chatbot_bp
 from roadmap_routes import roadmap_bp
 from progress_routes import progress_bp
+from job_routes import job_bp
+from jobs import start_job_workers, get_job_stats
+from utils import get_llm_client_stats
+from llm_async import get_async_client_stats
+from llm_metrics import llm_metrics
+from llm_semantic_cache import semantic_cache
+from db_operations import DatabaseOperations
+from config import SUMMARY_CHUNK_TTL_SECONDS
+from topic_index import topic_index
+from token_budget import get_token_budget_stats
 
 app = Flask(__name__)
 CORS(app)
@@ -19,14 +29,47 @@ app.register_blueprint(auth_bp, url_prefix="/auth")
 app.register_blueprint(chatbot_bp)
 app.register_blueprint(roadmap_bp)
 app.register_blueprint(progress_bp)
+app.register_blueprint(job_bp)
 
-# Start auto-cleanup background thread
-cleanup_thread = Thread(target=cleanup_unverified_users, daemon=True)
-cleanup_thread.start()
+def start_services():
+    """Database indexes and background threads, started with the server rather than on
+    import, so importing the app (tests, scripts) touches neither Mongo nor threads"""
+    # Start auto-cleanup background thread
+    Thread(target=cleanup_unverified_users, daemon=True).start()
+
+    # Shared generated content (roadmaps, details, sub-details) is looked up by key and content id;
+    # stored PDF part summaries expire after SUMMARY_CHUNK_TTL_SECONDS
+    DatabaseOperations.ensure_content_library_indexes()
+    DatabaseOperations.ensure_summary_chunk_indexes(SUMMARY_CHUNK_TTL_SECONDS)
+
+    # Start background job workers (handlers are registered by the blueprints above)
+    start_job_workers()
+
+    # Rebuild the semantic cache index from Mongo without delaying startup
+    Thread(target=semantic_cache.load, daemon=True).start()
 
 @app.route('/')
 def home():
     return "Combined Flask App is running!"
 
+@app.route('/llm_status')
+@internal_only
+def llm_status():
+    stats = get_llm_client_stats()
+    stats["async_client"] = get_async_client_stats()
+    stats["jobs"] = get_job_stats()
+    stats["semantic_cache"] = semantic_cache.get_stats()
+    stats["topic_index"] = topic_index.get_stats()
+    stats["token_budget"] = get_token_budget_stats()
+    stats["recent_calls"] = llm_metrics.recent_calls()
+    return jsonify(stats), 200
+
+@app.route('/metrics')
+@internal_only
+def metrics():
+    # Prometheus text exposition format
+    return Response(llm_metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    start_services()
     app.run(host='0.0.0.0', port=5000, debug=True)
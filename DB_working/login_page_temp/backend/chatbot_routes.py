@@ -1,11 +1,29 @@
 # chatbot_routes.py
 from flask import Blueprint, request, jsonify, session
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 import PyPDF2
+import asyncio
+import hashlib
 import json
+import queue
 import re
-from utils import get_local_llm_response, LLMConnectionError
+import threading
+import time
+from utils import (
+    get_local_llm_response, stream_local_llm_response, LLMConnectionError, LLMBusyError,
+    parse_json_response, wants_event_stream, sse_event, sse_response
+)
+from llm_async import async_get_local_llm_response
+from llm_schemas import flashcards_schema
+from llm_metrics import resolve_route
+from llm_profiles import get_generation_profile
+from llm_scheduler import llm_scheduler
+from config import LLM_MAX_CONCURRENCY, SUMMARY_CHUNK_MAX_TOKENS, LLM_QUEUE_TIMEOUT, LLAMA_CPP_READ_TIMEOUT
 from db_operations import DatabaseOperations
 from auth_routes import token_required
+from jobs import register_job_handler, enqueue_job, job_accepted_response, wants_background
+from token_budget import measure_prompt, fit_history, fit_text, split_to_tokens, prompt_budget, token_counter
+from chat_prompts import create_master_prompt
 
 chatbot_bp = Blueprint('chatbot_bp', __name__)
 
@@ -21,65 +39,235 @@ def extract_text_from_pdf(file_stream):
     except Exception as e:
         return f"Error reading PDF: {e}"
 
-def create_master_prompt(content_for_summary):
-    # ... (function is unchanged) ...
-    return f"""
-# 答 Expert Summary Generation Protocol
-## ROLE
-You are an expert **Academic Summarizer and Technical Writer**. Your task is to analyze the provided content (e.g., a textbook chapter, research paper, or technical document) and generate a **comprehensive, high-quality, and highly readable summary**. Your analysis must be deep, extracting core concepts, distinguishing key themes, and noting practical implications.
-## GOAL
-Produce a summary that is **superior in depth, clarity, and utility** to a basic auto-generated summary. The final output must serve as an excellent study guide, a quick reference for a professional, or a comprehensive overview for an instructor.
-## AUDIENCE
-The target audience is a **Graduate Student or a Mid-to-Senior Level Professional** in the field (e.g., Data Science, Software Engineering, etc.). Assume they have a foundational understanding but need a concise, detailed, and structured review of the document's most critical information.
-## INSTRUCTIONS FOR CONTENT AND TONE
-1.  **Prioritize Core Value:** Identify and extract the **most critical, non-obvious concepts** and the fundamental mathematical or algorithmic principles discussed. Do not waste space on overly generic filler text.
-2.  **Highlight Structure and Thesis:** The summary must clearly delineate the book's/document's overall **thesis, primary goal, and organizational structure**. Explain *why* the authors structured the material as they did.
-3.  **Use Active Synthesis:** Do not merely list section titles. Instead, synthesize the content under key thematic headings. For example, group related algorithms or principles together and explain their collective purpose.
-4.  **Define and Apply:** For every major concept (e.g., 'Bayes' Rule', 'Central Limit Theorem'), provide a **concise, technical definition** and a brief, real-world or theoretical **application/significance**.
-5.  **Maintain Professional Tone:** The tone should be **authoritative, clear, and objective**. Use technical vocabulary correctly and confidently.
-## MANDATORY MARKDOWN OUTPUT FORMAT
-Structure the summary using the following specific hierarchy. **Use bolding (`**...**`) judiciously for key terms.**
----
-# Summary of "[Document Title or Source]" by [Author(s)]
-## Executive Summary & Document Thesis
-* A 2-3 sentence overview covering the document's central argument, scope, and target impact.
-## Core Themes and Structural Blueprint
-* A bulleted list explaining the logical flow and main sections/parts of the document.
----
-## In-Depth Analysis: [Major Theme 1 - e.g., Foundations of Machine Learning]
-### [Sub-Concept A: The Theory - e.g., Probability Theory]
-* **Definition/Principle:** [Technical explanation of the concept.]
-* **Significance/Role:** [Why this concept is critical in the domain.]
-### [Sub-Concept B: The Application - e.g., Basic Algorithms]
-* **Key Algorithms/Methods:** A list of the central algorithms discussed.
-    * *Algorithm Name 1:* [Brief explanation and when to use it.]
-    * *Algorithm Name 2:* [Brief explanation and when to use it.]
----
-## Broader Implications and Next Steps
-* **Practical Takeaways:** The 2-3 most valuable lessons for a practicing professional.
-* **Open Questions/Future Work (if applicable):** Note any limitations or areas the document suggests for future exploration.
----
-**End of Summary.**
-### CONTENT TO BE SUMMARIZED ###
-{content_for_summary}
+# --- Large document summarisation (map-reduce) ---
+# Documents too large for one summary request are split into token-bounded parts along
+# their section headings. The parts are summarised in parallel across LLM slots (map),
+# then the master prompt runs over the part summaries (reduce). Every part summary is
+# stored as soon as it is done, so a retried job only redoes the parts that are missing.
+CHUNK_SUMMARY_SYSTEM_PROMPT = """
+### INSTRUCTIONS ###
+You are summarizing ONE PART of a longer document; a later pass combines the summaries of all parts.
+Write a dense, faithful Markdown summary of this part only:
+* Keep the document's own chapter and section names as headings.
+* Give every key concept a short technical definition.
+* List the main algorithms, methods, arguments, results and examples.
+Do not add an introduction, a conclusion or anything that is not in this part.
 """
 
-def create_chat_prompt(user_message, is_new_conversation=True, bot_name="Xiao"):
-    # ... (function is unchanged) ...
-    greeting_instruction = ""
-    if is_new_conversation:
-        greeting_instruction = f"""* **Initial Greeting:** Use a **short, one-sentence introduction** (e.g., "Hi! I'm {bot_name}, how can I help today?")."""
-    else:
-        greeting_instruction = f"""* **No Greeting:** This is an ongoing conversation. **Do not** introduce yourself."""
+# Tokens left for the "### PART i OF n: <sections> ###" line
+PART_HEADER_TOKENS = 64
+# Reduce passes over part summaries before the combined text is truncated instead
+MAX_REDUCE_ROUNDS = 4
+
+# "Chapter 3 ...", "Part II", "4.2 Gradient Descent", "APPENDIX A", "INTRODUCTION"
+SECTION_HEADING = re.compile(
+    r"^(?:(?i:chapter|part|section|appendix|lecture|unit)\s+[\w.]+\b.{0,80}"
+    r"|\d+(?:\.\d+)*\.?\s+[A-Z].{0,80}"
+    r"|[A-Z][A-Z0-9 ,:&'()-]{3,60})$"
+)
+
+summary_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="pdf-summary")
+# Longest wait for one part summary once all parts are queued
+SUMMARY_PART_TIMEOUT = LLM_QUEUE_TIMEOUT + LLAMA_CPP_READ_TIMEOUT
+# A part whose summary failed is passed on as its opening text, cut to this many characters
+PART_FALLBACK_CHARS = 2000
+
+def create_chunk_summary_prompt(chunk, part, parts, title=None):
+    heading = f"### PART {part} OF {parts}: {title} ###" if title else f"### PART {part} OF {parts} ###"
+    return CHUNK_SUMMARY_SYSTEM_PROMPT, f"""
+{heading}
+{chunk}
+"""
+
+def is_section_heading(line):
+    # Headings are short lines that do not read like the end of a sentence
+    return len(line) <= 90 and not line.endswith(('.', ',', ';')) and bool(SECTION_HEADING.match(line))
+
+def split_into_sections(text):
+    """[(heading, text)] in document order; text before the first heading has no heading"""
+    sections, heading, lines = [], None, []
+    for line in text.splitlines(keepends=True):
+        if is_section_heading(line.strip()):
+            if any(l.strip() for l in lines):
+                sections.append((heading, "".join(lines)))
+                lines = []
+            heading = line.strip()
+        lines.append(line)
+    if any(l.strip() for l in lines):
+        sections.append((heading, "".join(lines)))
+    return sections
+
+def pack_sections(sections, max_tokens):
+    """Group consecutive sections into parts of at most max_tokens; a section longer than a
+    part is split at line ends. Returns [{"title", "text"}], titled by the sections they hold."""
+    total_chars = sum(len(text) for _, text in sections)
+    # One tokenizer call for the whole document gives its characters per token
+    total_tokens, _ = token_counter.count("".join(text for _, text in sections))
+    chars_per_token = total_chars / max(total_tokens, 1)
+    limit = max_tokens * chars_per_token * 0.95
+    parts, text, headings = [], "", []
+
+    def flush():
+        if text.strip():
+            parts.append({"title": "; ".join(h for h in headings if h)[:150] or None, "text": text})
+
+    for heading, section in sections:
+        if len(section) > limit:
+            flush()
+            text, headings = "", []
+            for index, piece in enumerate(split_to_tokens(section, max_tokens)):
+                title = heading if index == 0 or not heading else f"{heading} (continued)"
+                parts.append({"title": title, "text": piece})
+            continue
+        if text and len(text) + len(section) > limit:
+            flush()
+            text, headings = "", []
+        text += section
+        headings.append(heading)
+    flush()
+
+    # The estimate can be off for unusual text; parts that still run over are split again
+    checked = []
+    for part in parts:
+        if token_counter.count(part["text"])[0] > max_tokens:
+            checked.extend({"title": part["title"], "text": piece} for piece in split_to_tokens(part["text"], max_tokens))
+        else:
+            checked.append(part)
+    return checked
+
+def part_fallback(part):
+    """Stand-in for a part whose summary could not be generated: its opening text"""
+    text = part["text"].strip()
+    if len(text) > PART_FALLBACK_CHARS:
+        text = text[:PART_FALLBACK_CHARS].rsplit(" ", 1)[0] + " ..."
+    return f"(Not summarised, opening of the part:)\n{text}"
+
+def summarize_parts(parts, route, on_progress=None, stage="map"):
+    """Summarise document parts in parallel across LLM slots; returns summaries in part order.
+    Parts are queued behind the LLM scheduler with the summary priority, like other fan-out
+    work. A part that fails or times out is replaced by its opening text; only when every
+    part fails is the first error raised. Part summaries are stored under a hash of their
+    prompt the moment they are done and looked up first, so a retried (or repeated) summary
+    skips the parts already finished."""
+    prompts = [
+        create_chunk_summary_prompt(part["text"], index, len(parts), part["title"])
+        for index, part in enumerate(parts, 1)
+    ]
+    keys = [hashlib.sha256(f"{system}\n{prompt}".encode("utf-8")).hexdigest() for system, prompt in prompts]
+    summaries = DatabaseOperations.get_summary_chunks(keys)
+    lock = threading.Lock()
+
+    def report():
+        if on_progress:
+            on_progress({"stage": stage, "done": len(summaries), "total": len(keys)})
+
+    def summarize(key, system_prompt, prompt):
+        summary = get_local_llm_response(prompt, system_prompt=system_prompt, profile="summary_chunk", route=route)
+        DatabaseOperations.save_summary_chunk(key, summary)
+        with lock:
+            summaries[key] = summary
+            report()
+
+    report()
+    priority = get_generation_profile("summary_chunk")["priority"]
+    futures = {
+        key: llm_scheduler.submit(summary_executor, priority, summarize, key, system_prompt, prompt)
+        for key, (system_prompt, prompt) in zip(keys, prompts) if key not in summaries
+    }
+    deadline = time.time() + SUMMARY_PART_TIMEOUT
+    errors = []
+    for number, (part, key) in enumerate(zip(parts, keys), 1):
+        future = futures.get(key)
+        if future is None:
+            continue
+        try:
+            future.result(timeout=max(0.0, deadline - time.time()))
+        except Exception as e:
+            if isinstance(e, FuturesTimeoutError):
+                e = LLMConnectionError("Timed out waiting for the AI server.")
+            print(f"Summary of part {number} of {len(keys)} failed, using its opening text: {e}")
+            errors.append(e)
+            with lock:
+                summaries[key] = part_fallback(part)
+                report()
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    return [summaries[key] for key in keys]
+
+def create_combined_summary_content(parts, summaries):
+    """Master-prompt input built from the summaries of a document's parts, as (heading, text) sections"""
+    sections = []
+    for index, (part, summary) in enumerate(zip(parts, summaries), 1):
+        heading = f"--- Summary of part {index} of {len(parts)}" + (f" ({part['title']})" if part["title"] else "") + " ---"
+        sections.append((part["title"], f"{heading}\n{summary}\n\n"))
+    return sections
 
+def summarize_document(content, on_progress=None, route=None):
+    """Summarise content of any size; returns (summary, context decision).
+    Content that fits gets a single master-prompt call; larger content goes through the
+    map-reduce pipeline above. `on_progress` receives {"stage", "done", "total"} snapshots."""
+    route = resolve_route(route)
+    system_prompt, final_prompt = create_master_prompt(content)
+    context = measure_prompt("summary", system_prompt, final_prompt)
+    if context["fits"]:
+        if on_progress:
+            on_progress({"stage": "summary", "done": 0, "total": 1})
+        return get_local_llm_response(final_prompt, system_prompt=system_prompt, profile="summary", route=route), context
+
+    # Room for a part once the part instructions and header are in
+    chunk_tokens = prompt_budget("summary_chunk") - token_counter.count(CHUNK_SUMMARY_SYSTEM_PROMPT)[0] - PART_HEADER_TOKENS
+    if SUMMARY_CHUNK_MAX_TOKENS:
+        chunk_tokens = min(chunk_tokens, SUMMARY_CHUNK_MAX_TOKENS)
+    original_tokens = context["prompt_tokens"]
+    parts = pack_sections(split_into_sections(content), chunk_tokens)
+    chunk_count = len(parts)
+    summaries = summarize_parts(parts, route, on_progress, stage="map")
+    rounds = 1
+    while True:
+        sections = create_combined_summary_content(parts, summaries)
+        combined = "".join(text for _, text in sections)
+        system_prompt, final_prompt = create_master_prompt(combined)
+        context = measure_prompt("summary", system_prompt, final_prompt)
+        if context["fits"] or rounds >= MAX_REDUCE_ROUNDS:
+            break
+        # The part summaries are still too long together: summarise them in groups first
+        parts = pack_sections(sections, chunk_tokens)
+        summaries = summarize_parts(parts, route, on_progress, stage=f"reduce_{rounds}")
+        rounds += 1
+    if not context["fits"]:
+        final_prompt, context = fit_text("summary", system_prompt, lambda text: create_master_prompt(text)[1], combined)
+
+    if on_progress:
+        on_progress({"stage": "summary", "done": 0, "total": 1})
+    summary = get_local_llm_response(final_prompt, system_prompt=system_prompt, profile="summary", route=route)
+    context.update(
+        action="chunked" if context["action"] == "none" else f"chunked_{context['action']}",
+        chunks=chunk_count, rounds=rounds, original_prompt_tokens=original_tokens
+    )
+    return summary, context
+
+def chat_system_prompt(bot_name="Xiao"):
     return f"""
     ### INSTRUCTIONS ###
     You are a **helpful and concise assistant** named {bot_name}.
     **Personality Profile:**
     * **Tone:** **Cheerful, witty, and curious.**
-    {greeting_instruction}
+    * **Greeting:** Follow the greeting rule given with the user message.
     * **Conciseness Rule:** **Be brief and to the point.** Do not offer extra information or elaborate on topics unless explicitly asked by the user. Answer the question asked, and then stop.
     * **Identity:** Always respond naturally as {bot_name}. Do not reveal you are an AI model.
+    """
+
+def create_chat_prompt(user_message, is_new_conversation=True, bot_name="Xiao"):
+    greeting_instruction = ""
+    if is_new_conversation:
+        greeting_instruction = f"""* **Initial Greeting:** Use a **short, one-sentence introduction** (e.g., "Hi! I'm {bot_name}, how can I help today?")."""
+    else:
+        greeting_instruction = f"""* **No Greeting:** This is an ongoing conversation. **Do not** introduce yourself."""
+
+    # The greeting rule depends on the conversation, so it lives in the variable tail
+    return chat_system_prompt(bot_name), f"""
+    ### GREETING RULE ###
+    {greeting_instruction}
     ### USER MESSAGE ###
     {user_message}
     """
@@ -91,6 +279,12 @@ def create_explanation_prompt(user_message, bot_name="Xiao"):
     Creates a prompt for a detailed, structured, and clear explanation, 
     triggered by 'explain: [...]' from text selection.
     """
+    return explanation_system_prompt(bot_name), f"""
+    ### USER MESSAGE (Explain this in detail) ###
+    {user_message}
+    """
+
+def explanation_system_prompt(bot_name="Xiao"):
     return f"""
     ### INSTRUCTIONS ###
     You are a **knowledgeable, helpful, and clear assistant** named {bot_name}.
@@ -109,15 +303,73 @@ def create_explanation_prompt(user_message, bot_name="Xiao"):
         4.  Provide a **clear, practical example**.
     * **Clarity over Length:** Focus on being **clear and understandable**, not just long. Avoid excessive, confusing analogies or conversational fluff.
     * **Identity:** Always respond naturally as {bot_name}. Do not reveal you are an AI model.
-
-    ### USER MESSAGE (Explain this in detail) ###
-    {user_message}
     """
 
+SUMMARY_FLASHCARDS_SYSTEM_PROMPT = """
+### INSTRUCTIONS ###
+You are an expert educator. Create flashcards from the provided summary content.
+Generate flashcards in JSON format. Each flashcard should have a "question" and "answer" field.
+The questions should test understanding of key concepts, definitions, and important information.
+The answers should be concise but informative.
+Output ONLY a valid JSON array. Example format:
+[
+  {"question": "What is the main concept?", "answer": "The main concept is..."},
+  {"question": "Define term X", "answer": "Term X is defined as..."}
+]
+Generate 10-15 flashcards based on the importance of the content.
+"""
+
+def create_summary_flashcards_prompt(summary_content):
+    return SUMMARY_FLASHCARDS_SYSTEM_PROMPT, f"""
+### SUMMARY CONTENT ###
+{summary_content}
+"""
+
+SUMMARY_CHAT_REPLY = "I've generated a summary of the content you provided."
+
+# --- Background jobs ---
+@register_job_handler("pdf_summary")
+def run_pdf_summary_job(job):
+    # Progress is reported per finished part; a retry after a failure resumes from the stored parts
+    summary_content, context = summarize_document(job.payload['content'], on_progress=job.report_progress)
+    for pdf_name in job.payload['pdf_names']:
+        DatabaseOperations.save_pdf_summary(job.user_email, pdf_name, summary_content)
+    return {"chat_reply": SUMMARY_CHAT_REPLY, "summary_content": summary_content, "context": context}
+
+@register_job_handler("pdf_flashcards")
+def run_pdf_flashcards_job(job):
+    pdf_name = job.payload['pdf_name']
+    pdf_summary = DatabaseOperations.get_pdf_summary_by_name(job.user_email, pdf_name)
+    if not pdf_summary or not pdf_summary.get("summary_content"):
+        raise ValueError("No summary content available")
+    flashcards = build_pdf_flashcards(
+        job.user_email, pdf_name, pdf_summary["summary_content"], regenerate=job.payload.get('regenerate', False)
+    )
+    return {"flashcards": flashcards}
+
+def build_pdf_flashcards(user_email, pdf_name, summary_content, regenerate=False):
+    """Generate flashcards for a PDF summary and store them; raises ValueError on bad output"""
+    system_prompt, flashcard_prompt = create_summary_flashcards_prompt(summary_content)
+    response_str = get_local_llm_response(
+        flashcard_prompt, system_prompt=system_prompt, profile="flashcards", cache=True, regenerate=regenerate,
+        json_schema=flashcards_schema(10, 15)
+    )
+    
+    try:
+        flashcards = parse_json_response(response_str)
+    except ValueError:
+        raise ValueError("Could not parse flashcards from AI response")
+    
+    if not isinstance(flashcards, list):
+        raise ValueError("Invalid flashcards format")
+    
+    DatabaseOperations.save_flashcards(user_email, pdf_name, flashcards)
+    return flashcards
+
 # --- Routes ---
 @chatbot_bp.route("/ask", methods=["POST"])
 @token_required
-def ask_ai():
+async def ask_ai():
     # ... (rest of the route is unchanged) ...
     user_message = request.form.get("message", "")
     pdf_files = request.files.getlist("files")
@@ -145,43 +397,129 @@ def ask_ai():
         context_text += f"\n\n--- PDF Content ({pdf_name}) ---\n{pdf_text}"
 
     if is_summarization_task:
-        final_prompt = create_master_prompt(f"{user_message}\n{context_text}")
+        if wants_background(request.form.get("background")):
+            # Long summaries run as a job; the client polls /jobs/<id> or its event stream
+            job_id = enqueue_job("pdf_summary", user_email, {
+                "content": f"{user_message}\n{context_text}", "pdf_names": pdf_names
+            })
+            return job_accepted_response(job_id)
+        system_prompt, final_prompt = create_master_prompt(f"{user_message}\n{context_text}")
+        profile = "summary"
+        context = measure_prompt(profile, system_prompt, final_prompt)
     
     elif user_message.strip().startswith("explain:"):
         # This will now use the new, clearer 'create_explanation_prompt'
-        final_prompt = create_explanation_prompt(user_message, bot_name="Xiao")
+        profile = "explain"
+        system_prompt = explanation_system_prompt(bot_name="Xiao")
+        final_prompt, context = fit_text(
+            profile, system_prompt, lambda message: create_explanation_prompt(message, bot_name="Xiao")[1], user_message
+        )
     
     else:
+        profile = "chat"
         is_new_conversation = len(conversation_history) == 0
-        history_context = ""
-        if conversation_history:
-            history_context = "\n\n### CONVERSATION HISTORY ###\n"
-            for msg in conversation_history[-5:]:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                history_context += f"{role.capitalize()}: {content}\n"
-            history_context += "\n### CURRENT USER MESSAGE ###\n"
-        
-        final_prompt = create_chat_prompt(
-            f"{history_context}{user_message}", 
-            is_new_conversation=is_new_conversation, 
-            bot_name="Xiao"
-        )
+
+        def build_chat_prompt(history, message=user_message):
+            history_context = ""
+            if history:
+                history_context = "\n\n### CONVERSATION HISTORY ###\n"
+                for msg in history:
+                    role = msg.get('role', 'user')
+                    content = msg.get('content', '')
+                    history_context += f"{role.capitalize()}: {content}\n"
+                history_context += "\n### CURRENT USER MESSAGE ###\n"
+            return create_chat_prompt(
+                f"{history_context}{message}", 
+                is_new_conversation=is_new_conversation, 
+                bot_name="Xiao"
+            )[1]
+
+        system_prompt = chat_system_prompt(bot_name="Xiao")
+        # Oldest messages go first when the prompt would overflow the context window
+        final_prompt, context = fit_history(profile, system_prompt, build_chat_prompt, conversation_history[-5:])
+        if not context["fits"]:
+            final_prompt, context = fit_text(
+                profile, system_prompt, lambda message: build_chat_prompt([], message), user_message
+            )
+            context["dropped_messages"] = len(conversation_history[-5:])
     
-    try:
-        ai_reply = get_local_llm_response(final_prompt)
-        
+    # Keep a user's conversation on one backend so its KV cache stays warm
+    sticky_key = None if is_summarization_task else user_email
+
+    def save_summaries(summary_content):
+        for pdf_name in pdf_names:
+            DatabaseOperations.save_pdf_summary(user_email, pdf_name, summary_content)
+
+    def build_reply(ai_reply, context=context, save=True):
         if is_summarization_task:
-            chat_reply = "I've generated a summary of the content you provided."
+            chat_reply = SUMMARY_CHAT_REPLY
             summary_content = ai_reply
             
-            for pdf_name in pdf_names:
-                DatabaseOperations.save_pdf_summary(user_email, pdf_name, summary_content)
+            if save:
+                save_summaries(summary_content)
         else:
             chat_reply = ai_reply
             summary_content = None
-        
-        return jsonify({"chat_reply": chat_reply, "summary_content": summary_content})
+        return {"chat_reply": chat_reply, "summary_content": summary_content, "context": context}
+
+    # Too large for one request: summarised part by part (no token stream for this path)
+    chunked = is_summarization_task and not context["fits"]
+
+    if wants_event_stream(request.form.get("stream")):
+        route = resolve_route()
+
+        def events():
+            chunks = []
+            try:
+                if chunked:
+                    # `progress` events while the parts are summarised, then `done`.
+                    # The thread saves the summary itself, so it is kept even if the client
+                    # disconnects before `done` is sent.
+                    updates = queue.Queue()
+
+                    def run():
+                        try:
+                            summary_content, chunked_context = summarize_document(
+                                f"{user_message}\n{context_text}", on_progress=lambda p: updates.put(("progress", p)),
+                                route=route
+                            )
+                            save_summaries(summary_content)
+                            updates.put(("done", (summary_content, chunked_context)))
+                        except Exception as e:
+                            updates.put(("error", e))
+
+                    threading.Thread(target=run, daemon=True).start()
+                    while True:
+                        kind, value = updates.get()
+                        if kind == "progress":
+                            yield sse_event(value, event="progress")
+                        elif kind == "error":
+                            raise value
+                        else:
+                            yield sse_event(build_reply(*value, save=False), event="done")
+                            return
+                for token in stream_local_llm_response(
+                    final_prompt, system_prompt=system_prompt, profile=profile, sticky_key=sticky_key, route=route
+                ):
+                    chunks.append(token)
+                    yield sse_event({"token": token})
+                yield sse_event(build_reply("".join(chunks).strip()), event="done")
+            except LLMBusyError as e:
+                yield sse_event({"chat_reply": str(e), "summary_content": None, "retry_after": e.retry_after}, event="error")
+            except LLMConnectionError as e:
+                yield sse_event({"chat_reply": "AI is offline. Please start the LLM server on port 8080 and try again.", "summary_content": None}, event="error")
+            except Exception as e:
+                yield sse_event({"chat_reply": f"An error occurred: {str(e)}", "summary_content": None}, event="error")
+        return sse_response(events())
+
+    try:
+        if chunked:
+            summary_content, chunked_context = await asyncio.to_thread(summarize_document, f"{user_message}\n{context_text}")
+            return jsonify(build_reply(summary_content, chunked_context))
+        ai_reply = await async_get_local_llm_response(final_prompt, system_prompt=system_prompt, profile=profile, sticky_key=sticky_key)
+        return jsonify(build_reply(ai_reply))
+    except LLMBusyError as e:
+        return jsonify({"chat_reply": str(e), "summary_content": None, "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"chat_reply": "AI is offline. Please start the LLM server on port 8080 and try again.", "summary_content": None}), 503
     except Exception as e:
@@ -244,36 +582,21 @@ def generate_flashcards(pdf_name):
         if not summary_content:
             return jsonify({"error": "No summary content available"}), 400
         
-        flashcard_prompt = f"""
-### INSTRUCTIONS ###
-You are an expert educator. Create flashcards from the provided summary content.
-Generate flashcards in JSON format. Each flashcard should have a "question" and "answer" field.
-The questions should test understanding of key concepts, definitions, and important information.
-The answers should be concise but informative.
-Output ONLY a valid JSON array. Example format:
-[
-  {{"question": "What is the main concept?", "answer": "The main concept is..."}},
-  {{"question": "Define term X", "answer": "Term X is defined as..."}}
-]
-Generate 10-15 flashcards based on the importance of the content.
-### SUMMARY CONTENT ###
-{summary_content}
-"""
-        
-        response_str = get_local_llm_response(flashcard_prompt)
-        
-        match = re.search(r'\[.*\]', response_str, re.DOTALL)
-        if not match:
-            return jsonify({"error": "Could not parse flashcards from AI response"}), 500
-        
-        flashcards = json.loads(match.group(0))
-        
-        if not isinstance(flashcards, list):
-            return jsonify({"error": "Invalid flashcards format"}), 500
-        
-        DatabaseOperations.save_flashcards(user_email, pdf_name, flashcards)
+        data = request.get_json(silent=True) or {}
+        if wants_background(data.get('background')):
+            job_id = enqueue_job("pdf_flashcards", user_email, {
+                "pdf_name": pdf_name, "regenerate": bool(data.get('regenerate'))
+            })
+            return job_accepted_response(job_id)
+
+        try:
+            flashcards = build_pdf_flashcards(user_email, pdf_name, summary_content, regenerate=bool(data.get('regenerate')))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
         
         return jsonify({"flashcards": flashcards}), 200
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except json.JSONDecodeError as e:
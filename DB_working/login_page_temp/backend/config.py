@@ -5,3 +5,146 @@ load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_NAME = os.getenv("DB_NAME")
+
+# --- Local LLM (llama.cpp) ---
+LLAMA_CPP_URL = os.getenv("LLAMA_CPP_URL", "http://127.0.0.1:8080/v1/chat/completions")
+# Keep this equal to llama-server's --parallel so the pool holds one connection per slot
+LLAMA_CPP_PARALLEL = int(os.getenv("LLAMA_CPP_PARALLEL", "4"))
+LLAMA_CPP_CONNECT_TIMEOUT = float(os.getenv("LLAMA_CPP_CONNECT_TIMEOUT", "5"))
+LLAMA_CPP_READ_TIMEOUT = float(os.getenv("LLAMA_CPP_READ_TIMEOUT", "300"))
+# Comma-separated llama-server base URLs; defaults to the server behind LLAMA_CPP_URL
+LLAMA_CPP_BACKENDS = [
+    url.strip() for url in os.getenv("LLAMA_CPP_BACKENDS", LLAMA_CPP_URL.split("/v1/")[0]).split(",")
+    if url.strip()
+]
+LLAMA_CPP_HEALTH_INTERVAL = float(os.getenv("LLAMA_CPP_HEALTH_INTERVAL", "10"))
+LLAMA_CPP_EJECT_AFTER = int(os.getenv("LLAMA_CPP_EJECT_AFTER", "3"))
+# Let llama-server reuse the KV cache of a matching prompt prefix
+LLAMA_CPP_CACHE_PROMPT = os.getenv("LLAMA_CPP_CACHE_PROMPT", "True") == "True"
+# Optional profile -> slot pins, e.g. "summary:0,quiz:1", so a profile's static
+# system prefix stays resident in one slot's KV cache
+LLAMA_CPP_SLOT_PINS = {
+    name.strip(): int(slot)
+    for name, slot in (
+        pin.split(":", 1) for pin in os.getenv("LLAMA_CPP_SLOT_PINS", "").split(",") if ":" in pin
+    )
+}
+
+# --- Model tiers ---
+# The backends above serve the "large" tier. An optional "small" tier (a faster model on
+# its own llama-server processes) takes cheap structured tasks; see llm_profiles.TIER_ROUTES.
+LLAMA_CPP_MODEL = os.getenv("LLAMA_CPP_MODEL", "local-model")
+LLAMA_CPP_SMALL_BACKENDS = [
+    url.strip() for url in os.getenv("LLAMA_CPP_SMALL_BACKENDS", "").split(",") if url.strip()
+]
+LLAMA_CPP_SMALL_MODEL = os.getenv("LLAMA_CPP_SMALL_MODEL", "local-model-small")
+# Optional profile -> tier overrides, e.g. "chat:small,grading:small"
+LLM_TIER_ROUTES = {
+    name.strip(): tier.strip()
+    for name, tier in (
+        route.split(":", 1) for route in os.getenv("LLM_TIER_ROUTES", "").split(",") if ":" in route
+    )
+}
+# Tier that takes over when a tier has no healthy (or no configured) backend
+LLM_TIER_FALLBACKS = {
+    name.strip(): fallback.strip()
+    for name, fallback in (
+        pair.split(":", 1) for pair in os.getenv("LLM_TIER_FALLBACKS", "small:large,large:small").split(",") if ":" in pair
+    )
+}
+LLAMA_CPP_BACKEND_COUNT = len(LLAMA_CPP_BACKENDS) + len(LLAMA_CPP_SMALL_BACKENDS)
+
+# --- LLM response cache ---
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "True") == "True"
+
+# --- LLM admission control ---
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", str(LLAMA_CPP_PARALLEL * LLAMA_CPP_BACKEND_COUNT)))
+LLM_MAX_QUEUE_DEPTH = int(os.getenv("LLM_MAX_QUEUE_DEPTH", "32"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+# Slots speculative pre-generation must leave free for real requests
+LLM_SPECULATIVE_RESERVED_SLOTS = int(os.getenv("LLM_SPECULATIVE_RESERVED_SLOTS", "1"))
+
+# --- LLM circuit breaker and retries ---
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+# A Retry-After longer than this is passed on to the client instead of being waited out
+LLM_RETRY_AFTER_MAX = float(os.getenv("LLM_RETRY_AFTER_MAX", "10"))
+
+# --- Background jobs ---
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# --- Batch quiz explanations ---
+# Batches up to this size are packed into one structured generation
+EXPLAIN_BATCH_PACK_MAX = int(os.getenv("EXPLAIN_BATCH_PACK_MAX", "3"))
+EXPLAIN_BATCH_MAX_ITEMS = int(os.getenv("EXPLAIN_BATCH_MAX_ITEMS", "50"))
+
+# --- Chunked grading ---
+GRADING_CHUNK_SIZE = int(os.getenv("GRADING_CHUNK_SIZE", "3"))
+GRADING_CHUNK_RETRIES = int(os.getenv("GRADING_CHUNK_RETRIES", "1"))
+
+# --- Speculative details pre-generation ---
+# Opt in per request with `prefetch_details`, or for every roadmap with SPECULATIVE_DETAILS=True
+SPECULATIVE_DETAILS = os.getenv("SPECULATIVE_DETAILS", "False") == "True"
+SPECULATIVE_DETAILS_TOPICS = int(os.getenv("SPECULATIVE_DETAILS_TOPICS", "3"))
+# Each time the LLM is busy the job is deferred; this bounds how long it keeps trying
+SPECULATIVE_DETAILS_MAX_ATTEMPTS = int(os.getenv("SPECULATIVE_DETAILS_MAX_ATTEMPTS", "30"))
+
+# --- Quiz generation ---
+# Larger quizzes (and every "Both" quiz) are generated as concurrent per-kind chunks of at most this size
+QUIZ_CHUNK_SIZE = int(os.getenv("QUIZ_CHUNK_SIZE", "5"))
+
+# --- Semantic cache ---
+# Near-duplicate topics/terms reuse an earlier answer; needs llama-server started with --embedding
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "True") == "True"
+LLAMA_CPP_EMBEDDING_URL = os.getenv("LLAMA_CPP_EMBEDDING_URL", LLAMA_CPP_BACKENDS[0].rstrip("/") + "/embedding")
+# Cosine similarity above which two normalised texts count as the same request
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+# --- Topic matching ---
+# generate_roadmap answers retyped or misspelt existing topics from a per-user index, before any generation
+TOPIC_INDEX_TTL = float(os.getenv("TOPIC_INDEX_TTL", "300"))
+TOPIC_INDEX_MAX_USERS = int(os.getenv("TOPIC_INDEX_MAX_USERS", "10000"))
+# Character edits a topic of 10+ characters may be away from an existing one and still be
+# taken for it (one edit from 5 characters, none below)
+TOPIC_MATCH_MAX_EDITS = int(os.getenv("TOPIC_MATCH_MAX_EDITS", "2"))
+# Similarity (0-1) at or above which an existing topic is mentioned as "did you mean"
+TOPIC_MATCH_SUGGEST = float(os.getenv("TOPIC_MATCH_SUGGEST", "0.6"))
+TOPIC_MATCH_MAX_SUGGESTIONS = int(os.getenv("TOPIC_MATCH_MAX_SUGGESTIONS", "3"))
+
+# --- Context window ---
+# Tokens one request may use: llama-server's --ctx-size divided by --parallel
+LLAMA_CPP_CONTEXT_SIZE = int(os.getenv("LLAMA_CPP_CONTEXT_SIZE", "16384"))
+# Optional profile -> context size overrides, e.g. "chat:8192,summary:32768"
+LLM_CONTEXT_LIMITS = {
+    name.strip(): int(limit)
+    for name, limit in (
+        pair.split(":", 1) for pair in os.getenv("LLM_CONTEXT_LIMITS", "").split(",") if ":" in pair
+    )
+}
+LLAMA_CPP_TOKENIZE_URL = os.getenv("LLAMA_CPP_TOKENIZE_URL", LLAMA_CPP_BACKENDS[0].rstrip("/") + "/tokenize")
+# Used when the tokenizer is unreachable; deliberately low so estimates err on the long side
+TOKEN_ESTIMATE_CHARS_PER_TOKEN = float(os.getenv("TOKEN_ESTIMATE_CHARS_PER_TOKEN", "3"))
+
+# --- PDF summarisation ---
+# Upper bound for one part of a large document (0 = as much as the summary_chunk budget allows);
+# smaller parts spread a book over more slots at the cost of a longer reduce pass
+SUMMARY_CHUNK_MAX_TOKENS = int(os.getenv("SUMMARY_CHUNK_MAX_TOKENS", "0"))
+# Part summaries are kept this long so a retried or repeated summary skips finished parts
+SUMMARY_CHUNK_TTL_SECONDS = int(os.getenv("SUMMARY_CHUNK_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# --- Monitoring ---
+# Client addresses allowed to read /llm_status and /metrics, which show every user's recent calls.
+# Behind a reverse proxy the proxy's address is the client: list it, or scrape from the host itself.
+STATUS_ALLOWED_ADDRESSES = {
+    address.strip() for address in os.getenv("STATUS_ALLOWED_ADDRESSES", "127.0.0.1,::1").split(",")
+    if address.strip()
+}
@@ -1,6 +1,9 @@
 # db_operations.py
-from pymongo import MongoClient
-from datetime import datetime, timezone
+from pymongo import MongoClient, ReturnDocument
+from datetime import datetime, timezone, timedelta
+from collections import Counter
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
 
@@ -23,6 +26,20 @@ quizzes_collection = db.quizzes
 quiz_attempts_collection = db.quiz_attempts
 quiz_status_collection = db.quiz_status
 pdf_summary_collection = db.pdf_summary
+llm_cache_collection = db.llm_cache
+jobs_collection = db.jobs
+semantic_cache_collection = db.semantic_cache
+content_library_collection = db.content_library
+summary_chunks_collection = db.summary_chunks
+
+# Generated material that is the same for every user; per-user notes of these types
+# hold a `content_ref` into the content library instead of the content itself
+SHARED_NOTE_TYPES = ("details", "sub_details")
+
+def library_key(text):
+    """Content library key of a topic or term: only case and whitespace are ignored.
+    Anything lossier would let "C", "C#" and "C++" share content."""
+    return " ".join(str(text or "").casefold().split())
 
 class DatabaseOperations:
     @staticmethod
@@ -123,8 +140,15 @@ class DatabaseOperations:
         return round(duration_minutes, 2)
     
     @staticmethod
-    def save_roadmap(user_email, topic, roadmap_data):
-        """Save roadmap data for a user"""
+    def save_roadmap(user_email, topic, roadmap_data, library_keys=None):
+        """Save roadmap data for a user; the generated topics go to the shared content library"""
+        if isinstance(roadmap_data.get("topics"), list):
+            content_id = DatabaseOperations.save_library_content(
+                "roadmap", library_keys or [library_key(topic)],
+                {"corrected_topic": topic, "topics": roadmap_data["topics"]}
+            )
+            roadmap_data = {key: value for key, value in roadmap_data.items() if key != "topics"}
+            roadmap_data["content_ref"] = content_id
         roadmap_doc = {
             "user_email": user_email,
             "topic": topic,
@@ -136,32 +160,46 @@ class DatabaseOperations:
     
     @staticmethod
     def update_roadmap(user_email, topic, roadmap_data):
-        """Update existing roadmap data"""
-        roadmaps_collection.update_one(
+        """Update existing roadmap data. The user's copy is edited, never the shared
+        library content: the new data is stored inline and the library reference released."""
+        roadmap_data = {key: value for key, value in roadmap_data.items() if key != "content_ref"}
+        previous = roadmaps_collection.find_one_and_update(
             {"user_email": user_email, "topic": topic},
             {
                 "$set": {
                     "roadmap_data": roadmap_data,
                     "updated_at": datetime.now(timezone.utc)
                 }
-            }
+            },
+            projection={"_id": 0, "roadmap_data.content_ref": 1}
         )
+        if previous:
+            DatabaseOperations.release_library_content([(previous.get("roadmap_data") or {}).get("content_ref")])
     
     @staticmethod
     def get_user_roadmaps(user_email):
         """Get all roadmaps for a user"""
-        return list(roadmaps_collection.find(
+        return DatabaseOperations.hydrate_roadmaps(list(roadmaps_collection.find(
             {"user_email": user_email},
             {"_id": 0}
-        ).sort("created_at", -1))
+        ).sort("created_at", -1)))
+    
+    @staticmethod
+    def get_user_roadmap_topics(user_email):
+        """Get just the topic names of a user's roadmaps"""
+        return [doc["topic"] for doc in roadmaps_collection.find(
+            {"user_email": user_email},
+            {"_id": 0, "topic": 1}
+        ) if doc.get("topic")]
     
     @staticmethod
     def get_roadmap_by_topic(user_email, topic):
         """Get specific roadmap by topic"""
-        return roadmaps_collection.find_one(
+        roadmap = roadmaps_collection.find_one(
             {"user_email": user_email, "topic": topic},
             {"_id": 0}
         )
+        return DatabaseOperations.hydrate_roadmaps([roadmap])[0] if roadmap else None
     
     @staticmethod
     def save_chat_message(user_email, message, response, message_type="chat"):
@@ -184,17 +222,22 @@ class DatabaseOperations:
         ).sort("created_at", -1).limit(limit))
     
     @staticmethod
-    def save_note(user_email, topic, note_type, content, metadata=None):
+    def save_note(user_email, topic, note_type, content, metadata=None, library_keys=None):
         """Save a note (study material, details, sub-details, quiz)"""
         note_doc = {
             "user_email": user_email,
             "topic": topic,
             "note_type": note_type,  # "details", "sub_details", "quiz", "summary"
-            "content": content,
             "metadata": metadata or {},
             "created_at": datetime.now(timezone.utc),
             "updated_at": datetime.now(timezone.utc)
         }
+        if note_type in SHARED_NOTE_TYPES:
+            note_doc["content_ref"] = DatabaseOperations.save_library_content(
+                note_type, library_keys or [library_key(topic)], content
+            )
+        else:
+            note_doc["content"] = content
         return notes_collection.insert_one(note_doc)
     
     @staticmethod
@@ -206,10 +249,20 @@ class DatabaseOperations:
         if note_type:
             query["note_type"] = note_type
             
-        return list(notes_collection.find(
+        return DatabaseOperations._hydrate(list(notes_collection.find(
             query,
             {"_id": 0}
-        ).sort("created_at", -1))
+        ).sort("created_at", -1)))
+    
+    @staticmethod
+    def get_latest_note(user_email, topic, note_type):
+        """Most recent note of a type for a topic, or None"""
+        note = notes_collection.find_one(
+            {"user_email": user_email, "topic": topic, "note_type": note_type},
+            {"_id": 0},
+            sort=[("created_at", -1)]
+        )
+        return DatabaseOperations._hydrate([note])[0] if note else None
     
     @staticmethod
     def update_note(user_email, topic, note_type, content, metadata=None):
@@ -220,16 +273,22 @@ class DatabaseOperations:
             "note_type": note_type
         }
         
+        # Copy on write: the note gets its own inline content and lets go of the shared one
         update_data = {
             "$set": {
                 "content": content,
                 "metadata": metadata or {},
                 "updated_at": datetime.now(timezone.utc)
-            }
+            },
+            "$unset": {"content_ref": ""}
         }
         
-        result = notes_collection.update_one(query, update_data, upsert=True)
-        return result
+        previous = notes_collection.find_one_and_update(
+            query, update_data, projection={"_id": 0, "content_ref": 1}, upsert=True
+        )
+        if previous:
+            DatabaseOperations.release_library_content([previous.get("content_ref")])
+        return previous
     
     @staticmethod
     def get_user_data(user_email):
@@ -429,3 +488,298 @@ class DatabaseOperations:
             {"_id": 0, "flashcards": 1}
         )
         return pdf_summary.get("flashcards", []) if pdf_summary else []
+
+    # --- LLM Response Cache ---
+    @staticmethod
+    def ensure_llm_cache_indexes(ttl_seconds):
+        """Create the unique key index and the TTL index that expires cached responses"""
+        llm_cache_collection.create_index("key", unique=True)
+        llm_cache_collection.create_index("created_at", expireAfterSeconds=int(ttl_seconds))
+
+    @staticmethod
+    def get_cached_llm_response(key):
+        """Get a cached LLM response by its content hash"""
+        return llm_cache_collection.find_one({"key": key}, {"_id": 0})
+
+    @staticmethod
+    def save_cached_llm_response(key, content, metadata=None):
+        """Store (or refresh) a cached LLM response"""
+        return llm_cache_collection.update_one(
+            {"key": key},
+            {"$set": {
+                "content": content,
+                "metadata": metadata or {},
+                "created_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+
+    # --- Semantic Cache ---
+    @staticmethod
+    def ensure_semantic_cache_indexes():
+        semantic_cache_collection.create_index([("namespace", 1), ("text", 1)], unique=True)
+        semantic_cache_collection.create_index("updated_at")
+
+    @staticmethod
+    def get_semantic_cache_entries(limit):
+        """Most recent entries (with their vectors), oldest first so they rebuild in order"""
+        docs = list(semantic_cache_collection.find({}, {"_id": 0}).sort("updated_at", -1).limit(limit))
+        docs.reverse()
+        return docs
+
+    @staticmethod
+    def save_semantic_cache_entry(namespace, text, embedding, content):
+        """Store (or refresh) the answer for a normalised prompt text"""
+        return semantic_cache_collection.update_one(
+            {"namespace": namespace, "text": text},
+            {"$set": {
+                "embedding": embedding,
+                "content": content,
+                "updated_at": datetime.now(timezone.utc)
+            }},
+            upsert=True
+        )
+
+    # --- Shared Content Library ---
+    @staticmethod
+    def ensure_content_library_indexes():
+        content_library_collection.create_index("content_id", unique=True)
+        content_library_collection.create_index([("kind", 1), ("keys", 1), ("refcount", -1)])
+
+    @staticmethod
+    def save_library_content(kind, keys, content):
+        """Store generated content once per content hash and take a reference to it; returns its id.
+        Every per-user document holding the id owns one reference (see release_library_content)."""
+        content_id = hashlib.sha256(
+            json.dumps([kind, content], sort_keys=True, ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        now = datetime.now(timezone.utc)
+        content_library_collection.update_one(
+            {"content_id": content_id},
+            {
+                "$inc": {"refcount": 1},
+                "$addToSet": {"keys": {"$each": list(keys)}},
+                "$set": {"last_used_at": now},
+                "$setOnInsert": {"kind": kind, "content": content, "created_at": now}
+            },
+            upsert=True
+        )
+        return content_id
+
+    @staticmethod
+    def find_library_content(kind, key):
+        """Content already generated (for any user) under a normalised key, most shared version first"""
+        doc = content_library_collection.find_one(
+            {"kind": kind, "keys": key, "refcount": {"$gt": 0}},
+            {"_id": 0, "content": 1},
+            sort=[("refcount", -1)]
+        )
+        return doc["content"] if doc else None
+
+    @staticmethod
+    def get_library_contents(content_ids):
+        """content_id -> content"""
+        if not content_ids:
+            return {}
+        return {
+            doc["content_id"]: doc["content"]
+            for doc in content_library_collection.find(
+                {"content_id": {"$in": list(set(content_ids))}}, {"_id": 0, "content_id": 1, "content": 1}
+            )
+        }
+
+    @staticmethod
+    def release_library_content(content_ids):
+        """Drop one reference per id (ids may repeat) and delete content nobody references any more"""
+        counts = Counter(content_id for content_id in content_ids if content_id)
+        for content_id, count in counts.items():
+            content_library_collection.update_one({"content_id": content_id}, {"$inc": {"refcount": -count}})
+        if counts:
+            content_library_collection.delete_many({"content_id": {"$in": list(counts)}, "refcount": {"$lte": 0}})
+
+    @staticmethod
+    def _hydrate(docs, field="content"):
+        """Replace `content_ref`s with the library content (in place); documents saved
+        before the library existed carry their content inline and are left alone"""
+        contents = DatabaseOperations.get_library_contents([doc["content_ref"] for doc in docs if doc.get("content_ref")])
+        for doc in docs:
+            if doc.get("content_ref") in contents:
+                doc[field] = contents[doc["content_ref"]]
+        return docs
+
+    @staticmethod
+    def hydrate_roadmaps(roadmaps):
+        """Fill `roadmap_data.topics` of roadmap documents that reference the library"""
+        data = [rm["roadmap_data"] for rm in roadmaps if isinstance(rm.get("roadmap_data"), dict)]
+        for roadmap_data in DatabaseOperations._hydrate(data, field="shared"):
+            shared = roadmap_data.pop("shared", None)
+            if isinstance(shared, dict):
+                roadmap_data["topics"] = shared.get("topics", [])
+        return roadmaps
+
+    # --- PDF Summary Parts ---
+    @staticmethod
+    def ensure_summary_chunk_indexes(ttl_seconds):
+        """Unique part key, and a TTL index that expires stored part summaries"""
+        summary_chunks_collection.create_index("chunk_key", unique=True)
+        summary_chunks_collection.create_index("created_at", expireAfterSeconds=int(ttl_seconds))
+
+    @staticmethod
+    def get_summary_chunks(chunk_keys):
+        """chunk_key -> summary for the parts already summarised"""
+        if not chunk_keys:
+            return {}
+        return {
+            doc["chunk_key"]: doc["summary"]
+            for doc in summary_chunks_collection.find(
+                {"chunk_key": {"$in": list(chunk_keys)}}, {"_id": 0, "chunk_key": 1, "summary": 1}
+            )
+        }
+
+    @staticmethod
+    def save_summary_chunk(chunk_key, summary):
+        """Store the summary of one document part"""
+        return summary_chunks_collection.update_one(
+            {"chunk_key": chunk_key},
+            {"$set": {"summary": summary, "created_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+
+    # --- Background Jobs ---
+    @staticmethod
+    def ensure_job_indexes():
+        """Indexes for claiming the next job and looking jobs up by id"""
+        jobs_collection.create_index("job_id", unique=True)
+        jobs_collection.create_index([("status", 1), ("priority", 1), ("created_at", 1)])
+        jobs_collection.create_index("lease_expires_at")
+
+    @staticmethod
+    def create_job(job_id, job_type, user_email, payload, priority, max_attempts):
+        """Insert a queued job"""
+        job_doc = {
+            "job_id": job_id,
+            "job_type": job_type,
+            "user_email": user_email,
+            "payload": payload,
+            "priority": priority,
+            "status": "queued",  # "queued", "running", "done", "failed", "cancelled"
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "worker_id": None,
+            "lease_expires_at": None,
+            "progress": None,
+            "result": None,
+            "error": None,
+            "run_after": datetime.now(timezone.utc),
+            "created_at": datetime.now(timezone.utc),
+            "updated_at": datetime.now(timezone.utc)
+        }
+        return jobs_collection.insert_one(job_doc)
+
+    @staticmethod
+    def claim_job(worker_id, job_types, lease_seconds):
+        """Atomically lease the next queued job, or a running job whose lease expired
+        (its worker crashed), to worker_id. Returns the job or None."""
+        now = datetime.now(timezone.utc)
+        return jobs_collection.find_one_and_update(
+            {
+                "job_type": {"$in": list(job_types)},
+                "$or": [
+                    {"status": "queued", "run_after": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}}
+                ]
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker_id": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", 1), ("created_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    def renew_job_lease(job_id, worker_id, lease_seconds):
+        """Extend a running job's lease; returns False if the worker no longer owns it"""
+        now = datetime.now(timezone.utc)
+        result = jobs_collection.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"lease_expires_at": now + timedelta(seconds=lease_seconds), "updated_at": now}}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    def update_job_progress(job_id, worker_id, progress):
+        """Store a progress snapshot (any JSON-able value) for a running job"""
+        return jobs_collection.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"progress": progress, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    @staticmethod
+    def complete_job(job_id, worker_id, result):
+        """Mark a job done; ignored if another worker has taken it over"""
+        now = datetime.now(timezone.utc)
+        return jobs_collection.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": {"status": "done", "result": result, "error": None, "lease_expires_at": None,
+                      "finished_at": now, "updated_at": now}}
+        )
+
+    @staticmethod
+    def fail_job(job_id, worker_id, error, retry_delay=None):
+        """Record a failure; with a retry_delay (seconds) the job is queued again after it"""
+        now = datetime.now(timezone.utc)
+        update = {"error": error, "lease_expires_at": None, "updated_at": now}
+        if retry_delay is not None:
+            update.update({"status": "queued", "worker_id": None, "run_after": now + timedelta(seconds=retry_delay)})
+        else:
+            update.update({"status": "failed", "finished_at": now})
+        return jobs_collection.update_one(
+            {"job_id": job_id, "worker_id": worker_id, "status": "running"},
+            {"$set": update}
+        )
+
+    @staticmethod
+    def cancel_job(job_id, user_email=None):
+        """Cancel a job that has not started yet"""
+        query = {"job_id": job_id, "status": "queued"}
+        if user_email:
+            query["user_email"] = user_email
+        result = jobs_collection.update_one(
+            query,
+            {"$set": {"status": "cancelled", "updated_at": datetime.now(timezone.utc)}}
+        )
+        return result.modified_count > 0
+
+    @staticmethod
+    def cancel_user_jobs(user_email, job_type, payload_filter=None):
+        """Cancel a user's queued or running jobs of a type, optionally matching payload fields.
+        Running handlers notice through JobContext.is_cancelled(); their result is discarded."""
+        query = {"user_email": user_email, "job_type": job_type, "status": {"$in": ["queued", "running"]}}
+        for key, value in (payload_filter or {}).items():
+            query[f"payload.{key}"] = value
+        now = datetime.now(timezone.utc)
+        result = jobs_collection.update_many(
+            query,
+            {"$set": {"status": "cancelled", "lease_expires_at": None, "finished_at": now, "updated_at": now}}
+        )
+        return result.modified_count
+
+    @staticmethod
+    def get_job_status(job_id):
+        job = jobs_collection.find_one({"job_id": job_id}, {"_id": 0, "status": 1})
+        return job.get("status") if job else None
+
+    @staticmethod
+    def get_job(job_id, user_email=None):
+        """Get a job by id, optionally scoped to its owner"""
+        query = {"job_id": job_id}
+        if user_email:
+            query["user_email"] = user_email
+        return jobs_collection.find_one(query, {"_id": 0, "payload": 0})
@@ -0,0 +1,476 @@
+# fake_llama_server.py
+# Deterministic stand-in for llama-server, for load and latency testing without a model.
+# Speaks /v1/chat/completions (blocking and streaming), /health, /slots, /tokenize,
+# /embedding and /v1/embeddings. Prompt processing and generation are simulated with
+# per-token sleeps, concurrency is limited to a fixed number of slots (each with its
+# own prompt cache, so cache_prompt/id_slot behave like the real server), errors can
+# be injected, and answers are canned fixtures that fit each of our prompt types.
+#
+# In-process:
+#     with FakeLlamaServer(slots=2, token_ms=5) as server:
+#         os.environ["LLAMA_CPP_BACKENDS"] = server.base_url   # before importing utils
+# As a separate process (then point LLAMA_CPP_BACKENDS at it and run call.py):
+#     python fake_llama_server.py --port 8080 --slots 4 --prompt-ms 0.5 --token-ms 20
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN_PATTERN = re.compile(r"\s*\S+")
+VOCAB_SIZE = 32000
+
+def tokenize(text):
+    """Whitespace-ish pieces: good enough for stable token counts and prefix matching"""
+    return TOKEN_PATTERN.findall(text or "")
+
+def token_ids(pieces):
+    return [zlib.crc32(piece.strip().encode("utf-8")) % VOCAB_SIZE for piece in pieces]
+
+def fake_embedding(text, dim):
+    """Unit-length vector from hashed word trigrams, so similar texts land close together"""
+    vector = [0.0] * dim
+    words = re.findall(r"\w+", (text or "").lower())
+    grams = [" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))] + words
+    for gram in grams:
+        digest = hashlib.md5(gram.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] % 2 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+# --- Canned answers ---
+def _schema_count(schema, default):
+    """Exact item count requested by a json_schema array (minItems), if any"""
+    if isinstance(schema, dict):
+        if schema.get("type") == "array" and schema.get("minItems"):
+            return schema["minItems"]
+        questions = (schema.get("properties") or {}).get("questions")
+        if questions:
+            return _schema_count(questions, default)
+    return default
+
+# The quoted subject in the task tail of our user prompts: **Topic:** "…" (roadmap),
+# for the topic: **"…"** (details), for the term: **"…"** (sub-details), Topic: "…" (quiz).
+# Anchored on those tails so quoted examples in the instructions never match.
+TOPIC_PATTERN = re.compile(
+    r'(?:\*\*Topic:\*\*\s*"([^"]+)"'
+    r'|for the (?:topic|term): \*\*"([^"]+)"\*\*'
+    r'|^Topic: "([^"]+)")',
+    re.MULTILINE
+)
+
+def _topic(prompt):
+    """Subject of the request: the last task-tail match, since the task follows the instructions"""
+    matches = TOPIC_PATTERN.findall(prompt)
+    if not matches:
+        return "Sample Topic"
+    return next(group for group in matches[-1] if group)
+
+def roadmap_fixture(prompt, schema):
+    topic = _topic(prompt)
+    return {
+        "corrected_topic": topic.title(),
+        "topics": [
+            {"id": i, "title": f"{topic.title()} Part {i}", "description": f"Key ideas of part {i} of {topic}."}
+            for i in range(1, 7)
+        ]
+    }
+
+def details_fixture(prompt, schema):
+    topic = _topic(prompt)
+    return [
+        {
+            "section_title": f"{topic} Section {s}",
+            "section_items": [
+                {"term": f"{topic} concept {s}.{i}", "definition": f"Short note on concept {s}.{i}."}
+                for i in range(1, 4)
+            ]
+        }
+        for s in range(1, 4)
+    ]
+
+def quiz_fixture(prompt, schema):
+    total = _schema_count(schema, 5)
+    mcq_match = re.search(r"(\d+) Multiple Choice", prompt)
+    desc_match = re.search(r"(\d+) Descriptive", prompt)
+    num_mcq = int(mcq_match.group(1)) if mcq_match else total
+    num_descriptive = int(desc_match.group(1)) if desc_match else total - num_mcq
+    batch_match = re.search(r"batch (\d+) of", prompt)
+    prefix = f"Batch {batch_match.group(1)}: " if batch_match else ""
+    questions = []
+    for i in range(1, num_mcq + 1):
+        questions.append({
+            "type": "mcq", "question": f"{prefix}Sample multiple choice question {i}?",
+            "options": ["Option A", "Option B", "Option C", "Option D"], "answer": "Option A"
+        })
+    for i in range(1, num_descriptive + 1):
+        questions.append({
+            "type": "descriptive", "question": f"{prefix}Explain sample concept {i}.",
+            "ideal_answer": f"A complete answer defines concept {i} and gives an example."
+        })
+    return {"questions": questions[:total] if schema else questions}
+
+def grading_fixture(prompt, schema):
+    count = _schema_count(schema, max(1, prompt.count('"user_answer"')))
+    return [{"score": i % 2, "feedback": "Good answer." if i % 2 else "Missing key points."} for i in range(count)]
+
+def flashcards_fixture(prompt, schema):
+    count = _schema_count(schema, 10)
+    return [{"question": f"Sample question {i}?", "answer": f"Sample answer {i}."} for i in range(1, count + 1)]
+
+def explanations_fixture(prompt, schema):
+    count = _schema_count(schema, max(1, prompt.count("### QUESTION")))
+    return [{"explanation": f"Question {i} hinges on its key definition.\n* Main point.\n* Common mistake."}
+            for i in range(1, count + 1)]
+
+JSON_FIXTURES = {
+    "roadmap": roadmap_fixture,
+    "details": details_fixture,
+    "quiz": quiz_fixture,
+    "grading": grading_fixture,
+    "flashcards": flashcards_fixture,
+    "quiz_explain_batch": explanations_fixture,
+}
+
+SUMMARY_TEXT = """# Summary of "Sample Document" by Sample Author
+## Executive Summary & Document Thesis
+* The document introduces its subject, motivates it and surveys the main techniques.
+## Core Themes and Structural Blueprint
+* Foundations, methods, and applications, in that order.
+---
+## In-Depth Analysis: Foundations
+### Core Concept
+* **Definition/Principle:** A concise technical definition.
+* **Significance/Role:** Why the concept matters.
+---
+## Broader Implications and Next Steps
+* **Practical Takeaways:** Apply the methods incrementally and measure.
+---
+**End of Summary.**"""
+
+SUB_DETAILS_HTML = ("<h2>Overview</h2><p>A foundational definition of the term.</p>"
+                    "<h3>Key Components</h3><ul><li><strong>First</strong>: what it does.</li>"
+                    "<li><strong>Second</strong>: how it is used.</li></ul>"
+                    "<h3>Example</h3><p>A practical analogy for beginners.</p>")
+
+EXPLANATION_TEXT = ("## Definition\nA concise definition of the selected term.\n\n"
+                    "## Purpose\n* Why it exists.\n* What problem it solves.\n\n"
+                    "## Example\nA short practical example.")
+
+def canned_response(messages, response_format):
+    """Pick a fixture from the json_schema name (our profile name) or the prompt text"""
+    prompt = "\n".join(str(m.get("content", "")) for m in messages)
+    json_schema = (response_format or {}).get("json_schema") or {}
+    kind = json_schema.get("name")
+    schema = json_schema.get("schema")
+    if kind not in JSON_FIXTURES:
+        if "curriculum designer" in prompt:
+            kind = "roadmap"
+        elif "study guide" in prompt and "section_title" in prompt:
+            kind = "details"
+        elif "quiz designer" in prompt:
+            kind = "quiz"
+        elif "Teaching Assistant" in prompt:
+            kind = "grading"
+        elif "flashcards" in prompt.lower() and "JSON" in prompt:
+            kind = "flashcards"
+    if kind in JSON_FIXTURES:
+        return json.dumps(JSON_FIXTURES[kind](prompt, schema))
+    if "Summary Generation Protocol" in prompt or "CONTENT TO BE SUMMARIZED" in prompt:
+        return SUMMARY_TEXT
+    if "HTML" in prompt and "deep-dive" in prompt:
+        return SUB_DETAILS_HTML
+    if "tutor" in prompt:
+        return "The correct answer follows from the definition.\n* It matches the key property.\n* The other options confuse related ideas."
+    if "In-Depth Explanation" in prompt:
+        return EXPLANATION_TEXT
+    return "Hi! I'm Xiao. This is a canned reply from the fake llama.cpp server."
+
+# --- Slots ---
+class Slot:
+    def __init__(self, slot_id):
+        self.id = slot_id
+        self.busy = False
+        self.cached_tokens = []
+        self.requests = 0
+
+class SlotPool:
+    """Fixed number of slots; callers wait for one like requests queue in llama-server"""
+
+    def __init__(self, count):
+        self.slots = [Slot(i) for i in range(count)]
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens, id_slot=None):
+        with self._cond:
+            while True:
+                if id_slot is not None and 0 <= id_slot < len(self.slots):
+                    candidates = [self.slots[id_slot]] if not self.slots[id_slot].busy else []
+                else:
+                    candidates = [slot for slot in self.slots if not slot.busy]
+                if candidates:
+                    # Prefer the free slot whose cache shares the longest prefix with this prompt
+                    slot = max(candidates, key=lambda s: common_prefix(s.cached_tokens, tokens))
+                    slot.busy = True
+                    slot.requests += 1
+                    return slot
+                self._cond.wait()
+
+    def release(self, slot):
+        with self._cond:
+            slot.busy = False
+            self._cond.notify_all()
+
+    def to_list(self):
+        with self._cond:
+            return [{"id": s.id, "is_processing": s.busy, "n_cached": len(s.cached_tokens), "requests": s.requests}
+                    for s in self.slots]
+
+def common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+# --- HTTP ---
+class FakeLlamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "fake-llama-server/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.config["verbose"]:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return None
+
+    def do_GET(self):
+        if self.path == "/health":
+            if self.server.injected_error(health=True):
+                self._send_json(503, {"error": {"code": 503, "message": "Loading model"}})
+            else:
+                self._send_json(200, {"status": "ok"})
+        elif self.path == "/slots":
+            self._send_json(200, self.server.slot_pool.to_list())
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "File Not Found"}})
+
+    def do_POST(self):
+        data = self._read_json()
+        if data is None:
+            self._send_json(400, {"error": {"code": 400, "message": "Invalid JSON"}})
+            return
+        if self.path == "/v1/chat/completions":
+            self._chat_completion(data)
+        elif self.path == "/tokenize":
+            self._send_json(200, {"tokens": token_ids(tokenize(data.get("content", "")))})
+        elif self.path == "/embedding":
+            self._send_json(200, {"embedding": fake_embedding(data.get("content", ""), self.server.config["embedding_dim"])})
+        elif self.path == "/v1/embeddings":
+            inputs = data.get("input", "")
+            inputs = inputs if isinstance(inputs, list) else [inputs]
+            self._send_json(200, {"object": "list", "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, self.server.config["embedding_dim"])}
+                for i, text in enumerate(inputs)
+            ]})
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": "File Not Found"}})
+
+    def _chat_completion(self, data):
+        config = self.server.config
+        if self.server.injected_error():
+            self._send_json(config["error_status"], {"error": {"code": config["error_status"], "message": "Injected error"}})
+            return
+        messages = data.get("messages") or []
+        prompt_pieces = tokenize("\n".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in messages))
+        prompt_ids = token_ids(prompt_pieces)
+        output_pieces = tokenize(canned_response(messages, data.get("response_format")))
+        max_tokens = data.get("max_tokens") or len(output_pieces)
+        finish_reason = "length" if len(output_pieces) > max_tokens else "stop"
+        output_pieces = output_pieces[:max_tokens]
+
+        slot = self.server.slot_pool.acquire(prompt_ids, data.get("id_slot"))
+        try:
+            # Prompt processing: only the part not already in this slot's KV cache
+            reused = common_prefix(slot.cached_tokens, prompt_ids) if data.get("cache_prompt", True) else 0
+            prompt_n = max(1, len(prompt_ids) - reused)
+            time.sleep(prompt_n * config["prompt_ms"] / 1000.0)
+            slot.cached_tokens = prompt_ids
+            started = time.time()
+            if data.get("stream"):
+                self._stream(data, output_pieces, finish_reason, len(prompt_ids), prompt_n, started)
+            else:
+                time.sleep(len(output_pieces) * config["token_ms"] / 1000.0)
+                content = "".join(output_pieces).strip()
+                self._send_json(200, {
+                    "id": f"chatcmpl-{self.server.next_id()}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": data.get("model", "fake-model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                 "finish_reason": finish_reason}],
+                    "usage": {"prompt_tokens": len(prompt_ids), "completion_tokens": len(output_pieces),
+                              "total_tokens": len(prompt_ids) + len(output_pieces)},
+                    "timings": self.server.timings(prompt_n, len(output_pieces), time.time() - started)
+                })
+        finally:
+            self.server.slot_pool.release(slot)
+
+    def _write_chunk(self, payload):
+        data = f"data: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, data, output_pieces, finish_reason, prompt_tokens, prompt_n, started):
+        config = self.server.config
+        completion_id = f"chatcmpl-{self.server.next_id()}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish=None, **extra):
+            event = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": data.get("model", "fake-model"),
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            event.update(extra)
+            return json.dumps(event)
+
+        try:
+            self._write_chunk(chunk({"role": "assistant", "content": None}))
+            for piece in output_pieces:
+                time.sleep(config["token_ms"] / 1000.0)
+                self._write_chunk(chunk({"content": piece}))
+            timings = self.server.timings(prompt_n, len(output_pieces), time.time() - started)
+            self._write_chunk(chunk({}, finish_reason, timings=timings))
+            if (data.get("stream_options") or {}).get("include_usage"):
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(output_pieces),
+                         "total_tokens": prompt_tokens + len(output_pieces)}
+                self._write_chunk(json.dumps({"id": completion_id, "object": "chat.completion.chunk",
+                                              "choices": [], "usage": usage}))
+            self._write_chunk("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Client hung up mid-stream, as the real server sees on cancelled requests
+            self.close_connection = True
+
+class FakeLlamaServer(ThreadingHTTPServer):
+    """Threaded fake llama-server. port=0 picks a free port (see base_url)."""
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, slots=4, prompt_ms=0.5, token_ms=20.0,
+                 error_rate=0.0, error_status=503, seed=0, embedding_dim=64, verbose=False):
+        super().__init__((host, port), FakeLlamaHandler)
+        self.config = {
+            "prompt_ms": prompt_ms, "token_ms": token_ms, "error_rate": error_rate,
+            "error_status": error_status, "embedding_dim": embedding_dim, "verbose": verbose
+        }
+        self.slot_pool = SlotPool(slots)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def injected_error(self, health=False):
+        """Seeded coin flip, so a given seed and request order fail the same way every run"""
+        if self.config["error_rate"] <= 0 or health:
+            return False
+        with self._lock:
+            return self._random.random() < self.config["error_rate"]
+
+    def next_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    @property
+    def completions(self):
+        """Chat completions answered so far (tests use it to count LLM calls)"""
+        with self._lock:
+            return self._ids
+
+    def timings(self, prompt_n, predicted_n, generation_seconds):
+        prompt_ms = prompt_n * self.config["prompt_ms"]
+        predicted_ms = generation_seconds * 1000.0
+        return {
+            "prompt_n": prompt_n,
+            "prompt_ms": round(prompt_ms, 3),
+            "prompt_per_second": round(prompt_n / (prompt_ms / 1000.0), 2) if prompt_ms else None,
+            "predicted_n": predicted_n,
+            "predicted_ms": round(predicted_ms, 3),
+            "predicted_per_second": round(predicted_n / (predicted_ms / 1000.0), 2) if predicted_ms else None
+        }
+
+    def start(self):
+        """Serve on a background thread; returns self"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake llama.cpp server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--slots", type=int, default=4, help="parallel slots (llama-server --parallel)")
+    parser.add_argument("--prompt-ms", type=float, default=0.5, help="prompt processing time per uncached token")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="generation time per output token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+
+    server = FakeLlamaServer(
+        host=args.host, port=args.port, slots=args.slots, prompt_ms=args.prompt_ms, token_ms=args.token_ms,
+        error_rate=args.error_rate, error_status=args.error_status, seed=args.seed,
+        embedding_dim=args.embedding_dim, verbose=args.verbose
+    )
+    print(f"Fake llama.cpp server listening on {server.base_url} with {args.slots} slots")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# job_routes.py
+import time
+from datetime import datetime
+from flask import Blueprint, request, jsonify
+from config import JOB_POLL_INTERVAL
+from db_operations import DatabaseOperations
+from auth_routes import token_required
+from utils import sse_event, sse_response
+
+job_bp = Blueprint('job_bp', __name__)
+
+FINISHED_STATUSES = ("done", "failed", "cancelled")
+
+# --- Helpers ---
+def job_to_dict(job):
+    """Public view of a job document (datetimes as ISO strings)"""
+    view = {}
+    for key in ("job_id", "job_type", "status", "attempts", "progress", "result", "error",
+                "created_at", "updated_at", "finished_at"):
+        value = job.get(key)
+        view[key] = value.isoformat() if isinstance(value, datetime) else value
+    return view
+
+# --- Routes ---
+@job_bp.route("/jobs/<job_id>", methods=["GET"])
+@token_required
+def get_job(job_id):
+    job = DatabaseOperations.get_job(job_id, request.user['email'])
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job_to_dict(job)), 200
+
+@job_bp.route("/jobs/<job_id>", methods=["DELETE"])
+@token_required
+def cancel_job(job_id):
+    if DatabaseOperations.cancel_job(job_id, request.user['email']):
+        return jsonify({"status": "cancelled"}), 200
+    return jsonify({"error": "Job not found or already started"}), 409
+
+@job_bp.route("/jobs/<job_id>/events", methods=["GET"])
+@token_required
+def job_events(job_id):
+    """SSE feed: a `status` event on every change, then `done` or `error`"""
+    user_email = request.user['email']
+    if not DatabaseOperations.get_job(job_id, user_email):
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        last_seen = None
+        while True:
+            job = DatabaseOperations.get_job(job_id, user_email)
+            if not job:
+                yield sse_event({"error": "Job not found"}, event="error")
+                return
+            view = job_to_dict(job)
+            if view["status"] in FINISHED_STATUSES:
+                yield sse_event(view, event="done" if view["status"] == "done" else "error")
+                return
+            snapshot = (view["status"], view["attempts"], repr(view["progress"]))
+            if snapshot != last_seen:
+                last_seen = snapshot
+                yield sse_event(view, event="status")
+            time.sleep(JOB_POLL_INTERVAL)
+    return sse_response(events())
@@ -0,0 +1,161 @@
+# jobs.py
+# Background generation jobs. Routes enqueue work and answer 202 with a job id;
+# worker threads lease jobs from the Mongo `jobs` collection, run the registered
+# handler and store the result. Leases are renewed while a job runs, so if a node
+# dies its jobs are picked up by another node once the lease expires.
+import os
+import socket
+import threading
+import uuid
+from flask import jsonify
+from config import JOB_WORKERS, JOB_LEASE_SECONDS, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS
+from db_operations import DatabaseOperations
+from llm_metrics import llm_route
+from llm_scheduler import PRIORITY_BACKGROUND, LLMBusyError
+from utils import LLMConnectionError, _RejectedLLMRequest
+
+# job_type -> handler(job_context) returning a JSON-serialisable result
+job_handlers = {}
+
+def register_job_handler(job_type):
+    """Decorator used by the route modules to register the function that runs a job type"""
+    def decorator(fn):
+        job_handlers[job_type] = fn
+        return fn
+    return decorator
+
+# Set on enqueue so local workers pick new jobs up without waiting for the next poll
+_wakeup = threading.Event()
+
+def enqueue_job(job_type, user_email, payload, priority=PRIORITY_BACKGROUND, max_attempts=JOB_MAX_ATTEMPTS):
+    """Queue a job and return its id"""
+    if job_type not in job_handlers:
+        raise ValueError(f"Unknown job type: {job_type}")
+    job_id = uuid.uuid4().hex
+    DatabaseOperations.create_job(job_id, job_type, user_email, payload, priority, max_attempts)
+    _wakeup.set()
+    return job_id
+
+def wants_background(flag):
+    """True when the client asked for a job instead of an inline answer (`background` flag)"""
+    if isinstance(flag, str):
+        return flag.strip().lower() in ("1", "true", "yes")
+    return bool(flag)
+
+def job_accepted_response(job_id):
+    """202 response pointing the client at the job's status and event stream"""
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }), 202, {"Location": f"/jobs/{job_id}"}
+
+class JobContext:
+    """What a handler sees: the job's payload and owner, plus progress reporting"""
+
+    def __init__(self, job, worker_id):
+        self.job_id = job["job_id"]
+        self.user_email = job["user_email"]
+        self.payload = job.get("payload") or {}
+        self.attempts = job["attempts"]
+        self._worker_id = worker_id
+
+    def report_progress(self, progress):
+        DatabaseOperations.update_job_progress(self.job_id, self._worker_id, progress)
+
+    def is_cancelled(self):
+        """Long handlers check this between steps and stop early"""
+        return DatabaseOperations.get_job_status(self.job_id) == "cancelled"
+
+class JobWorker(threading.Thread):
+    """Leases and runs jobs until stopped"""
+
+    def __init__(self, index):
+        super().__init__(name=f"job-worker-{index}", daemon=True)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        _wakeup.set()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                job = DatabaseOperations.claim_job(self.worker_id, list(job_handlers), JOB_LEASE_SECONDS)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                _wakeup.wait(JOB_POLL_INTERVAL)
+                _wakeup.clear()
+                continue
+            self._execute(job)
+
+    def _renew_lease(self, job_id, done):
+        # Renew well before expiry; a missed renewal lets another node take the job over
+        while not done.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                if not DatabaseOperations.renew_job_lease(job_id, self.worker_id, JOB_LEASE_SECONDS):
+                    print(f"Job {job_id}: lease lost")
+                    return
+            except Exception as e:
+                print(f"Job {job_id}: lease renewal failed: {e}")
+
+    def _execute(self, job):
+        job_id = job["job_id"]
+        if job["attempts"] > job["max_attempts"]:
+            # Its previous workers died mid-run too many times
+            DatabaseOperations.fail_job(job_id, self.worker_id, f"Job abandoned after {job['max_attempts']} attempts")
+            _stats_bump("failed")
+            return
+
+        done = threading.Event()
+        threading.Thread(target=self._renew_lease, args=(job_id, done), daemon=True).start()
+        try:
+            with llm_route(f"job:{job['job_type']}"):
+                result = job_handlers[job["job_type"]](JobContext(job, self.worker_id))
+        except Exception as e:
+            retryable = isinstance(e, (LLMBusyError, LLMConnectionError)) and not isinstance(e, _RejectedLLMRequest)
+            if retryable and job["attempts"] < job["max_attempts"]:
+                delay = getattr(e, "retry_after", None) or JOB_POLL_INTERVAL * (2 ** job["attempts"])
+                print(f"Job {job_id} ({job['job_type']}) will retry in {delay}s: {e}")
+                DatabaseOperations.fail_job(job_id, self.worker_id, str(e), retry_delay=delay)
+                _stats_bump("retried")
+            else:
+                print(f"Job {job_id} ({job['job_type']}) failed: {e}")
+                DatabaseOperations.fail_job(job_id, self.worker_id, str(e))
+                _stats_bump("failed")
+        else:
+            DatabaseOperations.complete_job(job_id, self.worker_id, result)
+            _stats_bump("completed")
+        finally:
+            done.set()
+
+_workers = []
+_workers_lock = threading.Lock()
+_stats = {"completed": 0, "failed": 0, "retried": 0}
+
+def _stats_bump(key):
+    with _workers_lock:
+        _stats[key] += 1
+
+def start_job_workers(count=JOB_WORKERS):
+    """Start this process's job workers once"""
+    with _workers_lock:
+        if _workers or count <= 0:
+            return _workers
+        DatabaseOperations.ensure_job_indexes()
+        for index in range(count):
+            worker = JobWorker(index)
+            worker.start()
+            _workers.append(worker)
+    return _workers
+
+def get_job_stats():
+    with _workers_lock:
+        stats = dict(_stats)
+        stats["workers"] = len(_workers)
+    stats["job_types"] = sorted(job_handlers)
+    return stats
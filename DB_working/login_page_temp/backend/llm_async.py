@@ -0,0 +1,196 @@
+# llm_async.py
+# asyncio client for llama.cpp. All async LLM work runs on one background event
+# loop that owns a single aiohttp session, so the HTTP requests share one keep-alive
+# pool and the requests of one view (e.g. quiz chunks) run concurrently from a single
+# thread. This does not make waiting free: under WSGI Flask runs every async view in
+# its own event loop on the worker thread that took the request, so that thread stays
+# busy until the view returns. The sync client in utils keeps working for scripts.
+import asyncio
+import json
+import re
+import threading
+import aiohttp
+from config import LLAMA_CPP_BACKEND_COUNT, LLAMA_CPP_PARALLEL, LLAMA_CPP_CONNECT_TIMEOUT, LLAMA_CPP_READ_TIMEOUT, LLM_MAX_RETRIES
+from llm_cache import llm_cache, make_cache_key
+from llm_profiles import get_generation_profile
+from llm_metrics import llm_metrics, resolve_route
+from llm_scheduler import llm_scheduler
+from utils import (
+    LLMConnectionError, _TransientLLMError, _RejectedLLMRequest, OFFLINE_MESSAGE,
+    llm_tiers, llm_breaker, _acquire_backend, _payload_for, _build_chat_request, retry_delay, parse_retry_after,
+    _count, track_llm_call, served_by_requested_tier
+)
+
+class AsyncLLMClient:
+    """Owns the background event loop, its aiohttp session and async single-flight state"""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    # --- Event loop ---
+    def loop(self):
+        """Start the LLM event loop thread on first use and return the loop"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(target=loop.run_forever, name="llm-async-loop", daemon=True)
+                    self._thread.start()
+                    self._loop = loop
+        return self._loop
+
+    async def run(self, coro):
+        """Await `coro` on the LLM loop from any event loop"""
+        loop = self.loop()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def _get_session(self):
+        # Only touched from the LLM loop, so no lock is needed
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=LLAMA_CPP_PARALLEL * LLAMA_CPP_BACKEND_COUNT,
+                limit_per_host=LLAMA_CPP_PARALLEL,
+                keepalive_timeout=60
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(sock_connect=LLAMA_CPP_CONNECT_TIMEOUT, sock_read=LLAMA_CPP_READ_TIMEOUT),
+                headers={"Content-Type": "application/json"}
+            )
+        return self._session
+
+    # --- HTTP ---
+    async def _post_chat_completion(self, data, sticky_key=None, call=None, tier_name="large", failed_tiers=None):
+        """Async twin of utils._post_chat_completion"""
+        tier, backend = _acquire_backend(tier_name, sticky_key, call, failed_tiers)
+        ok = False
+        _count("requests")
+        try:
+            async with self._get_session().post(backend.chat_url, data=json.dumps(_payload_for(tier, data))) as response:
+                ok = response.status < 500
+                if response.status >= 400:
+                    _raise_status_error(response.status, response.headers.get("Retry-After"))
+                body = await response.json(content_type=None)
+            if call is not None:
+                call["usage"] = body.get("usage")
+                call["timings"] = body.get("timings")
+            content = body['choices'][0]['message']['content']
+            # Reliably remove the <think> block if the AI still adds it
+            return re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
+        except aiohttp.ClientConnectionError as e:
+            _count("errors")
+            print(f"Error connecting to local LLM server: {e}")
+            raise _TransientLLMError(OFFLINE_MESSAGE)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _count("errors")
+            print(f"Error connecting to local LLM server: {e!r}")
+            raise LLMConnectionError(OFFLINE_MESSAGE)
+        finally:
+            if not ok and failed_tiers is not None:
+                failed_tiers.add(tier.name)
+            llm_tiers.release(tier, backend, ok)
+
+    async def _call_with_retries(self, fn):
+        """Async twin of utils._call_with_retries (same breaker, same backoff)"""
+        attempt = 0
+        while True:
+            llm_breaker.before_call()
+            try:
+                result = await fn()
+            except Exception as e:
+                llm_breaker.record(e)
+                delay = retry_delay(e, attempt) if isinstance(e, _TransientLLMError) and attempt < LLM_MAX_RETRIES else None
+                if delay is not None:
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                raise
+            llm_breaker.record()
+            return result
+
+    # --- Single-flight ---
+    async def _single_flight(self, key, make_coro):
+        """Coalesce identical in-flight requests; all callers share the leader's task"""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(make_coro())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self._stats["executed"] += 1
+        else:
+            self._stats["coalesced"] += 1
+        # Shielded so one caller disconnecting does not cancel the shared generation
+        return await asyncio.shield(task)
+
+    async def get_response(self, prompt_text, profile="default", cache=False, regenerate=False, priority=None,
+                           sticky_key=None, json_schema=None, system_prompt=None, route="unknown"):
+        profile = get_generation_profile(profile)
+        if priority is None:
+            priority = profile["priority"]
+        data = _build_chat_request(prompt_text, profile, json_schema=json_schema, system_prompt=system_prompt)
+        request_key = make_cache_key(data)
+        if cache:
+            if regenerate:
+                llm_cache.record_bypass()
+            else:
+                # The Mongo tier blocks, so look it up off the event loop
+                cached = await asyncio.to_thread(llm_cache.get, request_key)
+                if cached is not None:
+                    llm_metrics.record_call(route, profile["name"], "cache_hit", 0.0)
+                    return cached
+
+        async def generate():
+            with track_llm_call(route, profile["name"]) as call:
+                llm_breaker.ensure_not_open()  # fail fast instead of queueing during an outage
+                async with llm_scheduler.slot_async(priority) as waited:
+                    call["queue_wait"] = waited
+                    failed_tiers = set()
+                    content = await self._call_with_retries(
+                        lambda: self._post_chat_completion(data, sticky_key, call, profile["tier"], failed_tiers)
+                    )
+            if cache and served_by_requested_tier(call):
+                await asyncio.to_thread(llm_cache.set, request_key, content, {"model": data["model"]})
+            return content
+
+        return await self._single_flight(request_key, generate)
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["in_flight"] = len(self._in_flight)
+        stats["loop_running"] = self._loop is not None and self._loop.is_running()
+        return stats
+
+def _raise_status_error(status, retry_after=None):
+    """Map an HTTP error status (and Retry-After header) from llama.cpp onto the sync client's exception types"""
+    _count("errors")
+    print(f"Error connecting to local LLM server: HTTP {status}")
+    if status in (502, 503, 504):
+        raise _TransientLLMError(OFFLINE_MESSAGE, parse_retry_after(retry_after))
+    if status < 500:
+        raise _RejectedLLMRequest(f"AI server rejected the request (HTTP {status}).")
+    raise LLMConnectionError(OFFLINE_MESSAGE)
+
+async_llm_client = AsyncLLMClient()
+
+async def async_get_local_llm_response(prompt_text, profile="default", cache=False, regenerate=False, priority=None,
+                                       sticky_key=None, json_schema=None, system_prompt=None, route=None):
+    """
+    Awaitable version of utils.get_local_llm_response, with the same arguments,
+    caching, coalescing, priority scheduling, circuit breaker and retries.
+    Raises LLMConnectionError if connection fails, LLMBusyError if the queue is full.
+    """
+    # The route is resolved here, in the caller's request context, before hopping loops
+    return await async_llm_client.run(async_llm_client.get_response(
+        prompt_text, profile=profile, cache=cache, regenerate=regenerate, priority=priority,
+        sticky_key=sticky_key, json_schema=json_schema, system_prompt=system_prompt, route=resolve_route(route)
+    ))
+
+def get_async_client_stats():
+    return async_llm_client.get_stats()
@@ -0,0 +1,190 @@
+# llm_backends.py
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+CHAT_COMPLETIONS_PATH = "/v1/chat/completions"
+HEALTH_PATH = "/health"
+
+class NoHealthyBackendError(Exception):
+    """Raised when every configured llama.cpp backend is ejected"""
+    pass
+
+class LLMBackend:
+    """One llama-server process and its load/health bookkeeping"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.last_probe = None
+
+    @property
+    def chat_url(self):
+        return self.base_url + CHAT_COMPLETIONS_PATH
+
+    def to_dict(self):
+        return {
+            "url": self.base_url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_probe": self.last_probe
+        }
+
+class LLMBackendPool:
+    """Routes each call to the healthy backend with the fewest outstanding requests.
+    Backends are ejected after `eject_after` consecutive failures (calls or /health
+    probes) and re-admitted by the next successful probe."""
+
+    def __init__(self, base_urls, eject_after=3, health_interval=10.0, max_sticky_keys=2048):
+        self.backends = [LLMBackend(url) for url in base_urls]
+        self.eject_after = eject_after
+        self.health_interval = health_interval
+        self.max_sticky_keys = max_sticky_keys
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+        self._health_thread = None
+
+    def acquire(self, sticky_key=None):
+        """Pick a backend and count the call against it; pair with release()"""
+        with self._lock:
+            healthy = [b for b in self.backends if b.healthy]
+            if not healthy:
+                raise NoHealthyBackendError("No healthy LLM backend available")
+
+            backend = None
+            if sticky_key is not None:
+                pinned = self._sticky.get(sticky_key)
+                if pinned is not None and pinned.healthy:
+                    backend = pinned
+                    self._sticky.move_to_end(sticky_key)
+
+            if backend is None:
+                # Least outstanding requests; rotate the starting point so ties spread out
+                offset = next(self._rotation) % len(healthy)
+                ordered = healthy[offset:] + healthy[:offset]
+                backend = min(ordered, key=lambda b: b.outstanding)
+                if sticky_key is not None:
+                    self._sticky[sticky_key] = backend
+                    self._sticky.move_to_end(sticky_key)
+                    while len(self._sticky) > self.max_sticky_keys:
+                        self._sticky.popitem(last=False)
+
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend, ok=True):
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                backend.consecutive_failures = 0
+            else:
+                self._record_failure(backend)
+
+    def _record_failure(self, backend):
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.healthy and backend.consecutive_failures >= self.eject_after:
+            backend.healthy = False
+            print(f"LLM backend {backend.base_url} ejected after {backend.consecutive_failures} failures")
+
+    def probe(self, session, timeout=2.0):
+        """Run one round of /health checks against every backend"""
+        for backend in self.backends:
+            try:
+                response = session.get(backend.base_url + HEALTH_PATH, timeout=timeout)
+                ok = response.status_code == 200
+                response.close()
+            except Exception:
+                ok = False
+            with self._lock:
+                backend.last_probe = time.time()
+                if ok:
+                    if not backend.healthy:
+                        print(f"LLM backend {backend.base_url} re-admitted")
+                    backend.healthy = True
+                    backend.consecutive_failures = 0
+                else:
+                    self._record_failure(backend)
+
+    def start_health_checks(self, session_factory):
+        """Start the background /health prober once; session_factory returns a requests.Session"""
+        with self._lock:
+            if self._health_thread is not None or self.health_interval <= 0:
+                return
+            def run():
+                while True:
+                    time.sleep(self.health_interval)
+                    self.probe(session_factory())
+            self._health_thread = threading.Thread(target=run, daemon=True)
+            self._health_thread.start()
+
+    def get_stats(self):
+        with self._lock:
+            return [backend.to_dict() for backend in self.backends]
+
+class LLMTier:
+    """A model served by its own backend pool, plus the tier to use when it has no healthy backend"""
+
+    def __init__(self, name, model, pool, fallback=None):
+        self.name = name
+        self.model = model
+        self.pool = pool
+        self.fallback = fallback
+
+class LLMTierRouter:
+    """Routes each call to its profile's model tier, walking the tier's fallback chain
+    when a tier has no healthy (or no configured) backend"""
+
+    def __init__(self, tiers):
+        self.tiers = {tier.name: tier for tier in tiers}
+
+    def chain(self, name):
+        """The tier and its fallbacks, in order, skipping tiers without backends"""
+        chain = []
+        while name in self.tiers and self.tiers[name] not in chain:
+            chain.append(self.tiers[name])
+            name = self.tiers[name].fallback
+        return [tier for tier in chain if tier.pool.backends]
+
+    def model_for(self, name):
+        """Model name of the tier a call to `name` normally lands on"""
+        chain = self.chain(name)
+        if not chain:
+            raise NoHealthyBackendError(f"No LLM backend configured for tier {name}")
+        return chain[0].model
+
+    def acquire(self, name, sticky_key=None, avoid=()):
+        """Pick (tier, backend) from the first tier in the chain with a healthy backend;
+        tiers in `avoid` (failed earlier in the same call) are tried last. Pair with release()."""
+        chain = self.chain(name)
+        chain = [t for t in chain if t.name not in avoid] + [t for t in chain if t.name in avoid]
+        for tier in chain:
+            try:
+                return tier, tier.pool.acquire(sticky_key)
+            except NoHealthyBackendError:
+                continue
+        raise NoHealthyBackendError(f"No healthy LLM backend available for tier {name}")
+
+    def release(self, tier, backend, ok=True):
+        tier.pool.release(backend, ok)
+
+    def start_health_checks(self, session_factory):
+        for tier in self.tiers.values():
+            if tier.pool.backends:
+                tier.pool.start_health_checks(session_factory)
+
+    def get_stats(self):
+        return {
+            tier.name: {"model": tier.model, "fallback": tier.fallback, "backends": tier.pool.get_stats()}
+            for tier in self.tiers.values()
+        }
@@ -0,0 +1,102 @@
+# llm_cache.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS, LLM_CACHE_PERSIST
+
+# Request fields that fully determine a completion at our low temperatures
+CACHE_KEY_FIELDS = ("messages", "model", "temperature", "max_tokens", "stop", "response_format")
+
+def make_cache_key(payload):
+    """Content-addressed key for a chat completion payload"""
+    key_data = {field: payload.get(field) for field in CACHE_KEY_FIELDS}
+    raw = json.dumps(key_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class LLMResponseCache:
+    """Two-tier cache: a bounded in-process LRU in front of a Mongo collection with a TTL index"""
+
+    def __init__(self, max_entries=LLM_CACHE_MAX_ENTRIES, ttl_seconds=LLM_CACHE_TTL_SECONDS, persist=LLM_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._indexes_ready = False
+        self._stats = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "stores": 0, "bypassed": 0}
+
+    def _bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _mongo(self):
+        # Imported lazily so scripts can use the LLM client without a database
+        from db_operations import DatabaseOperations
+        if not self._indexes_ready:
+            DatabaseOperations.ensure_llm_cache_indexes(self.ttl_seconds)
+            self._indexes_ready = True
+        return DatabaseOperations
+
+    def _remember(self, key, content):
+        with self._lock:
+            self._entries[key] = (content, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Return the cached content for `key`, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                content, stored_at = entry
+                if time.time() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return content
+                del self._entries[key]
+
+        if self.persist:
+            try:
+                doc = self._mongo().get_cached_llm_response(key)
+            except Exception as e:
+                print(f"LLM cache lookup failed: {e}")
+                doc = None
+            if doc and doc.get("content") is not None:
+                self._remember(key, doc["content"])
+                self._bump("mongo_hits")
+                return doc["content"]
+
+        self._bump("misses")
+        return None
+
+    def set(self, key, content, metadata=None):
+        """Store a response in both tiers"""
+        self._remember(key, content)
+        self._bump("stores")
+        if self.persist:
+            try:
+                self._mongo().save_cached_llm_response(key, content, metadata)
+            except Exception as e:
+                print(f"LLM cache store failed: {e}")
+
+    def record_bypass(self):
+        """Count a lookup skipped because the caller asked to regenerate"""
+        self._bump("bypassed")
+
+    def clear(self):
+        """Drop the in-process tier (the Mongo tier expires on its own)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._entries)
+        lookups = stats["memory_hits"] + stats["mongo_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["mongo_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+llm_cache = LLMResponseCache()
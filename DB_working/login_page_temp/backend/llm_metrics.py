@@ -0,0 +1,179 @@
+# llm_metrics.py
+# Per-call LLM instrumentation: every call is recorded with its route, generation
+# profile, queue wait, token usage, llama.cpp timings and outcome, aggregated into
+# per-route histograms and rendered in the Prometheus text exposition format.
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import has_request_context, request
+
+DURATION_BUCKETS = (0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+QUEUE_WAIT_BUCKETS = (0.01, 0.1, 0.5, 1, 2.5, 5, 15, 30, 60, 120)
+TOKEN_BUCKETS = (32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+THROUGHPUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+# Route name for LLM calls made outside a request (e.g. "job:quiz")
+_current_route = ContextVar("llm_route", default=None)
+
+@contextmanager
+def llm_route(name):
+    """Attribute LLM calls made inside the block to `name`"""
+    token = _current_route.set(name)
+    try:
+        yield
+    finally:
+        _current_route.reset(token)
+
+def resolve_route(route=None):
+    """Explicit name, else the enclosing llm_route(), else the Flask endpoint"""
+    if route:
+        return route
+    route = _current_route.get()
+    if route:
+        return route
+    if has_request_context() and request.endpoint:
+        return request.endpoint
+    return "unknown"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        series = self._series.setdefault(labels, [0] * len(self.buckets) + [0.0, 0])
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {round(series[-2], 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {series[-1]}")
+        return lines
+
+class LLMMetrics:
+    """Thread-safe registry of LLM call metrics"""
+
+    def __init__(self, recent_calls=100):
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=recent_calls)
+        self.calls = Counter("llm_calls_total", "LLM calls by route, profile and outcome.",
+                             ("route", "profile", "outcome"))
+        self.tokens = Counter("llm_tokens_total", "Tokens by route and kind (prompt, prompt_evaluated, completion).",
+                              ("route", "kind"))
+        self.duration = Histogram("llm_call_duration_seconds", "End-to-end LLM call latency including queue wait.",
+                                  ("route", "profile"), DURATION_BUCKETS)
+        self.queue_wait = Histogram("llm_queue_wait_seconds", "Time spent waiting for a scheduler slot.",
+                                    ("route",), QUEUE_WAIT_BUCKETS)
+        self.prompt_tokens = Histogram("llm_prompt_tokens", "Prompt length in tokens per call.",
+                                       ("route",), TOKEN_BUCKETS)
+        self.completion_tokens = Histogram("llm_completion_tokens", "Completion length in tokens per call.",
+                                           ("route",), TOKEN_BUCKETS)
+        self.prompt_throughput = Histogram("llm_prompt_tokens_per_second", "llama.cpp prompt-eval throughput.",
+                                           ("route",), THROUGHPUT_BUCKETS)
+        self.generation_throughput = Histogram("llm_generation_tokens_per_second", "llama.cpp generation throughput.",
+                                               ("route",), THROUGHPUT_BUCKETS)
+        self.tier_calls = Counter("llm_tier_calls_total",
+                                  "LLM calls by serving model tier, the tier the profile asked for, and outcome.",
+                                  ("tier", "requested_tier", "outcome"))
+        self.tier_latency = Histogram("llm_tier_latency_seconds", "LLM call latency per serving model tier, excluding queue wait.",
+                                      ("tier",), DURATION_BUCKETS)
+
+    def record_call(self, route, profile, outcome, duration, queue_wait=None, usage=None, timings=None,
+                    tier=None, requested_tier=None):
+        """Record one finished LLM call"""
+        usage = usage or {}
+        timings = timings or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens", timings.get("predicted_n"))
+        prompt_evaluated = timings.get("prompt_n")
+        with self._lock:
+            self.calls.inc((route, profile, outcome))
+            self.duration.observe((route, profile), duration)
+            if queue_wait is not None:
+                self.queue_wait.observe((route,), queue_wait)
+            if prompt_tokens is not None:
+                self.prompt_tokens.observe((route,), prompt_tokens)
+                self.tokens.inc((route, "prompt"), prompt_tokens)
+            if prompt_evaluated is not None:
+                # Lower than "prompt" when llama.cpp reused a cached prefix
+                self.tokens.inc((route, "prompt_evaluated"), prompt_evaluated)
+            if completion_tokens is not None:
+                self.completion_tokens.observe((route,), completion_tokens)
+                self.tokens.inc((route, "completion"), completion_tokens)
+            if timings.get("prompt_per_second"):
+                self.prompt_throughput.observe((route,), timings["prompt_per_second"])
+            if timings.get("predicted_per_second"):
+                self.generation_throughput.observe((route,), timings["predicted_per_second"])
+            if tier is not None:
+                # requested_tier != tier means the call fell back to another model
+                self.tier_calls.inc((tier, requested_tier or tier, outcome))
+                self.tier_latency.observe((tier,), max(0.0, duration - (queue_wait or 0.0)))
+            self._recent.append({
+                "time": round(time.time(), 3),
+                "route": route,
+                "profile": profile,
+                "outcome": outcome,
+                "tier": tier,
+                "duration": round(duration, 3),
+                "queue_wait": round(queue_wait, 3) if queue_wait is not None else None,
+                "prompt_tokens": prompt_tokens,
+                "prompt_evaluated": prompt_evaluated,
+                "completion_tokens": completion_tokens,
+                "prompt_per_second": timings.get("prompt_per_second"),
+                "generation_per_second": timings.get("predicted_per_second")
+            })
+
+    def render_prometheus(self):
+        with self._lock:
+            lines = []
+            for metric in (self.calls, self.tokens, self.duration, self.queue_wait, self.prompt_tokens,
+                           self.completion_tokens, self.prompt_throughput, self.generation_throughput,
+                           self.tier_calls, self.tier_latency):
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def recent_calls(self):
+        with self._lock:
+            return list(self._recent)
+
+llm_metrics = LLMMetrics()
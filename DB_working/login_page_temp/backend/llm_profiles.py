@@ -0,0 +1,86 @@
+# llm_profiles.py
+from config import LLAMA_CPP_SLOT_PINS, LLM_TIER_ROUTES
+from llm_scheduler import PRIORITY_INTERACTIVE, PRIORITY_NORMAL, PRIORITY_BACKGROUND
+
+# Passed to the chat template (llama-server --jinja) instead of appending "/no-think" to prompts
+THINKING_DISABLED = {"enable_thinking": False}
+
+# A new "### SECTION" header means a JSON-only answer has run past its end
+JSON_STOPS = ["\n### "]
+
+# Named generation profiles. Each route picks one so short tasks get short budgets
+# and a runaway generation cannot hold a slot for minutes.
+GENERATION_PROFILES = {
+    "default": {
+        "max_tokens": 12000, "temperature": 0.1, "stop": [], "priority": PRIORITY_NORMAL
+    },
+    "roadmap": {
+        "max_tokens": 2048, "temperature": 0.1, "stop": [], "priority": PRIORITY_NORMAL
+    },
+    "details": {
+        "max_tokens": 1536, "temperature": 0.1, "stop": JSON_STOPS, "priority": PRIORITY_NORMAL
+    },
+    "sub_details": {
+        "max_tokens": 4096, "temperature": 0.1, "stop": ["</body>", "</html>"], "priority": PRIORITY_NORMAL
+    },
+    "quiz": {
+        "max_tokens": 6144, "temperature": 0.1, "stop": JSON_STOPS, "priority": PRIORITY_NORMAL
+    },
+    "quiz_explain": {
+        "max_tokens": 512, "temperature": 0.2, "stop": [], "priority": PRIORITY_INTERACTIVE
+    },
+    "quiz_explain_batch": {
+        "max_tokens": 1536, "temperature": 0.2, "stop": [], "priority": PRIORITY_INTERACTIVE
+    },
+    "grading": {
+        "max_tokens": 2048, "temperature": 0.0, "stop": JSON_STOPS, "priority": PRIORITY_NORMAL
+    },
+    "flashcards": {
+        "max_tokens": 2048, "temperature": 0.1, "stop": JSON_STOPS, "priority": PRIORITY_BACKGROUND
+    },
+    "chat": {
+        "max_tokens": 1024, "temperature": 0.6, "stop": ["\nUser:"], "priority": PRIORITY_INTERACTIVE
+    },
+    "explain": {
+        "max_tokens": 2048, "temperature": 0.3, "stop": ["\nUser:"], "priority": PRIORITY_INTERACTIVE
+    },
+    "summary": {
+        "max_tokens": 8192, "temperature": 0.1, "stop": [], "priority": PRIORITY_BACKGROUND
+    },
+    # One part of a document too large for a single summary request
+    "summary_chunk": {
+        "max_tokens": 1536, "temperature": 0.1, "stop": [], "priority": PRIORITY_BACKGROUND
+    },
+}
+
+# Model tier per profile. Short structured answers (definitions, flashcards, quiz
+# explanations) go to the small fast model; summaries, sub-details and anything
+# open-ended keep the large one. LLM_TIER_ROUTES overrides entries per deployment.
+TIER_ROUTES = {
+    "default": "large",
+    "roadmap": "large",
+    "details": "small",
+    "sub_details": "large",
+    "quiz": "large",
+    "quiz_explain": "small",
+    "quiz_explain_batch": "small",
+    "grading": "large",
+    "flashcards": "small",
+    "chat": "large",
+    "explain": "large",
+    "summary": "large",
+    "summary_chunk": "large",
+}
+
+def get_generation_profile(name):
+    """Look up a generation profile by name; every profile disables thinking.
+    `slot` is the llama.cpp slot the profile is pinned to (None = any free slot);
+    `tier` is the model tier that serves it."""
+    if name not in GENERATION_PROFILES:
+        raise ValueError(f"Unknown generation profile: {name}")
+    profile = dict(GENERATION_PROFILES[name])
+    profile["name"] = name
+    profile["chat_template_kwargs"] = dict(THINKING_DISABLED)
+    profile["slot"] = LLAMA_CPP_SLOT_PINS.get(name)
+    profile["tier"] = LLM_TIER_ROUTES.get(name, TIER_ROUTES.get(name, "large"))
+    return profile
@@ -0,0 +1,213 @@
+# llm_scheduler.py
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from config import LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE_DEPTH, LLM_QUEUE_TIMEOUT, LLM_SPECULATIVE_RESERVED_SLOTS
+
+# Priority classes (lower runs first)
+PRIORITY_INTERACTIVE = 0   # chat, quiz explanations
+PRIORITY_NORMAL = 1        # roadmap, details, quiz generation, grading
+PRIORITY_BACKGROUND = 2    # flashcards, PDF summarization
+PRIORITY_SPECULATIVE = 3   # pre-generation nobody asked for yet; never queued, idle slots only
+
+class LLMBusyError(Exception):
+    """Raised when the LLM queue is full; carries a Retry-After hint in seconds"""
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _Waiter:
+    """A queued caller: a blocked thread waits on `event`, a coroutine on `future`"""
+    def __init__(self, loop=None):
+        self.event = threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.granted = False
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+class LLMScheduler:
+    """Bounded admission control in front of llama.cpp: at most `max_concurrency`
+    calls run at once, the rest wait in a priority queue of at most `max_queue_depth`."""
+
+    def __init__(self, max_concurrency=LLM_MAX_CONCURRENCY, max_queue_depth=LLM_MAX_QUEUE_DEPTH, queue_timeout=LLM_QUEUE_TIMEOUT,
+                 speculative_reserved_slots=LLM_SPECULATIVE_RESERVED_SLOTS):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.queue_timeout = queue_timeout
+        # Slots speculative work leaves free for real requests (at least one slot stays usable)
+        self.speculative_reserved_slots = min(speculative_reserved_slots, max(0, max_concurrency - 1))
+        self._lock = threading.Lock()
+        # Set in a fan-out task's thread while it holds the slot taken by submit()
+        self._held = threading.local()
+        self._queue = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._avg_service_time = 10.0
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "timed_out": 0, "speculative_rejected": 0}
+
+    def _retry_after(self):
+        # Rough time until a queued request would start: queue ahead of it drained by all slots
+        backlog = (len(self._queue) + 1) / max(1, self.max_concurrency)
+        return max(1, int(math.ceil(backlog * self._avg_service_time)))
+
+    def _is_idle(self):
+        return not self._queue and self._active + self.speculative_reserved_slots < self.max_concurrency
+
+    def has_idle_capacity(self):
+        """True when speculative work would be admitted right now"""
+        with self._lock:
+            return self._is_idle()
+
+    def _admit_or_enqueue(self, priority, loop=None):
+        """Take a free slot (returns None) or join the queue (returns the queue entry)"""
+        with self._lock:
+            if priority >= PRIORITY_SPECULATIVE and not self._is_idle():
+                # Speculative work never waits in line ahead of (or behind) real requests
+                self._stats["speculative_rejected"] += 1
+                raise LLMBusyError("No idle AI capacity for speculative work.", self._retry_after())
+            if self._active < self.max_concurrency and not self._queue:
+                self._active += 1
+                self._stats["admitted"] += 1
+                return None
+            if len(self._queue) >= self.max_queue_depth:
+                self._stats["rejected"] += 1
+                raise LLMBusyError("AI server is busy. Please try again shortly.", self._retry_after())
+            entry = (priority, next(self._seq), _Waiter(loop))
+            heapq.heappush(self._queue, entry)
+            self._stats["queued"] += 1
+            return entry
+
+    def _leave_queue(self, entry, timed_out=True):
+        """Drop a waiter that gave up; returns False if it was granted a slot meanwhile"""
+        with self._lock:
+            if entry[2].granted:
+                return False
+            self._queue.remove(entry)
+            heapq.heapify(self._queue)
+            if timed_out:
+                self._stats["timed_out"] += 1
+            return True
+
+    def acquire(self, priority=PRIORITY_NORMAL):
+        """Block until a slot is free; returns the seconds spent waiting in the queue"""
+        entry = self._admit_or_enqueue(priority)
+        if entry is None:
+            return 0.0
+        started = time.time()
+        entry[2].event.wait(self.queue_timeout)
+        if self._leave_queue(entry):
+            raise LLMBusyError("AI server is busy. Please try again shortly.", self._retry_after())
+        with self._lock:
+            self._stats["admitted"] += 1
+        return time.time() - started
+
+    async def acquire_async(self, priority=PRIORITY_NORMAL):
+        """Coroutine version of acquire(): waiting costs a pending future, not a thread"""
+        entry = self._admit_or_enqueue(priority, asyncio.get_running_loop())
+        if entry is None:
+            return 0.0
+        started = time.time()
+        try:
+            await asyncio.wait_for(asyncio.shield(entry[2].future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if self._leave_queue(entry):
+                raise LLMBusyError("AI server is busy. Please try again shortly.", self._retry_after())
+        except asyncio.CancelledError:
+            # The caller went away; hand back a slot that was granted in the meantime
+            if not self._leave_queue(entry, timed_out=False):
+                self.release()
+            raise
+        with self._lock:
+            self._stats["admitted"] += 1
+        return time.time() - started
+
+    def release(self, service_time=None):
+        """Free a slot, handing it straight to the highest-priority waiter if there is one"""
+        with self._lock:
+            if service_time is not None:
+                self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            if self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                waiter.grant()
+                return
+            self._active -= 1
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_NORMAL):
+        """Hold one LLM slot for the duration of the block; yields the queue wait in seconds"""
+        if getattr(self._held, "slot", False):
+            # Inside a submit()ted task, which already holds a slot for its calls
+            yield 0.0
+            return
+        waited = self.acquire(priority)
+        started = time.time()
+        try:
+            yield waited
+        finally:
+            self.release(time.time() - started)
+
+    @asynccontextmanager
+    async def slot_async(self, priority=PRIORITY_NORMAL):
+        """Async counterpart of slot()"""
+        waited = await self.acquire_async(priority)
+        started = time.time()
+        try:
+            yield waited
+        finally:
+            self.release(time.time() - started)
+
+    def submit(self, executor, priority, fn, /, *args, **kwargs):
+        """Run fn on a thread pool holding one slot, taken here in the caller's thread with
+        the caller's priority. Fan-out work therefore waits in (and is bounded by) this
+        queue rather than in the executor's FIFO; LLM calls made by fn use that slot.
+        Returns a Future; a full queue or queue timeout is its LLMBusyError."""
+        try:
+            self.acquire(priority)
+        except LLMBusyError as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+
+        def run():
+            self._held.slot = True
+            started = time.time()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._held.slot = False
+                self.release(time.time() - started)
+
+        try:
+            return executor.submit(run)
+        except Exception:
+            self.release()
+            raise
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "active": self._active,
+                "queue_depth": len(self._queue),
+                "max_concurrency": self.max_concurrency,
+                "max_queue_depth": self.max_queue_depth,
+                "speculative_reserved_slots": self.speculative_reserved_slots,
+                "avg_service_time": round(self._avg_service_time, 2)
+            })
+        return stats
+
+llm_scheduler = LLMScheduler()
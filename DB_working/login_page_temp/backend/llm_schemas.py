@@ -0,0 +1,140 @@
+# llm_schemas.py
+# JSON schemas sent to llama.cpp as response_format, so structured answers are
+# grammar-constrained and always parse with the expected shape and item counts.
+
+def _string():
+    return {"type": "string"}
+
+ROADMAP_SCHEMA = {
+    "type": "object",
+    "properties": {
+        # First, so the corrected name is known before the topics are generated
+        "corrected_topic": _string(),
+        "topics": {
+            "type": "array",
+            "minItems": 3,
+            "maxItems": 20,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "title": _string(),
+                    "description": _string()
+                },
+                "required": ["id", "title", "description"]
+            }
+        }
+    },
+    "required": ["corrected_topic", "topics"]
+}
+
+DETAILS_SCHEMA = {
+    "type": "array",
+    "minItems": 1,
+    "maxItems": 12,
+    "items": {
+        "type": "object",
+        "properties": {
+            "section_title": _string(),
+            "section_items": {
+                "type": "array",
+                "minItems": 1,
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "term": _string(),
+                        "definition": _string()
+                    },
+                    "required": ["term", "definition"]
+                }
+            }
+        },
+        "required": ["section_title", "section_items"]
+    }
+}
+
+MCQ_QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"const": "mcq"},
+        "question": _string(),
+        "options": {"type": "array", "items": _string(), "minItems": 4, "maxItems": 4},
+        "answer": _string()
+    },
+    "required": ["type", "question", "options", "answer"]
+}
+
+DESCRIPTIVE_QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"const": "descriptive"},
+        "question": _string(),
+        "ideal_answer": _string()
+    },
+    "required": ["type", "question", "ideal_answer"]
+}
+
+def quiz_schema(num_questions, num_mcq, num_descriptive):
+    """{"questions": [...]} with exactly num_questions items of the requested kinds"""
+    if num_mcq and not num_descriptive:
+        item = MCQ_QUESTION_SCHEMA
+    elif num_descriptive and not num_mcq:
+        item = DESCRIPTIVE_QUESTION_SCHEMA
+    else:
+        item = {"anyOf": [MCQ_QUESTION_SCHEMA, DESCRIPTIVE_QUESTION_SCHEMA]}
+    return {
+        "type": "object",
+        "properties": {
+            "questions": {
+                "type": "array",
+                "items": item,
+                "minItems": num_questions,
+                "maxItems": num_questions
+            }
+        },
+        "required": ["questions"]
+    }
+
+def grading_schema(num_answers):
+    """One {"score", "feedback"} object per graded answer, in order"""
+    return {
+        "type": "array",
+        "minItems": num_answers,
+        "maxItems": num_answers,
+        "items": {
+            "type": "object",
+            "properties": {
+                "score": {"type": "integer", "enum": [0, 1]},
+                "feedback": _string()
+            },
+            "required": ["score", "feedback"]
+        }
+    }
+
+def flashcards_schema(min_cards, max_cards):
+    return {
+        "type": "array",
+        "minItems": min_cards,
+        "maxItems": max_cards,
+        "items": {
+            "type": "object",
+            "properties": {
+                "question": _string(),
+                "answer": _string()
+            },
+            "required": ["question", "answer"]
+        }
+    }
+
+def explanations_schema(num_items):
+    """One {"explanation"} object per packed quiz question, in order"""
+    return {
+        "type": "array",
+        "minItems": num_items,
+        "maxItems": num_items,
+        "items": {
+            "type": "object",
+            "properties": {"explanation": _string()},
+            "required": ["explanation"]
+        }
+    }
@@ -0,0 +1,315 @@
+# llm_semantic_cache.py
+# Near-duplicate cache for topic/term prompts. The exact-match LLM cache misses on
+# "clud computing" vs "Cloud Computing basics"; here the normalised text is embedded
+# through llama.cpp's /embedding endpoint and looked up in an in-process NumPy index
+# (one per namespace, e.g. "roadmap"). Entries are persisted in Mongo together with
+# their vectors, so the index is rebuilt at startup without re-embedding anything.
+# Embeddings of one-word-different prompts ("explain microeconomics" / "explain
+# macroeconomics") are nearly equal, so a hit also needs the same content words up to a typo.
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import requests
+from config import (
+    SEMANTIC_CACHE_ENABLED, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_MAX_ENTRIES,
+    LLAMA_CPP_EMBEDDING_URL, LLAMA_CPP_CONNECT_TIMEOUT
+)
+
+EMBEDDING_TIMEOUT = 30
+# After a failed /embedding call the cache stays out of the way for this long
+EMBEDDING_RETRY_AFTER = 60
+EMBEDDING_MEMO_SIZE = 1024
+# Rows preallocated for a new index; the matrix doubles when it is full
+INDEX_INITIAL_CAPACITY = 64
+# Share of the entries dropped at once when an index overflows, so eviction is not per insert
+INDEX_EVICT_FRACTION = 0.1
+
+# Only word separators and quoting are dropped. Symbols such as + # . / & are part of
+# names ("C", "C#" and "C++", ".NET" and "NET" are different topics), so they stay.
+SEPARATORS = re.compile(r"""[\s\-_'"`\u2018\u2019\u201c\u201d()\[\]{},;:!?]+""")
+ROMAN_NUMERAL = re.compile(r"^(?:i{1,3}|iv|vi{0,3}|ix|xi{0,3})$")
+
+def normalize_text(text):
+    """Case, separators, quotes and a trailing full stop do not change what a topic means"""
+    text = SEPARATORS.sub(" ", (text or "").casefold())
+    return " ".join(text.split()).rstrip(".").strip()
+
+def distinguishing_marks(text):
+    """Numbers, roman numerals and words with symbols ("Calculus 2", "Algebra II", "C#").
+    Texts whose marks differ name different things, however close their embeddings are."""
+    marks = set()
+    for token in normalize_text(text).split():
+        marks.update(re.findall(r"\d+", token))
+        if ROMAN_NUMERAL.match(token) or re.search(r"[^\w\s]", token):
+            marks.add(token)
+    return marks
+
+# Words that do not change what a prompt is about ("explain the basics of ...")
+FILLER_WORDS = frozenset({
+    "a", "an", "the", "of", "in", "on", "for", "to", "and", "with", "about",
+    "explain", "what", "is", "are", "basics", "basic", "introduction", "intro", "overview", "fundamentals"
+})
+
+def content_words(text):
+    """Normalised text without filler words"""
+    words = [word for word in normalize_text(text).split() if word not in FILLER_WORDS]
+    return " ".join(words) or normalize_text(text)
+
+def same_subject(a, b):
+    """True when two texts name the same subject: their content words are the same up to the
+    typos topic matching tolerates, and their distinguishing marks are equal"""
+    # Imported here to avoid a cycle: topic_index imports this module
+    from topic_index import same_topic
+    return same_topic(content_words(a), content_words(b))
+
+class EmbeddingClient:
+    """Embeds short texts with llama.cpp, memoising recent results"""
+
+    def __init__(self, url=LLAMA_CPP_EMBEDDING_URL):
+        self.url = url
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._unavailable_until = 0.0
+
+    def embed(self, text):
+        """Unit-length float32 vector for `text`, or None if the endpoint is unavailable"""
+        with self._lock:
+            vector = self._memo.get(text)
+            if vector is not None:
+                self._memo.move_to_end(text)
+                return vector
+            if time.time() < self._unavailable_until:
+                return None
+        # Imported here to avoid a cycle: utils imports the scheduler, profiles, etc.
+        from utils import get_llm_session, llm_breaker, LLMConnectionError
+        try:
+            # The embedding server is normally the LLM server: while its circuit is open, skip the cache
+            llm_breaker.before_call()
+        except LLMConnectionError:
+            return None
+        try:
+            response = get_llm_session().post(
+                self.url, json={"content": text}, timeout=(LLAMA_CPP_CONNECT_TIMEOUT, EMBEDDING_TIMEOUT)
+            )
+            response.raise_for_status()
+            vector = self._parse(response.json())
+        except (requests.exceptions.RequestException, ValueError, KeyError, IndexError) as e:
+            unreachable = isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+            llm_breaker.record(LLMConnectionError(str(e)) if unreachable else None)
+            print(f"Embedding request failed, semantic cache paused: {e}")
+            with self._lock:
+                self._unavailable_until = time.time() + EMBEDDING_RETRY_AFTER
+            return None
+        llm_breaker.record()
+        with self._lock:
+            self._memo[text] = vector
+            while len(self._memo) > EMBEDDING_MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return vector
+
+    @staticmethod
+    def _parse(body):
+        # Older servers answer {"embedding": [...]}, newer ones [{"index": 0, "embedding": [[...]]}]
+        if isinstance(body, list):
+            body = body[0]
+        vector = np.asarray(body["embedding"], dtype=np.float32)
+        if vector.ndim == 2:
+            # Per-token vectors (--pooling none): mean-pool them
+            vector = vector.mean(axis=0)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            raise ValueError("Empty embedding")
+        return vector / norm
+
+class _Index:
+    """Vectors of one namespace in a preallocated matrix, so a lookup is one matrix-vector
+    product and an insert is amortised O(1). Rows are kept oldest first."""
+
+    def __init__(self):
+        self.texts = []
+        self.contents = []
+        self.rows = {}
+        self.matrix = None
+
+    @classmethod
+    def from_entries(cls, entries, max_entries):
+        """Index of (text, vector, content) entries given oldest first, built with one np.stack"""
+        latest = {}
+        for text, vector, content in entries:
+            # A later entry for the same text replaces the earlier one and counts as newer
+            latest.pop(text, None)
+            latest[text] = (vector, content)
+        items = list(latest.items())[-max_entries:]
+        index = cls()
+        if items:
+            dim = items[-1][1][0].shape[0]
+            items = [(text, value) for text, value in items if value[0].shape[0] == dim]
+            index.texts = [text for text, _ in items]
+            index.contents = [content for _, (_, content) in items]
+            index.rows = {text: row for row, text in enumerate(index.texts)}
+            index.matrix = np.stack([vector for _, (vector, _) in items]).astype(np.float32, copy=False)
+        return index
+
+    def __len__(self):
+        return len(self.texts)
+
+    def add(self, text, vector, content, max_entries):
+        if self.matrix is not None and self.matrix.shape[1] != vector.shape[0]:
+            # The embedding model changed; vectors of different models are not comparable
+            self.__init__()
+        row = self.rows.get(text)
+        if row is not None:
+            self.contents[row] = content
+            self.matrix[row] = vector
+            return
+        size = len(self.texts)
+        if self.matrix is None:
+            self.matrix = np.empty((INDEX_INITIAL_CAPACITY, vector.shape[0]), dtype=np.float32)
+        elif size == self.matrix.shape[0]:
+            grown = np.empty((size * 2, self.matrix.shape[1]), dtype=np.float32)
+            grown[:size] = self.matrix
+            self.matrix = grown
+        self.matrix[size] = vector
+        self.rows[text] = size
+        self.texts.append(text)
+        self.contents.append(content)
+        if len(self.texts) > max_entries:
+            self._evict(len(self.texts) - max_entries + int(max_entries * INDEX_EVICT_FRACTION))
+
+    def _evict(self, count):
+        """Drop the `count` oldest entries"""
+        size = len(self.texts)
+        self.matrix[:size - count] = self.matrix[count:size]
+        self.texts = self.texts[count:]
+        self.contents = self.contents[count:]
+        self.rows = {text: row for row, text in enumerate(self.texts)}
+
+    def entries(self):
+        return [(text, self.matrix[row], self.contents[row]) for row, text in enumerate(self.texts)]
+
+    def nearest(self, vector):
+        if not self.texts or self.matrix.shape[1] != vector.shape[0]:
+            return None, 0.0
+        scores = self.matrix[:len(self.texts)] @ vector
+        row = int(np.argmax(scores))
+        return row, float(scores[row])
+
+class SemanticCache:
+    """Namespace -> vector index of normalised prompt texts and the answers generated for them"""
+
+    def __init__(self, enabled=SEMANTIC_CACHE_ENABLED, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 max_entries=SEMANTIC_CACHE_MAX_ENTRIES, embeddings=None):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embeddings = embeddings or EmbeddingClient()
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "unavailable": 0, "loaded_entries": 0}
+
+    def _bump(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _mongo(self):
+        # Imported lazily so scripts can use the cache without a database
+        from db_operations import DatabaseOperations
+        return DatabaseOperations
+
+    def load(self, blocking=True):
+        """Rebuild the indexes from Mongo once; stored vectors are reused as-is.
+        The indexes are built outside the cache lock and swapped in, so lookups are not
+        held up meanwhile; with blocking=False a load already running is not waited for."""
+        if self._loaded or not self._load_lock.acquire(blocking=blocking):
+            return
+        try:
+            if self._loaded:
+                return
+            try:
+                self._mongo().ensure_semantic_cache_indexes()
+                docs = self._mongo().get_semantic_cache_entries(self.max_entries)
+            except Exception as e:
+                print(f"Semantic cache load failed: {e}")
+                self._loaded = True
+                return
+            entries = {}
+            for doc in docs:
+                vector = np.asarray(doc["embedding"], dtype=np.float32)
+                entries.setdefault(doc["namespace"], []).append((doc["text"], vector, doc["content"]))
+            indexes = {
+                namespace: _Index.from_entries(namespace_entries, self.max_entries)
+                for namespace, namespace_entries in entries.items()
+            }
+            with self._lock:
+                # Answers stored while loading are newer than anything read from Mongo
+                for namespace, index in self._indexes.items():
+                    loaded = indexes.setdefault(namespace, _Index())
+                    for text, vector, content in index.entries():
+                        loaded.add(text, vector, content, self.max_entries)
+                self._indexes = indexes
+                self._stats["loaded_entries"] = len(docs)
+            self._loaded = True
+        finally:
+            self._load_lock.release()
+
+    def _embed(self, text):
+        vector = self.embeddings.embed(text)
+        if vector is None:
+            self._bump("unavailable")
+        return vector
+
+    def get(self, namespace, text):
+        """Stored answer for the closest earlier text above the threshold, or None"""
+        if not self.enabled:
+            return None
+        self.load(blocking=False)
+        text = normalize_text(text)
+        if not text:
+            return None
+        vector = self._embed(text)
+        if vector is None:
+            return None
+        with self._lock:
+            index = self._indexes.get(namespace)
+            row, score = index.nearest(vector) if index else (None, 0.0)
+            # "Calculus 2" must not be served the answer for "Calculus 1", "C#" the one for "C",
+            # nor "macroeconomics" the one for "microeconomics"
+            if row is not None and score >= self.threshold and same_subject(index.texts[row], text):
+                self._stats["hits"] += 1
+                print(f"Semantic cache hit ({namespace}): '{text}' ~ '{index.texts[row]}' ({score:.3f})")
+                return index.contents[row]
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, namespace, text, content):
+        """Remember the answer generated for `text`"""
+        if not self.enabled:
+            return
+        self.load(blocking=False)
+        text = normalize_text(text)
+        if not text:
+            return
+        vector = self._embed(text)
+        if vector is None:
+            return
+        with self._lock:
+            self._indexes.setdefault(namespace, _Index()).add(text, vector, content, self.max_entries)
+            self._stats["stores"] += 1
+        try:
+            self._mongo().save_semantic_cache_entry(namespace, text, vector.tolist(), content)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = {namespace: len(index) for namespace, index in self._indexes.items()}
+        stats["enabled"] = self.enabled
+        stats["threshold"] = self.threshold
+        return stats
+
+semantic_cache = SemanticCache()
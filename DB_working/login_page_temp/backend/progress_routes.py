@@ -103,9 +103,9 @@ def get_topic_progress():
     user_email = request.user['email']
     try:
         # For each roadmap (project topic), compute progress from per-main-topic quizzes + final quizzes
-        user_roadmaps = list(roadmaps_collection.find(
-            {"user_email": user_email}, {"_id": 0, "topic": 1, "roadmap_data.topics": 1}
-        ))
+        user_roadmaps = DatabaseOperations.hydrate_roadmaps(list(roadmaps_collection.find(
+            {"user_email": user_email}, {"_id": 0, "topic": 1, "roadmap_data": 1}
+        )))
 
         # Fetch all quiz status docs for user once
         status_docs = list(quiz_status_collection.find({"user_email": user_email}, {"_id": 0}))
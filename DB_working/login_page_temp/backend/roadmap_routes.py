@@ -1,37 +1,78 @@
 # roadmap_routes.py
 from flask import Blueprint, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError, as_completed
+import asyncio
 import json
 import re
-from utils import get_local_llm_response, LLMConnectionError # <-- Import from our new utils file
+import time
+from utils import (
+    get_local_llm_response, stream_local_llm_response, LLMConnectionError, LLMBusyError, retry_delay,
+    parse_json_response, wants_event_stream, sse_event, sse_response, JSONArrayStreamParser
+)
+from llm_async import async_get_local_llm_response
+from llm_schemas import (
+    ROADMAP_SCHEMA, DETAILS_SCHEMA, quiz_schema, grading_schema, flashcards_schema, explanations_schema
+)
+from llm_metrics import resolve_route
+from llm_profiles import get_generation_profile
+from llm_semantic_cache import semantic_cache
+from topic_index import topic_index
+from config import (
+    LLM_MAX_CONCURRENCY, EXPLAIN_BATCH_PACK_MAX, EXPLAIN_BATCH_MAX_ITEMS, GRADING_CHUNK_SIZE, GRADING_CHUNK_RETRIES,
+    SPECULATIVE_DETAILS, SPECULATIVE_DETAILS_TOPICS, SPECULATIVE_DETAILS_MAX_ATTEMPTS, QUIZ_CHUNK_SIZE,
+    LLM_QUEUE_TIMEOUT, LLAMA_CPP_READ_TIMEOUT
+)
 from db_operations import (
-    DatabaseOperations, roadmaps_collection, notes_collection, quizzes_collection,
+    DatabaseOperations, library_key, roadmaps_collection, notes_collection, quizzes_collection,
     quiz_attempts_collection, quiz_status_collection, progress_collection
 )
 from auth_routes import token_required
+from jobs import register_job_handler, enqueue_job, job_accepted_response, wants_background
+from llm_scheduler import llm_scheduler, PRIORITY_NORMAL, PRIORITY_SPECULATIVE
 
 roadmap_bp = Blueprint('roadmap_bp', __name__)
 
+# Shared by requests that fan out into several LLM calls (batch explanations, chunked
+# grading, quiz chunks). Tasks enter it through submit_llm_task only, so each one holds a
+# scheduler slot before it is queued and the pool never holds more than the free slots.
+llm_fanout_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-fanout")
+# How long a caller waits for its fan-out results; the tasks are already past the queue
+FANOUT_RESULT_TIMEOUT = LLM_QUEUE_TIMEOUT + LLAMA_CPP_READ_TIMEOUT
+
+def submit_llm_task(profile_name, fn, /, *args, **kwargs):
+    """Run fn on the fan-out pool behind the LLM scheduler, with the profile's priority.
+    Positional-only, so fn's own `profile` keyword reaches fn."""
+    priority = get_generation_profile(profile_name)["priority"]
+    return llm_scheduler.submit(llm_fanout_executor, priority, fn, *args, **kwargs)
+
+def fanout_results(futures):
+    """Results of `futures` in order, waiting at most FANOUT_RESULT_TIMEOUT in total"""
+    deadline = time.time() + FANOUT_RESULT_TIMEOUT
+    try:
+        return [future.result(timeout=max(0.0, deadline - time.time())) for future in futures]
+    except FuturesTimeoutError:
+        raise LLMConnectionError("Timed out waiting for the AI server.")
+
 # --- Prompt Creation Functions ---
-def create_roadmap_prompt(topic):
-    return f"""
+# Each builder returns (system_prompt, user_prompt). The system part is static so
+# llama.cpp can reuse its KV cache for it; only the short user tail varies per request.
+ROADMAP_SYSTEM_PROMPT = """
 ### INSTRUCTIONS ###
-You are an expert curriculum designer. Output ONLY a valid JSON array of objects for the topic. Each object must have "id", "title", and "description". Do not add any extra text. The response must start with '[' and end with ']'.
-
-Also, at the end of your response (after the JSON array), add a line with the corrected/proper topic name in this format:
-###CORRECTED_TOPIC###: [proper topic name]
-
-For example, if user types "clud computing", you should output:
-[{{...JSON array...}}]
-###CORRECTED_TOPIC###: Cloud Computing
+You are an expert curriculum designer. Output ONLY a valid JSON object with two keys:
+- "corrected_topic": the corrected/proper topic name. For example, if user types "clud computing", use "Cloud Computing".
+- "topics": an array of objects for the topic. Each object must have "id", "title", and "description".
+Do not add any extra text.
+"""
 
+def create_roadmap_prompt(topic):
+    return ROADMAP_SYSTEM_PROMPT, f"""
 ### TASK ###
 **Topic:** "{topic}"
 """
 
-def create_details_prompt(topic_title):
-    return f"""
+DETAILS_SYSTEM_PROMPT = """
 ### INSTRUCTIONS ###
-You are an expert tutor. Create a study guide for the topic below.
+You are an expert tutor. Create a study guide for the topic given in the task.
 
 Format your response as a valid JSON array. Each object should have "section_title" (string) and "section_items" (an array of objects with "term" and "definition").
 
@@ -42,18 +83,20 @@ IMPORTANT: The "definition" is for a side-menu. It MUST be extremely concise.
 - BAD: "A model for delivering computing services over the internet, allowing users to store, process, and manage data."
 
 The "definition" MUST be a 5-10 word summary. DO NOT write a full sentence.
+"""
 
+def create_details_prompt(topic_title):
+    return DETAILS_SYSTEM_PROMPT, f"""
 ### TASK ###
 
 Generate a JSON study guide for the topic: **"{topic_title}"**
 
 """
 
-def create_sub_details_prompt(term, context):
-    return f"""
+SUB_DETAILS_SYSTEM_PROMPT = """
 ### INSTRUCTIONS ###
 
-You are a world-class university professor and expert. Provide a comprehensive, detailed, and in-depth explanation for the term below.
+You are a world-class university professor and expert. Provide a comprehensive, detailed, and in-depth explanation for the term given in the task.
 
 Your explanation must be thorough and cover:
 
@@ -66,7 +109,10 @@ Your explanation must be thorough and cover:
 4.  Its importance and applications in the context of the main topic.
 
 IMPORTANT: Format your entire response as a single block of simple HTML. Use tags like <h2>, <h3>, <p>, <ul>, <li>, and <strong>. Do not include <html> or <body> tags. Be detailed and write at length.
+"""
 
+def create_sub_details_prompt(term, context):
+    return SUB_DETAILS_SYSTEM_PROMPT, f"""
 ### CONTEXT ###
 
 The term is part of a study guide on the topic: "{context}"
@@ -77,8 +123,8 @@ Provide a comprehensive, deep-dive HTML explanation for the term: **"{term}"**
 
 """
 
-def create_quiz_prompt(topic, num_questions, quiz_type):
-    # Calculate question distribution
+def quiz_question_split(num_questions, quiz_type):
+    """Return (num_mcq, num_descriptive) for a quiz type"""
     num_mcq = 0
     num_descriptive = 0
     if quiz_type == "MCQ":
@@ -88,22 +134,16 @@ def create_quiz_prompt(topic, num_questions, quiz_type):
     elif quiz_type == "Both":
         num_descriptive = int(num_questions * 0.3) # 30% descriptive
         num_mcq = num_questions - num_descriptive
-    
-    # Build the prompt instructions
-    instructions = f"""
+    return num_mcq, num_descriptive
+
+QUIZ_SYSTEM_PROMPT = """
 ### INSTRUCTIONS ###
 
-You are an expert quiz designer. Create a quiz for the topic: "{topic}".
+You are an expert quiz designer. Create a quiz for the topic given in the task.
 
 Your response must be a single valid JSON object with one key: "questions".
 
-The value MUST be an array of EXACTLY {num_questions} objects. Do NOT generate more or fewer.
-
-You must generate:
-
-- {num_mcq} Multiple Choice (MCQ) questions.
-
-- {num_descriptive} Descriptive questions.
+The value MUST be an array with EXACTLY the number of objects requested in the task. Do NOT generate more or fewer.
 
 Rules:
 - MCQ must include exactly 4 options and one correct answer.
@@ -111,22 +151,402 @@ Rules:
 - Do NOT include any commentary or markdown, only JSON.
 
 Format MCQ questions as:
-{{"type": "mcq", "question": "...", "options": ["A", "B", "C", "D"], "answer": "..."}}
+{"type": "mcq", "question": "...", "options": ["A", "B", "C", "D"], "answer": "..."}
 
 Format Descriptive questions as:
-{{"type": "descriptive", "question": "...", "ideal_answer": "A detailed rubric or ideal answer for grading."}}
+{"type": "descriptive", "question": "...", "ideal_answer": "A detailed rubric or ideal answer for grading."}
 
 Mix the questions together in the array.
 """
-    return instructions
+
+# Each chunk of a split quiz gets its own angle so parallel chunks do not repeat each other
+QUIZ_CHUNK_FOCUS = [
+    "core definitions and fundamentals",
+    "how it works: mechanisms and processes",
+    "practical applications and worked examples",
+    "common mistakes, misconceptions and comparisons",
+    "advanced details and edge cases"
+]
+
+def create_quiz_prompt(topic, num_questions, quiz_type, part=None, parts=None):
+    # Calculate question distribution
+    num_mcq, num_descriptive = quiz_question_split(num_questions, quiz_type)
+    
+    # Only the topic and counts vary; the instructions live in the system prompt
+    prompt = f"""
+### TASK ###
+
+Topic: "{topic}"
+
+Generate EXACTLY {num_questions} questions:
+
+- {num_mcq} Multiple Choice (MCQ) questions.
+
+- {num_descriptive} Descriptive questions.
+"""
+    if part is not None:
+        focus = QUIZ_CHUNK_FOCUS[(part - 1) % len(QUIZ_CHUNK_FOCUS)]
+        prompt += f"""
+This is batch {part} of {parts} of a larger quiz; the other batches are written separately.
+Focus this batch on {focus}.
+"""
+    return QUIZ_SYSTEM_PROMPT, prompt
+
+def quiz_generation_chunks(num_questions, quiz_type):
+    """Split a quiz into independent (kind, count) generations. "Both" quizzes get separate
+    MCQ and descriptive generations; any kind larger than QUIZ_CHUNK_SIZE is chunked further."""
+    num_mcq, num_descriptive = quiz_question_split(num_questions, quiz_type)
+    if quiz_type != "Both" and num_questions <= QUIZ_CHUNK_SIZE:
+        return [(quiz_type, num_questions)]
+    chunks = []
+    for kind, count in (("MCQ", num_mcq), ("Descriptive", num_descriptive)):
+        pieces = max(1, -(-count // QUIZ_CHUNK_SIZE))
+        for index in range(pieces):
+            # Spread the count evenly rather than leaving a tiny last chunk
+            size = count // pieces + (1 if index < count % pieces else 0)
+            if size:
+                chunks.append((kind, size))
+    return chunks
+
+def create_quiz_chunk_requests(topic, num_questions, quiz_type):
+    """(system_prompt, prompt, json_schema) for each chunk of a quiz"""
+    chunks = quiz_generation_chunks(num_questions, quiz_type)
+    chunk_requests = []
+    for part, (kind, count) in enumerate(chunks, start=1):
+        if len(chunks) == 1:
+            system_prompt, prompt = create_quiz_prompt(topic, count, kind)
+        else:
+            system_prompt, prompt = create_quiz_prompt(topic, count, kind, part, len(chunks))
+        num_mcq, num_descriptive = quiz_question_split(count, kind)
+        chunk_requests.append((system_prompt, prompt, quiz_schema(count, num_mcq, num_descriptive)))
+    return chunk_requests
+
+def merge_quiz_chunks(responses, questions=None):
+    """Combine chunk answers into one {"questions": [...]}, dropping repeats across chunks
+    and of the `questions` already kept"""
+    questions = list(questions or [])
+    seen = {(q.get('question') or '').strip().lower() for q in questions}
+    for response_str in responses:
+        quiz_data = parse_json_response(response_str)
+        if not isinstance(quiz_data, dict) or not isinstance(quiz_data.get('questions'), list):
+            raise ValueError("Quiz response missing 'questions' key")
+        for q in quiz_data['questions']:
+            key = (q.get('question') or '').strip().lower()
+            if key and key in seen:
+                continue
+            seen.add(key)
+            questions.append(q)
+    return {"questions": questions}
+
+def create_quiz_top_up_requests(topic, num_questions, quiz_type, questions):
+    """(system_prompt, prompt, json_schema) for the questions of each kind a merged quiz is
+    short of after repeats were dropped; the prompt lists the questions already asked"""
+    num_mcq, num_descriptive = quiz_question_split(num_questions, quiz_type)
+    kept = {"MCQ": 0, "Descriptive": 0}
+    for q in questions:
+        kept["Descriptive" if (q.get('type') or 'mcq').lower() == 'descriptive' else "MCQ"] += 1
+    asked = "\n".join(f"- {q.get('question', '')}" for q in questions)
+    chunk_requests = []
+    for kind, wanted in (("MCQ", num_mcq), ("Descriptive", num_descriptive)):
+        missing = wanted - kept[kind]
+        if missing <= 0:
+            continue
+        system_prompt, prompt = create_quiz_prompt(topic, missing, kind)
+        prompt += f"""
+These questions are already in the quiz; do not repeat them:
+{asked}
+"""
+        chunk_requests.append((system_prompt, prompt, quiz_schema(missing, *quiz_question_split(missing, kind))))
+    return chunk_requests
+
+def generate_quiz_data(topic, num_questions, quiz_type):
+    """Blocking quiz generation for jobs; chunks run concurrently on the fan-out pool.
+    Questions dropped as repeats are asked for once more; the quiz may still come out short."""
+    def generate(chunk_requests):
+        return fanout_results([
+            submit_llm_task(
+                "quiz", get_local_llm_response, prompt, system_prompt=system_prompt, profile="quiz",
+                route=resolve_route(), json_schema=schema
+            )
+            for system_prompt, prompt, schema in chunk_requests
+        ])
+    quiz_data = merge_quiz_chunks(generate(create_quiz_chunk_requests(topic, num_questions, quiz_type)))
+    top_up = create_quiz_top_up_requests(topic, num_questions, quiz_type, quiz_data["questions"])
+    if top_up:
+        quiz_data = merge_quiz_chunks(generate(top_up), quiz_data["questions"])
+    return quiz_data
+
+async def async_generate_quiz_data(topic, num_questions, quiz_type):
+    """Awaitable generate_quiz_data; latency follows the slowest chunk"""
+    async def generate(chunk_requests):
+        return await asyncio.gather(*[
+            async_get_local_llm_response(prompt, system_prompt=system_prompt, profile="quiz", json_schema=schema)
+            for system_prompt, prompt, schema in chunk_requests
+        ])
+    quiz_data = merge_quiz_chunks(await generate(create_quiz_chunk_requests(topic, num_questions, quiz_type)))
+    top_up = create_quiz_top_up_requests(topic, num_questions, quiz_type, quiz_data["questions"])
+    if top_up:
+        quiz_data = merge_quiz_chunks(await generate(top_up), quiz_data["questions"])
+    return quiz_data
+
+QUIZ_EXPLANATION_SYSTEM_PROMPTS = {
+    "mcq": """
+You are a tutor. Explain succinctly why the correct answer is correct and others are not.
+Return a short paragraph followed by 2-3 bullet points.
+""",
+    "descriptive": """
+You are a tutor. Compare the user's answer to the ideal answer and explain key gaps.
+Return a short paragraph followed by 2-3 bullet points.
+"""
+}
+
+def create_quiz_explanation_prompt(q_type, question, user_answer, correct_answer=None, ideal_answer=None):
+    if q_type == 'mcq':
+        tail = f"""
+Question: {question}
+Correct Answer: {correct_answer}
+User Answer: {user_answer}
+"""
+    else:
+        tail = f"""
+Question: {question}
+Ideal Answer: {ideal_answer}
+User Answer: {user_answer}
+"""
+    return QUIZ_EXPLANATION_SYSTEM_PROMPTS[q_type], tail
+
+QUIZ_EXPLANATION_BATCH_SYSTEM_PROMPT = """
+You are a tutor. For each numbered question below:
+- MCQ: explain succinctly why the correct answer is correct and others are not.
+- Descriptive: compare the user's answer to the ideal answer and explain key gaps.
+Each explanation is a short paragraph followed by 2-3 bullet points.
+Respond ONLY with a JSON array holding one {"explanation": "..."} object per question, in the same order.
+"""
+
+def create_quiz_explanation_batch_prompt(items):
+    """Pack several explanation requests into one structured generation"""
+    parts = []
+    for number, item in enumerate(items, start=1):
+        if item['type'] == 'mcq':
+            reference = f"Correct Answer: {item.get('correct_answer')}"
+        else:
+            reference = f"Ideal Answer: {item.get('ideal_answer')}"
+        parts.append(f"""
+### QUESTION {number} ({item['type'].upper()}) ###
+Question: {item['question']}
+{reference}
+User Answer: {item.get('user_answer')}
+""")
+    return QUIZ_EXPLANATION_BATCH_SYSTEM_PROMPT, "".join(parts)
+
+NOTE_FLASHCARDS_SYSTEM_PROMPT = """
+### INSTRUCTIONS ###
+You are an expert educator. Create flashcards from the provided note text.
+Return ONLY a valid JSON array. Each item must be an object with fields: "question" and "answer".
+Generate as many cards as needed to cover key points (typically 8-20 based on content importance).
+Avoid duplicates; make questions concise and answers clear.
+"""
+
+def create_note_flashcards_prompt(text):
+    return NOTE_FLASHCARDS_SYSTEM_PROMPT, f"""
+### NOTE TEXT ###
+{text}
+"""
+
+# --- Speculative details pre-generation ---
+def schedule_details_prefetch(user_email, roadmap_topic, roadmap):
+    """Queue pre-generation of `details` notes for the first roadmap topics; returns the job id or None"""
+    titles = [item.get('title') for item in roadmap if isinstance(item, dict) and item.get('title')]
+    titles = titles[:SPECULATIVE_DETAILS_TOPICS]
+    if not titles:
+        return None
+    try:
+        return enqueue_job("prefetch_details", user_email, {"roadmap_topic": roadmap_topic, "titles": titles},
+                           priority=PRIORITY_SPECULATIVE, max_attempts=SPECULATIVE_DETAILS_MAX_ATTEMPTS)
+    except Exception as e:
+        # Pre-generation is best effort; the roadmap itself is already saved
+        print(f"Could not schedule details prefetch for '{roadmap_topic}': {e}")
+        return None
+
+@register_job_handler("prefetch_details")
+def run_prefetch_details_job(job):
+    """Generate missing details notes one topic at a time, only while the LLM has idle slots.
+    When it is busy the job is deferred and resumes later with the topics still missing."""
+    titles = job.payload['titles']
+    prefetched = []
+    for done, title in enumerate(titles):
+        if job.is_cancelled():
+            break
+        if DatabaseOperations.get_latest_note(job.user_email, title, "details"):
+            continue  # opened by the user already, or generated on an earlier attempt
+        # Another user's notes for the same topic cost no generation at all
+        response_str = find_shared_answer("details", title)
+        if response_str is None:
+            if not llm_scheduler.has_idle_capacity():
+                raise LLMBusyError("AI server is busy; deferring details prefetch.",
+                                   max(1, round(llm_scheduler.get_stats()["avg_service_time"])))
+            system_prompt, prompt = create_details_prompt(title)
+            # Same request as /generate_details, so a click during generation shares its cache entry
+            response_str = get_local_llm_response(
+                prompt, system_prompt=system_prompt, profile="details", cache=True, priority=PRIORITY_SPECULATIVE,
+                json_schema=DETAILS_SCHEMA
+            )
+        try:
+            details = parse_json_response(response_str)
+        except ValueError as e:
+            print(f"Details prefetch for '{title}' returned invalid JSON: {e}")
+            continue
+        if not isinstance(details, list) or job.is_cancelled():
+            continue
+        DatabaseOperations.save_note(
+            job.user_email,
+            title,
+            "details",
+            details,
+            {"generated_at": DatabaseOperations.get_current_timestamp(), "speculative": True},
+            library_keys=[library_key(title)]
+        )
+        prefetched.append(title)
+        job.report_progress({"done": done + 1, "total": len(titles)})
+    return {"prefetched": prefetched}
+
+# --- Roadmap and details results ---
+def find_shared_answer(kind, text):
+    """Content any user already generated for this topic/term (content library), in the
+    format the LLM answers in, so it can stand in for a generation; or None"""
+    content = DatabaseOperations.find_library_content(kind, library_key(text))
+    if content is None or isinstance(content, str):
+        return content
+    return json.dumps(content)
+
+def parse_roadmap_response(topic, response_str):
+    """Return (topics, corrected_topic) from a roadmap answer"""
+    parsed = parse_json_response(response_str)
+
+    # Extract corrected topic name from the response
+    corrected_topic = topic  # Default to original
+    if isinstance(parsed, dict):
+        roadmap = parsed.get('topics') or []
+        corrected_name = (parsed.get('corrected_topic') or '').strip()
+    else:
+        # Older unconstrained format: a bare array followed by a ###CORRECTED_TOPIC### line
+        roadmap = parsed
+        corrected_match = re.search(r'###CORRECTED_TOPIC###:\s*(.+)', response_str, re.IGNORECASE)
+        corrected_name = corrected_match.group(1).strip() if corrected_match else ''
+    if not isinstance(roadmap, list):
+        raise ValueError("Roadmap response must contain a topics array")
+    if corrected_name:
+        corrected_topic = corrected_name
+    elif roadmap and len(roadmap) > 0:
+        # Fallback: try to infer from first topic title
+        first_title = roadmap[0].get('title', '')
+        if first_title and len(first_title) < 50:  # Reasonable topic name length
+            corrected_topic = first_title
+    return roadmap, corrected_topic
+
+def store_generated_roadmap(user_email, topic, response_str, prefetch_details=False):
+    """Validate and save a roadmap answer; returns (payload, status)"""
+    roadmap, corrected_topic = parse_roadmap_response(topic, response_str)
+    # Valid answers become reusable for near-duplicate spellings of the topic
+    semantic_cache.set("roadmap", topic, response_str)
+
+    # Re-check existence with corrected topic name
+    existing_corrected = DatabaseOperations.get_roadmap_by_topic(user_email, corrected_topic)
+    if existing_corrected:
+        return {
+            "message": "Roadmap for this topic already exists.",
+            "exists": True,
+            "topic": corrected_topic
+        }, 409
+
+    # Save roadmap to database with corrected topic name
+    roadmap_data = {
+        'topics': roadmap,
+        'generated_at': DatabaseOperations.get_current_timestamp()
+    }
+    DatabaseOperations.save_roadmap(
+        user_email, corrected_topic, roadmap_data,
+        library_keys=list({library_key(topic), library_key(corrected_topic)})
+    )
+    topic_index.invalidate(user_email)
+
+    result = {"topics": roadmap, "topic": corrected_topic, "exists": False}
+    if prefetch_details:
+        result["prefetch_job_id"] = schedule_details_prefetch(user_email, corrected_topic, roadmap)
+    return result, 200
+
+def match_existing_topic(user_email, topic):
+    """Resolve a requested topic against the user's roadmaps before any generation.
+    Returns (409 answer for a retyped/misspelt existing topic or None, similar existing topics).
+    Similar topics do not block the generation; they are sent along as "did_you_mean"."""
+    kind, topics = topic_index.match(user_email, topic)
+    if kind == "suggest":
+        return None, topics
+    if kind in ("exact", "same"):
+        existing = DatabaseOperations.get_roadmap_by_topic(user_email, topics[0])
+        if existing:
+            return {
+                "message": "Roadmap for this topic already exists.",
+                "exists": True,
+                "topic": topics[0],
+                "matched_by": kind,
+                "roadmap": existing.get('roadmap_data')
+            }, []
+        # Deleted on another node since the index was loaded
+        topic_index.invalidate(user_email)
+    return None, []
+
+def store_generated_details(user_email, title, response_str):
+    """Validate and save a details answer; returns the sections"""
+    details = parse_json_response(response_str)
+    if not isinstance(details, list):
+        raise ValueError("Could not find valid JSON array in LLM response")
+    semantic_cache.set("details", title, response_str)
+    
+    # Save details to notes collection
+    DatabaseOperations.save_note(
+        user_email, 
+        title, 
+        "details", 
+        details,
+        {"generated_at": DatabaseOperations.get_current_timestamp()},
+        library_keys=[library_key(title)]
+    )
+    return details
+
+def stream_json_items(prompt, system_prompt, profile, json_schema, regenerate, chunks, key=None, cached=None, route=None):
+    """Stream a JSON-array answer, yielding each element the moment it is complete.
+    The raw text is collected in `chunks` so the full answer can be validated afterwards.
+    A `cached` answer (from the semantic cache) is replayed instead of calling the LLM."""
+    parser = JSONArrayStreamParser(key)
+    if cached is not None:
+        chunks.append(cached)
+        yield from parser.feed(cached)
+        return
+    for token in stream_local_llm_response(
+        prompt, system_prompt=system_prompt, profile=profile, cache=True, regenerate=regenerate,
+        json_schema=json_schema, route=route
+    ):
+        chunks.append(token)
+        yield from parser.feed(token)
+
+def sse_llm_error(e):
+    """SSE `error` event for an exception raised while streaming"""
+    if isinstance(e, LLMBusyError):
+        return sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+    if isinstance(e, LLMConnectionError):
+        return sse_event({"error": str(e)}, event="error")
+    return sse_event({"error": f"An error occurred: {str(e)}"}, event="error")
 
 # --- Routes ---
 @roadmap_bp.route("/generate_roadmap", methods=["POST"])
 @token_required
-def generate_roadmap():
+async def generate_roadmap():
     data = request.get_json()
     topic = data.get('query')
     user_email = request.user['email']
+    regenerate = bool(data.get('regenerate'))
+    prefetch_details = wants_background(data.get('prefetch_details', SPECULATIVE_DETAILS))
 
     # Early-exit if the roadmap for this topic already exists (by original or corrected later)
     try:
@@ -139,43 +559,54 @@ def generate_roadmap():
                 "topic": existing_roadmap.get('topic', topic)
             }), 409
 
-        # If not found by direct topic, we still need LLM to possibly correct the topic name.
-        prompt = create_roadmap_prompt(topic)
-        response_str = get_local_llm_response(prompt)
-
-        match = re.search(r'\[.*\]', response_str, re.DOTALL)
-        if not match:
-            raise ValueError("Could not find valid JSON array in LLM response")
-        roadmap = json.loads(match.group(0))
-
-        # Extract corrected topic name from the response
-        corrected_topic = topic  # Default to original
-        corrected_match = re.search(r'###CORRECTED_TOPIC###:\s*(.+)', response_str, re.IGNORECASE)
-        if corrected_match:
-            corrected_topic = corrected_match.group(1).strip()
-        elif roadmap and len(roadmap) > 0:
-            # Fallback: try to infer from first topic title
-            first_title = roadmap[0].get('title', '')
-            if first_title and len(first_title) < 50:  # Reasonable topic name length
-                corrected_topic = first_title
-
-        # Re-check existence with corrected topic name
-        existing_corrected = DatabaseOperations.get_roadmap_by_topic(user_email, corrected_topic)
-        if existing_corrected:
-            return jsonify({
-                "message": "Roadmap for this topic already exists.",
-                "exists": True,
-                "topic": corrected_topic
-            }), 409
-
-        # Save roadmap to database with corrected topic name
-        roadmap_data = {
-            'topics': roadmap,
-            'generated_at': DatabaseOperations.get_current_timestamp()
-        }
-        DatabaseOperations.save_roadmap(user_email, corrected_topic, roadmap_data)
+        # Then against the user's other topics: case, punctuation and typos should not cost a generation.
+        # confirm_new means the user wants the topic exactly as typed.
+        suggestions = []
+        if not wants_background(data.get('confirm_new')):
+            matched, suggestions = match_existing_topic(user_email, topic)
+            if matched:
+                return jsonify(matched), 409
+
+        def with_suggestions(result, status):
+            if status == 200 and suggestions:
+                result["did_you_mean"] = suggestions
+            return result
+
+        # If not found, we still need LLM to possibly correct the topic name
+        # (unless this topic was generated for anyone before, or a near-duplicate of it).
+        system_prompt, prompt = create_roadmap_prompt(topic)
+        # The /embedding lookup is a blocking HTTP call: keep it off the event loop
+        cached = None if regenerate else (
+            find_shared_answer("roadmap", topic) or await asyncio.to_thread(semantic_cache.get, "roadmap", topic)
+        )
 
-        return jsonify({"topics": roadmap, "topic": corrected_topic, "exists": False}), 200
+        if wants_event_stream(data.get('stream')):
+            # Each roadmap step is sent as a `topic` event as soon as it is generated;
+            # `done` carries the validated, saved result (or the 409 payload)
+            route = resolve_route()
+
+            def events():
+                chunks = []
+                try:
+                    for item in stream_json_items(
+                        prompt, system_prompt, "roadmap", ROADMAP_SCHEMA, regenerate, chunks, key="topics",
+                        cached=cached, route=route
+                    ):
+                        yield sse_event(item, event="topic")
+                    result, status = store_generated_roadmap(user_email, topic, "".join(chunks), prefetch_details)
+                    yield sse_event(with_suggestions(result, status), event="done")
+                except Exception as e:
+                    yield sse_llm_error(e)
+            return sse_response(events())
+
+        response_str = cached or await async_get_local_llm_response(
+            prompt, system_prompt=system_prompt, profile="roadmap", cache=True, regenerate=regenerate,
+            json_schema=ROADMAP_SCHEMA
+        )
+        result, status = await asyncio.to_thread(store_generated_roadmap, user_email, topic, response_str, prefetch_details)
+        return jsonify(with_suggestions(result, status)), status
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except Exception as e:
@@ -183,35 +614,71 @@ def generate_roadmap():
 
 @roadmap_bp.route("/generate_details", methods=["POST"])
 @token_required
-def generate_details():
+async def generate_details():
     data = request.get_json()
     title = data.get('title')
     user_email = request.user['email']
+    regenerate = bool(data.get('regenerate'))
     
     try:
-        prompt = create_details_prompt(title)
-        response_str = get_local_llm_response(prompt)
-        
-        match = re.search(r'\[.*\]', response_str, re.DOTALL)
-        if not match:
-            raise ValueError("Could not find valid JSON array in LLM response")
-        details = json.loads(match.group(0))
-        
-        # Save details to notes collection
-        DatabaseOperations.save_note(
-            user_email, 
-            title, 
-            "details", 
-            details,
-            {"generated_at": DatabaseOperations.get_current_timestamp()}
+        # Serve a stored note (e.g. pre-generated after the roadmap was created) unless asked to regenerate
+        existing = None
+        if not regenerate:
+            note = DatabaseOperations.get_latest_note(user_email, title, "details")
+            if note and isinstance(note.get('content'), list):
+                existing = note['content']
+
+        system_prompt, prompt = create_details_prompt(title)
+        cached = None
+        if not regenerate and existing is None:
+            cached = find_shared_answer("details", title) or await asyncio.to_thread(semantic_cache.get, "details", title)
+        if wants_event_stream(data.get('stream')):
+            # One `section` event per details section as it is generated, then `done`
+            route = resolve_route()
+
+            def events():
+                chunks = []
+                try:
+                    if existing is not None:
+                        for section in existing:
+                            yield sse_event(section, event="section")
+                        yield sse_event({"details": existing}, event="done")
+                        return
+                    for section in stream_json_items(
+                        prompt, system_prompt, "details", DETAILS_SCHEMA, regenerate, chunks, cached=cached,
+                        route=route
+                    ):
+                        yield sse_event(section, event="section")
+                    details = store_generated_details(user_email, title, "".join(chunks))
+                    yield sse_event({"details": details}, event="done")
+                except Exception as e:
+                    yield sse_llm_error(e)
+            return sse_response(events())
+
+        if existing is not None:
+            return jsonify({"details": existing})
+        response_str = cached or await async_get_local_llm_response(
+            prompt, system_prompt=system_prompt, profile="details", cache=True, regenerate=regenerate,
+            json_schema=DETAILS_SCHEMA
         )
-        
+        details = await asyncio.to_thread(store_generated_details, user_email, title, response_str)
         return jsonify({"details": details})
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"An error occurred while parsing details: {str(e)}"}), 500
 
+def clean_html_response(sub_details):
+    """Strip surrounding whitespace and ```html fences from an HTML answer"""
+    sub_details = sub_details.strip()
+    if sub_details.startswith("```html"):
+        sub_details = sub_details[7:]
+    if sub_details.endswith("```"):
+        sub_details = sub_details[:-3]
+    return sub_details.strip()
+
 @roadmap_bp.route("/generate_sub_details", methods=["POST"])
 @token_required
 def generate_sub_details():
@@ -219,169 +686,172 @@ def generate_sub_details():
     term = data.get('term')
     context = data.get('context')
     user_email = request.user['email']
-    
-    try:
-        prompt = create_sub_details_prompt(term, context)
-        sub_details = get_local_llm_response(prompt)
-
-        # Clean the HTML response
-        sub_details = sub_details.strip()
-        if sub_details.startswith("```html"):
-            sub_details = sub_details[7:]
-        if sub_details.endswith("```"):
-            sub_details = sub_details[:-3]
-        sub_details = sub_details.strip()
-
+    system_prompt, prompt = create_sub_details_prompt(term, context)
+    regenerate = bool(data.get('regenerate'))
+    semantic_key = f"{term} in {context}"
+    cached = None
+    if not regenerate:
+        cached = find_shared_answer("sub_details", semantic_key) or semantic_cache.get("sub_details", semantic_key)
+
+    def save_sub_details(sub_details):
+        semantic_cache.set("sub_details", semantic_key, sub_details)
         # Save sub_details to notes collection (only if not an error)
         DatabaseOperations.save_note(
             user_email, 
             context, 
             "sub_details", 
             sub_details,
-            {"term": term, "generated_at": DatabaseOperations.get_current_timestamp()}
+            {"term": term, "generated_at": DatabaseOperations.get_current_timestamp()},
+            library_keys=[library_key(semantic_key)]
         )
 
+    if wants_event_stream(data.get('stream')):
+        route = resolve_route()
+
+        def events():
+            chunks = []
+            try:
+                tokens = [cached] if cached is not None else stream_local_llm_response(
+                    prompt, system_prompt=system_prompt, profile="sub_details", cache=True, regenerate=regenerate,
+                    route=route
+                )
+                for token in tokens:
+                    chunks.append(token)
+                    yield sse_event({"token": token})
+                sub_details = clean_html_response("".join(chunks))
+                save_sub_details(sub_details)
+                yield sse_event({"sub_details": sub_details}, event="done")
+            except LLMBusyError as e:
+                yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+            except LLMConnectionError as e:
+                yield sse_event({"error": str(e)}, event="error")
+            except Exception as e:
+                yield sse_event({"error": f"An error occurred: {str(e)}"}, event="error")
+        return sse_response(events())
+
+    try:
+        sub_details = cached or clean_html_response(get_local_llm_response(prompt, system_prompt=system_prompt, profile="sub_details", cache=True, regenerate=regenerate))
+        save_sub_details(sub_details)
+
         return jsonify({"sub_details": sub_details})
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
+def save_generated_quiz(user_email, topic, num_questions, quiz_type, quiz_data):
+    """Normalise and store a generated quiz; returns the raw quiz JSON"""
+
+    # Validate that quiz_data has the expected structure
+    if not isinstance(quiz_data, dict) or 'questions' not in quiz_data:
+        raise ValueError("Quiz response missing 'questions' key")
+    
+    if not isinstance(quiz_data['questions'], list):
+        raise ValueError("'questions' must be an array")
+    
+    questions = quiz_data['questions']
+    # The schema fixes the count; trimming only matters for unconstrained servers
+    def normalize_q_list(qs):
+        out = []
+        for q in qs:
+            t = (q.get('type') or 'mcq').lower()
+            if t == 'mcq':
+                out.append({
+                    'type': 'mcq',
+                    'question': q.get('question', ''),
+                    'options': (q.get('options') or [])[:4],
+                    'answer': q.get('answer')
+                })
+            else:
+                out.append({
+                    'type': 'descriptive',
+                    'question': q.get('question', ''),
+                    'ideal_answer': q.get('ideal_answer', '')
+                })
+        return out
+    questions = normalize_q_list(questions)
+
+    # Trim if too many; a quiz still short after the top-up keeps the questions it has
+    if len(questions) > num_questions:
+        questions = questions[:num_questions]
+
+    # Re-index ids
+    normalized_questions = []
+    for idx, q in enumerate(questions):
+        nq = {
+            'id': idx + 1,
+            'type': q.get('type', 'mcq'),
+            'question': q.get('question', ''),
+            'options': q.get('options') if q.get('type') == 'mcq' else None,
+            'answer': q.get('answer') if q.get('type') == 'mcq' else None,
+            'ideal_answer': q.get('ideal_answer') if q.get('type') == 'descriptive' else None,
+        }
+        normalized_questions.append(nq)
+
+    # Save quiz to notes collection (raw)
+    DatabaseOperations.save_note(
+        user_email,
+        topic,
+        "quiz",
+        quiz_data,
+        {"generated_at": DatabaseOperations.get_current_timestamp(), "quiz_type": quiz_type, "num_questions": num_questions}
+    )
+
+    # Save/Upsert normalized quiz to dedicated collection for evaluation reuse
+    DatabaseOperations.save_quiz(
+        user_email=user_email,
+        topic=topic,
+        quiz_type=quiz_type,
+        num_questions=num_questions,
+        questions=normalized_questions,
+        metadata={"generated_at": DatabaseOperations.get_current_timestamp()}
+    )
+    return quiz_data
+
+@register_job_handler("quiz")
+def run_quiz_job(job):
+    topic = job.payload['topic']
+    num_questions = job.payload['num_questions']
+    quiz_type = job.payload['quiz_type']
+    quiz_data = generate_quiz_data(topic, num_questions, quiz_type)
+    return save_generated_quiz(job.user_email, topic, num_questions, quiz_type, quiz_data)
+
 @roadmap_bp.route("/generate_quiz", methods=["POST"])
 @token_required
-def generate_quiz():
+async def generate_quiz():
     data = request.get_json()
     topic = data.get('topic')
-    num_questions = data.get('num_questions', 10) 
     quiz_type = data.get('quiz_type', 'MCQ') # Get the new quiz type
     user_email = request.user['email']
     
     if not topic:
         return jsonify({"error": "Missing topic"}), 400
-        
     try:
-        # Pass all three arguments to the prompt function
-        prompt = create_quiz_prompt(topic, num_questions, quiz_type)
-        response_str = get_local_llm_response(prompt)
-        
-        # Clean the response - remove markdown code blocks if present
-        response_str = response_str.strip()
-        if response_str.startswith("```json"):
-            response_str = response_str[7:]
-        elif response_str.startswith("```"):
-            response_str = response_str[3:]
-        if response_str.endswith("```"):
-            response_str = response_str[:-3]
-        response_str = response_str.strip()
+        num_questions = int(data.get('num_questions', 10))
+    except (TypeError, ValueError):
+        num_questions = 0
+    if num_questions < 1:
+        return jsonify({"error": "num_questions must be a positive whole number"}), 400
+
+    if wants_background(data.get('background')):
+        job_id = enqueue_job("quiz", user_email, {
+            "topic": topic, "num_questions": num_questions, "quiz_type": quiz_type
+        }, priority=PRIORITY_NORMAL)
+        return job_accepted_response(job_id)
         
-        # Try to find JSON object
-        match = re.search(r'\{.*\}', response_str, re.DOTALL)
-        if match:
-            quiz_data = json.loads(match.group(0))
-        else:
-            # If no match, try parsing the whole response
-            try:
-                quiz_data = json.loads(response_str)
-            except json.JSONDecodeError:
-                # Last resort: try to extract content between first { and last }
-                start_idx = response_str.find('{')
-                end_idx = response_str.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    quiz_data = json.loads(response_str[start_idx:end_idx+1])
-                else:
-                    raise ValueError(f"Could not find valid JSON in LLM response. Response preview: {response_str[:500]}")
-        
-        # Validate that quiz_data has the expected structure
-        if not isinstance(quiz_data, dict) or 'questions' not in quiz_data:
-            raise ValueError("Quiz response missing 'questions' key")
-        
-        if not isinstance(quiz_data['questions'], list):
-            raise ValueError("'questions' must be an array")
-        
-        questions = quiz_data['questions']
-        # Ensure exact number of questions by trimming or topping up
-        def normalize_q_list(qs):
-            out = []
-            for q in qs:
-                t = (q.get('type') or 'mcq').lower()
-                if t == 'mcq':
-                    out.append({
-                        'type': 'mcq',
-                        'question': q.get('question', ''),
-                        'options': (q.get('options') or [])[:4],
-                        'answer': q.get('answer')
-                    })
-                else:
-                    out.append({
-                        'type': 'descriptive',
-                        'question': q.get('question', ''),
-                        'ideal_answer': q.get('ideal_answer', '')
-                    })
-            return out
-        questions = normalize_q_list(questions)
-
-        # Trim if too many
-        if len(questions) > num_questions:
-            questions = questions[:num_questions]
-
-        # Top-up if too few (attempt one supplemental generation)
-        if len(questions) < num_questions:
-            missing = num_questions - len(questions)
-            supplement_prompt = create_quiz_prompt(topic, missing, quiz_type)
-            supplement_response = get_local_llm_response(supplement_prompt)
-            m2 = re.search(r'\{.*\}', supplement_response, re.DOTALL)
-            more = []
-            try:
-                parsed = json.loads(m2.group(0)) if m2 else json.loads(supplement_response)
-                more = normalize_q_list(parsed.get('questions', []))
-            except Exception:
-                more = []
-            questions.extend(more[:missing])
-
-        # As final guard, if still short, duplicate last with minor marker
-        while len(questions) < num_questions and questions:
-            clone = dict(questions[-1])
-            clone['question'] = clone.get('question', '') + ' (variant)'
-            questions.append(clone)
-
-        # Re-index ids
-        normalized_questions = []
-        for idx, q in enumerate(questions):
-            nq = {
-                'id': idx + 1,
-                'type': q.get('type', 'mcq'),
-                'question': q.get('question', ''),
-                'options': q.get('options') if q.get('type') == 'mcq' else None,
-                'answer': q.get('answer') if q.get('type') == 'mcq' else None,
-                'ideal_answer': q.get('ideal_answer') if q.get('type') == 'descriptive' else None,
-            }
-            normalized_questions.append(nq)
-
-        # Save quiz to notes collection (raw)
-        DatabaseOperations.save_note(
-            user_email,
-            topic,
-            "quiz",
-            quiz_data,
-            {"generated_at": DatabaseOperations.get_current_timestamp(), "quiz_type": quiz_type, "num_questions": num_questions}
-        )
-
-        # Save/Upsert normalized quiz to dedicated collection for evaluation reuse
-        DatabaseOperations.save_quiz(
-            user_email=user_email,
-            topic=topic,
-            quiz_type=quiz_type,
-            num_questions=num_questions,
-            questions=normalized_questions,
-            metadata={"generated_at": DatabaseOperations.get_current_timestamp()}
-        )
+    try:
+        quiz_data = await async_generate_quiz_data(topic, num_questions, quiz_type)
+        quiz_data = save_generated_quiz(user_email, topic, num_questions, quiz_type, quiz_data)
         
         return jsonify(quiz_data)
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except json.JSONDecodeError as e:
-        response_preview = response_str[:500] if 'response_str' in locals() else "Response not available"
-        return jsonify({"error": f"Failed to parse JSON from LLM response: {str(e)}. Response preview: {response_preview}"}), 500
+        return jsonify({"error": f"Failed to parse JSON from LLM response: {str(e)}"}), 500
     except Exception as e:
         return jsonify({"error": f"An error occurred while parsing the quiz: {str(e)}"}), 500
 
@@ -398,30 +868,136 @@ def explain_quiz():
     if not question or q_type not in ('mcq', 'descriptive'):
         return jsonify({"error": "Invalid payload"}), 400
 
+    system_prompt, prompt = create_quiz_explanation_prompt(
+        q_type, question, user_answer, correct_answer=correct_answer, ideal_answer=ideal_answer
+    )
+
+    if wants_event_stream(data.get('stream')):
+        route = resolve_route()
+
+        def events():
+            chunks = []
+            try:
+                for token in stream_local_llm_response(
+                    prompt, system_prompt=system_prompt, profile="quiz_explain", route=route
+                ):
+                    chunks.append(token)
+                    yield sse_event({"token": token})
+                yield sse_event({"explanation": "".join(chunks).strip()}, event="done")
+            except LLMBusyError as e:
+                yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+            except LLMConnectionError as e:
+                yield sse_event({"error": str(e)}, event="error")
+            except Exception as e:
+                yield sse_event({"error": f"Failed to generate explanation: {str(e)}"}, event="error")
+        return sse_response(events())
+
     try:
-        if q_type == 'mcq':
-            prompt = f"""
-You are a tutor. Explain succinctly why the correct answer is correct and others are not.
-Question: {question}
-Correct Answer: {correct_answer}
-User Answer: {user_answer}
-Return a short paragraph followed by 2-3 bullet points.
-"""
-        else:
-            prompt = f"""
-You are a tutor. Compare the user's answer to the ideal answer and explain key gaps.
-Question: {question}
-Ideal Answer: {ideal_answer}
-User Answer: {user_answer}
-Return a short paragraph followed by 2-3 bullet points.
-"""
-        explanation = get_local_llm_response(prompt)
+        explanation = get_local_llm_response(prompt, system_prompt=system_prompt, profile="quiz_explain")
         return jsonify({"explanation": explanation}), 200
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"Failed to generate explanation: {str(e)}"}), 500
 
+def explain_quiz_item(item, route):
+    system_prompt, prompt = create_quiz_explanation_prompt(
+        item['type'], item['question'], item.get('user_answer'),
+        correct_answer=item.get('correct_answer'), ideal_answer=item.get('ideal_answer')
+    )
+    return get_local_llm_response(prompt, system_prompt=system_prompt, profile="quiz_explain", route=route)
+
+def explain_quiz_items(items, route):
+    """Yield one result dict per item as soon as it is ready (not necessarily in order)"""
+    emitted = set()
+    if len(items) <= EXPLAIN_BATCH_PACK_MAX:
+        # Small batch: one packed generation instead of several prompts
+        try:
+            system_prompt, prompt = create_quiz_explanation_batch_prompt(items)
+            packed = parse_json_response(get_local_llm_response(
+                prompt, system_prompt=system_prompt, profile="quiz_explain_batch", route=route,
+                json_schema=explanations_schema(len(items))
+            ))
+            if isinstance(packed, list) and len(packed) == len(items):
+                for index, (item, result) in enumerate(zip(items, packed)):
+                    explanation = result.get('explanation') if isinstance(result, dict) else None
+                    if isinstance(explanation, str) and explanation.strip():
+                        emitted.add(index)
+                        yield {"index": index, "id": item.get('id'), "explanation": explanation.strip()}
+        except (LLMBusyError, LLMConnectionError):
+            raise
+        except Exception as e:
+            print(f"Packed explanation failed, explaining one by one: {e}")
+        if len(emitted) == len(items):
+            return
+
+    # One prompt per item the packed answer did not cover
+    futures = {
+        submit_llm_task("quiz_explain", explain_quiz_item, item, route): index
+        for index, item in enumerate(items) if index not in emitted
+    }
+    pending = set(futures.values())
+    try:
+        for future in as_completed(futures, timeout=FANOUT_RESULT_TIMEOUT):
+            index = futures[future]
+            pending.discard(index)
+            result = {"index": index, "id": items[index].get('id')}
+            try:
+                result["explanation"] = future.result(timeout=0)
+            except LLMBusyError as e:
+                result.update({"error": str(e), "retry_after": e.retry_after})
+            except Exception as e:
+                result["error"] = f"Failed to generate explanation: {str(e)}"
+            yield result
+    except FuturesTimeoutError:
+        for index in sorted(pending):
+            yield {"index": index, "id": items[index].get('id'), "error": "Timed out waiting for the AI server."}
+
+@roadmap_bp.route("/explain_quiz_batch", methods=["POST"])
+@token_required
+def explain_quiz_batch():
+    """Explain several quiz answers in one request: {"items": [<explain_quiz payload>, ...]}"""
+    data = request.get_json() or {}
+    items = data.get('items') or []
+
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Invalid payload"}), 400
+    if len(items) > EXPLAIN_BATCH_MAX_ITEMS:
+        return jsonify({"error": f"At most {EXPLAIN_BATCH_MAX_ITEMS} items per batch"}), 400
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('question') or item.get('type') not in ('mcq', 'descriptive'):
+            return jsonify({"error": f"Invalid payload for item {index}"}), 400
+
+    route = resolve_route()
+
+    if wants_event_stream(data.get('stream')):
+        def events():
+            results = [None] * len(items)
+            try:
+                for result in explain_quiz_items(items, route):
+                    results[result["index"]] = result
+                    yield sse_event(result, event="explanation")
+                yield sse_event({"explanations": results}, event="done")
+            except LLMBusyError as e:
+                yield sse_event({"error": str(e), "retry_after": e.retry_after}, event="error")
+            except LLMConnectionError as e:
+                yield sse_event({"error": str(e)}, event="error")
+            except Exception as e:
+                yield sse_event({"error": f"Failed to generate explanations: {str(e)}"}, event="error")
+        return sse_response(events())
+
+    try:
+        results = sorted(explain_quiz_items(items, route), key=lambda result: result["index"])
+        return jsonify({"explanations": results}), 200
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+    except LLMConnectionError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": f"Failed to generate explanations: {str(e)}"}), 500
+
 # New route to get user's saved roadmaps
 @roadmap_bp.route("/get_roadmaps", methods=["GET"])
 @token_required
@@ -565,6 +1141,7 @@ def delete_roadmap():
         rm = roadmaps_collection.find_one({"user_email": user_email, "topic": topic})
         main_titles = []
         if rm:
+            DatabaseOperations.hydrate_roadmaps([rm])
             topics_array = rm.get("roadmap_data", {}).get("topics") if isinstance(rm.get("roadmap_data"), dict) else rm.get("topics")
             if isinstance(topics_array, list):
                 for item in topics_array:
@@ -574,11 +1151,28 @@ def delete_roadmap():
                         main_titles.append(item)
         topics_to_delete = [topic] + main_titles
 
+        # Stop any details pre-generation still running for this roadmap
+        DatabaseOperations.cancel_user_jobs(user_email, "prefetch_details", {"roadmap_topic": topic})
+
+        # Shared content referenced by what is deleted below; released once the references are gone
+        content_refs = [
+            doc.get("roadmap_data", {}).get("content_ref") for doc in roadmaps_collection.find(
+                {"user_email": user_email, "topic": topic}, {"_id": 0, "roadmap_data.content_ref": 1}
+            )
+        ]
+        content_refs += [
+            doc.get("content_ref") for doc in notes_collection.find(
+                {"user_email": user_email, "topic": {"$in": topics_to_delete}}, {"_id": 0, "content_ref": 1}
+            )
+        ]
+
         # Delete roadmap
         roadmaps_collection.delete_many({"user_email": user_email, "topic": topic})
+        topic_index.invalidate(user_email)
 
         # Delete related notes (details, sub_details, quiz, summary)
         notes_collection.delete_many({"user_email": user_email, "topic": {"$in": topics_to_delete}})
+        DatabaseOperations.release_library_content(content_refs)
 
         # Delete quizzes (definitions)
         quizzes_collection.delete_many({"user_email": user_email, "topic": {"$in": topics_to_delete}})
@@ -613,10 +1207,7 @@ def get_topic_count():
     except Exception as e:
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
-def create_analysis_prompt(answers_to_grade):
-    # Convert the list of answers into a string for the prompt
-    answers_str = json.dumps(answers_to_grade, indent=2)
-    return f"""
+ANALYSIS_SYSTEM_PROMPT = """
 ### INSTRUCTIONS ###
 
 You are an expert Teaching Assistant. Your job is to grade a student's descriptive answers.
@@ -627,8 +1218,13 @@ Provide a "score" (1 for a correct/good-effort answer, 0 for a wrong/missing ans
 
 IMPORTANT: Respond ONLY with a valid JSON array of objects, one for each question.
 
-Example response: [{{"score": 1, "feedback": "Correct!"}}, {{"score": 0, "feedback": "This is incorrect..."}}]
+Example response: [{"score": 1, "feedback": "Correct!"}, {"score": 0, "feedback": "This is incorrect..."}]
+"""
 
+def create_analysis_prompt(answers_to_grade):
+    # Convert the list of answers into a string for the prompt
+    answers_str = json.dumps(answers_to_grade, indent=2)
+    return ANALYSIS_SYSTEM_PROMPT, f"""
 ### TASK ###
 
 Grade the following answers:
@@ -637,6 +1233,46 @@ Grade the following answers:
 
 """
 
+def grade_chunk(chunk, route):
+    """Grade one chunk of answers in a single generation; raises ValueError on a bad result"""
+    system_prompt, prompt = create_analysis_prompt(chunk)
+    response_str = get_local_llm_response(
+        prompt, system_prompt=system_prompt, profile="grading", route=route, json_schema=grading_schema(len(chunk))
+    )
+    graded = parse_json_response(response_str)
+    if not isinstance(graded, list) or len(graded) != len(chunk):
+        raise ValueError("No valid JSON array found in LLM response.")
+    return graded
+
+def grade_chunk_with_retry(chunk, route):
+    """Retry a failed chunk on its own; if it still fails to parse, grade its answers one by one.
+    Busy or unreachable servers get the same jittered backoff (and Retry-After) as the client."""
+    for attempt in range(GRADING_CHUNK_RETRIES + 1):
+        try:
+            return grade_chunk(chunk, route)
+        except (LLMBusyError, LLMConnectionError, ValueError) as e:
+            print(f"Grading chunk of {len(chunk)} failed (attempt {attempt + 1}): {e}")
+            error = e
+        if attempt < GRADING_CHUNK_RETRIES and not isinstance(error, ValueError):
+            delay = retry_delay(error, attempt)
+            if delay is None:
+                break
+            time.sleep(delay)
+    if isinstance(error, ValueError) and len(chunk) > 1:
+        return [grade_chunk_with_retry([answer], route)[0] for answer in chunk]
+    if isinstance(error, ValueError):
+        # Leave it ungraded (score 0) rather than failing the whole quiz
+        return [{"score": 0, "feedback": "This answer could not be graded automatically.", "graded": False}]
+    raise error
+
+def grade_answers(answers, route):
+    """Grade answers in bounded chunks that run in parallel; results keep the input order"""
+    chunks = [answers[i:i + GRADING_CHUNK_SIZE] for i in range(0, len(answers), GRADING_CHUNK_SIZE)]
+    if len(chunks) == 1:
+        return grade_chunk_with_retry(chunks[0], route)
+    futures = [submit_llm_task("grading", grade_chunk_with_retry, chunk, route) for chunk in chunks]
+    return [answer for graded in fanout_results(futures) for answer in graded]
+
 @roadmap_bp.route("/analyze_answers", methods=["POST"])
 @token_required
 def analyze_answers():
@@ -646,26 +1282,51 @@ def analyze_answers():
         return jsonify({"error": "No answers provided"}), 400
     
     try:
-        prompt = create_analysis_prompt(answers_to_grade)
-        response_str = get_local_llm_response(prompt)
-        
-        # Check if the response is an error message from the LLM server
-        if response_str.startswith("Error connecting to local LLM server"):
-            return jsonify({
-                "error": "Local LLM server is not running. Please start the LLM server on port 8080 and try again."
-            }), 503
-        
-        # Find the JSON array
-        match = re.search(r'\[.*\]', response_str, re.DOTALL)
-        if not match:
-            raise Exception("No valid JSON array found in LLM response.")
-            
-        graded_results = json.loads(match.group(0))
+        graded_results = grade_answers(answers_to_grade, resolve_route())
         return jsonify({"graded_answers": graded_results})
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
+    except LLMConnectionError as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         return jsonify({"error": f"An error occurred while analyzing answers: {str(e)}"}), 500
 
 # --- Flashcard Generation Endpoint ---
+def build_note_flashcards(user_email, topic, term, text, regenerate=False):
+    """Generate flashcards for a sub-details note and store them; raises ValueError on bad output"""
+    system_prompt, prompt = create_note_flashcards_prompt(text)
+    response_str = get_local_llm_response(
+        prompt, system_prompt=system_prompt, profile="flashcards", cache=True, regenerate=regenerate,
+        json_schema=flashcards_schema(8, 20)
+    )
+    
+    # Parse JSON array from response
+    try:
+        flashcards = parse_json_response(response_str)
+    except Exception:
+        raise ValueError("Could not parse flashcards from AI response")
+    
+    if not isinstance(flashcards, list):
+        raise ValueError("Invalid flashcards format")
+    
+    # Save flashcards to database for future use
+    DatabaseOperations.save_note(
+        user_email, 
+        topic, 
+        'flashcards', 
+        flashcards, 
+        {"term": term, "source": "sub_details"}
+    )
+    return flashcards
+
+@register_job_handler("note_flashcards")
+def run_note_flashcards_job(job):
+    flashcards = build_note_flashcards(
+        job.user_email, job.payload['topic'], job.payload['term'], job.payload['text'],
+        regenerate=job.payload.get('regenerate', False)
+    )
+    return {"flashcards": flashcards, "cached": False}
+
 @roadmap_bp.route("/generate_flashcards_for_note", methods=["POST"])
 @token_required
 def generate_flashcards_for_note():
@@ -702,47 +1363,22 @@ def generate_flashcards_for_note():
         text = re.sub('<[^<]+?>', ' ', content_html)
         text = re.sub('\\s+', ' ', text).strip()
         
-        # 3. Generate flashcards using AI
-        prompt = f"""
-### INSTRUCTIONS ###
-You are an expert educator. Create flashcards from the provided note text.
-Return ONLY a valid JSON array. Each item must be an object with fields: "question" and "answer".
-Generate as many cards as needed to cover key points (typically 8-20 based on content importance).
-Avoid duplicates; make questions concise and answers clear.
-
-### NOTE TEXT ###
-{text}
-"""
-        response_str = get_local_llm_response(prompt)
-        
-        # Check for LLM connection error
-        if response_str.startswith("Error connecting to local LLM server"):
-            return jsonify({"error": "AI is offline. Please start the LLM server on port 8080 and try again."}), 503
-        
-        # Parse JSON array from response
-        match = re.search(r'\\[.*\\]', response_str, re.DOTALL)
-        if not match:
-            try:
-                flashcards = json.loads(response_str)
-            except Exception:
-                return jsonify({"error": "Could not parse flashcards from AI response"}), 500
-        else:
-            flashcards = json.loads(match.group(0))
-        
-        if not isinstance(flashcards, list):
-            return jsonify({"error": "Invalid flashcards format"}), 500
-        
-        # 4. Save flashcards to database for future use
-        DatabaseOperations.save_note(
-            user_email, 
-            topic, 
-            'flashcards', 
-            flashcards, 
-            {"term": term, "source": "sub_details"}
-        )
+        # 3. Generate flashcards using AI (optionally as a background job)
+        if wants_background(data.get('background')):
+            job_id = enqueue_job("note_flashcards", user_email, {
+                "topic": topic, "term": term, "text": text, "regenerate": bool(data.get('regenerate'))
+            })
+            return job_accepted_response(job_id)
+
+        try:
+            flashcards = build_note_flashcards(user_email, topic, term, text, regenerate=bool(data.get('regenerate')))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 500
         
         return jsonify({"flashcards": flashcards, "cached": False}), 200
         
+    except LLMBusyError as e:
+        return jsonify({"error": str(e), "retry_after": e.retry_after}), 429, {"Retry-After": str(e.retry_after)}
     except LLMConnectionError as e:
         return jsonify({"error": str(e)}), 503
     except Exception as e:
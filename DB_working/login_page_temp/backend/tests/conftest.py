@@ -0,0 +1,81 @@
+# tests/conftest.py
+# The app runs against an in-memory MongoDB (mongomock) and the fake llama.cpp server,
+# so the suite needs neither service. Configuration is read at import time, so the
+# environment is set up here before any backend module is imported.
+import os
+import sys
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+mongomock = pytest.importorskip("mongomock")
+import pymongo
+pymongo.MongoClient = mongomock.MongoClient
+
+from fake_llama_server import FakeLlamaServer
+
+fake_llm = FakeLlamaServer(slots=4, prompt_ms=0.01, token_ms=0.2).start()
+os.environ.update({
+    "LLAMA_CPP_BACKENDS": fake_llm.base_url,
+    "MONGO_URI": "mongodb://localhost",
+    "DB_NAME": "tests",
+    "SECRET_KEY": "test-secret-key-of-at-least-32-bytes",
+    "MAIL_PORT": "25",
+    "LLM_CACHE_PERSIST": "False",
+    "JOB_WORKERS": "0",
+    # Tests of the semantic cache build their own instance
+    "SEMANTIC_CACHE_ENABLED": "False",
+    "LLM_RETRY_BASE_DELAY": "0.01",
+    "LLM_RETRY_MAX_DELAY": "0.05",
+})
+
+import jwt
+import call
+from db_operations import db, jobs_collection, DatabaseOperations
+from jobs import JobWorker, job_handlers
+from llm_cache import llm_cache
+from topic_index import topic_index
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    """Every test starts with empty collections and caches"""
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+    llm_cache.clear()
+    topic_index._users.clear()
+    fake_llm.config["error_rate"] = 0.0
+    yield
+
+@pytest.fixture
+def client():
+    return call.app.test_client()
+
+@pytest.fixture
+def auth():
+    """auth(email) -> Authorization header for that user"""
+    def headers(email="user@example.com"):
+        token = jwt.encode({"email": email}, os.environ["SECRET_KEY"], algorithm="HS256")
+        return {"Authorization": f"Bearer {token}"}
+    return headers
+
+@pytest.fixture
+def llm_calls():
+    """llm_calls() -> chat completions the fake server has answered since the test started"""
+    start = fake_llm.completions
+    return lambda: fake_llm.completions - start
+
+@pytest.fixture
+def run_job():
+    """run_job(job_id) claims and runs a queued job in this thread, as a worker would;
+    returns False if it was not claimable (e.g. cancelled)"""
+    def run(job_id):
+        worker = JobWorker(0)
+        DatabaseOperations.claim_job(worker.worker_id, list(job_handlers), 60)
+        # mongomock returns None from find_one_and_update with a projection, so read the claim back
+        job = jobs_collection.find_one({"job_id": job_id}, {"_id": 0})
+        if job["status"] != "running":
+            return False
+        worker._execute(job)
+        return True
+    return run
@@ -0,0 +1,46 @@
+# tests/test_circuit_breaker.py
+import time
+import pytest
+from utils import CircuitBreaker, LLMConnectionError, llm_breaker
+
+def test_opens_after_consecutive_failures_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record(LLMConnectionError("down"))
+    breaker.record()
+    breaker.record(LLMConnectionError("down"))
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record(LLMConnectionError("down"))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(LLMConnectionError):
+        breaker.before_call()
+    assert breaker.get_stats()["rejected"] == 1
+
+def test_answers_that_are_not_outages_do_not_count():
+    breaker = CircuitBreaker(failure_threshold=1)
+    breaker.record(ValueError("bad JSON"))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_half_open_lets_one_trial_call_decide():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record(LLMConnectionError("down"))
+    time.sleep(0.1)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(LLMConnectionError):
+        breaker.before_call()
+    breaker.record(LLMConnectionError("still down"))
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.1)
+    breaker.before_call()
+    breaker.record()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_open_circuit_answers_503_without_calling_the_llm(client, auth, llm_calls):
+    for _ in range(llm_breaker.failure_threshold):
+        llm_breaker.record_failure()
+    try:
+        response = client.post("/generate_roadmap", json={"query": "Graph Theory"}, headers=auth())
+    finally:
+        llm_breaker.record_success()
+    assert response.status_code == 503
+    assert llm_calls() == 0
@@ -0,0 +1,54 @@
+# tests/test_content_library.py
+from db_operations import DatabaseOperations, content_library_collection, library_key
+
+def test_library_key_ignores_only_case_and_whitespace():
+    assert library_key("  Cloud   Computing ") == library_key("cloud computing")
+    assert len({library_key(topic) for topic in ("C", "C#", "C++", "c")}) == 3
+
+def test_similar_names_do_not_share_roadmaps(client, auth, llm_calls):
+    first = client.post("/generate_roadmap", json={"query": "C"}, headers=auth("a@example.com"))
+    assert first.status_code == 200
+    for topic in ("C#", "C++"):
+        response = client.post("/generate_roadmap", json={"query": topic}, headers=auth("b@example.com"))
+        assert response.status_code == 200
+        assert response.get_json()["topic"] == topic
+        assert all(step["title"].startswith(topic) for step in response.get_json()["topics"])
+    assert llm_calls() == 3
+    assert content_library_collection.count_documents({"kind": "roadmap"}) == 3
+
+def test_same_topic_is_shared_across_users(client, auth, llm_calls):
+    client.post("/generate_roadmap", json={"query": "Rust"}, headers=auth("a@example.com"))
+    response = client.post("/generate_roadmap", json={"query": "rust"}, headers=auth("b@example.com"))
+    assert response.status_code == 200
+    assert llm_calls() == 1
+
+def library_doc():
+    return content_library_collection.find_one({}, {"_id": 0})
+
+def test_update_note_copies_on_write():
+    sections = [{"title": "Intro", "content": "shared"}]
+    DatabaseOperations.save_note("a@example.com", "Rust", "details", sections)
+    DatabaseOperations.save_note("b@example.com", "Rust", "details", sections)
+    assert library_doc()["refcount"] == 2
+
+    edited = [{"title": "Intro", "content": "my own notes"}]
+    DatabaseOperations.update_note("a@example.com", "Rust", "details", edited)
+    assert DatabaseOperations.get_latest_note("a@example.com", "Rust", "details")["content"] == edited
+    assert DatabaseOperations.get_latest_note("b@example.com", "Rust", "details")["content"] == sections
+    assert library_doc()["refcount"] == 1
+
+    DatabaseOperations.update_note("b@example.com", "Rust", "details", edited)
+    assert content_library_collection.count_documents({}) == 0
+
+def test_update_roadmap_copies_on_write():
+    steps = [{"id": 1, "title": "Basics", "description": ""}]
+    DatabaseOperations.save_roadmap("a@example.com", "Rust", {"topics": steps})
+    DatabaseOperations.save_roadmap("b@example.com", "Rust", {"topics": steps})
+
+    roadmap = DatabaseOperations.get_roadmap_by_topic("a@example.com", "Rust")["roadmap_data"]
+    roadmap["topics"] = steps + [{"id": 2, "title": "Ownership", "description": ""}]
+    DatabaseOperations.update_roadmap("a@example.com", "Rust", roadmap)
+
+    assert len(DatabaseOperations.get_roadmap_by_topic("a@example.com", "Rust")["roadmap_data"]["topics"]) == 2
+    assert DatabaseOperations.get_roadmap_by_topic("b@example.com", "Rust")["roadmap_data"]["topics"] == steps
+    assert library_doc()["refcount"] == 1
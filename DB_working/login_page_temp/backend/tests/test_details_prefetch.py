@@ -0,0 +1,34 @@
+# tests/test_details_prefetch.py
+import roadmap_routes
+from db_operations import DatabaseOperations
+
+def create_roadmap(client, auth, topic="Graph Theory"):
+    response = client.post("/generate_roadmap", json={"query": topic, "prefetch_details": True}, headers=auth())
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_first_topics_are_pregenerated_and_served_without_a_call(client, auth, llm_calls, run_job):
+    roadmap = create_roadmap(client, auth)
+    assert run_job(roadmap["prefetch_job_id"])
+    titles = [item["title"] for item in roadmap["topics"]][:3]
+    for title in titles:
+        note = DatabaseOperations.get_latest_note("user@example.com", title, "details")
+        assert note["metadata"]["speculative"] is True
+    calls = llm_calls()
+    response = client.post("/generate_details", json={"title": titles[0]}, headers=auth())
+    assert response.status_code == 200 and response.get_json()["details"]
+    assert llm_calls() == calls
+
+def test_prefetch_waits_while_the_llm_is_busy(client, auth, monkeypatch, run_job):
+    roadmap = create_roadmap(client, auth)
+    monkeypatch.setattr(roadmap_routes.llm_scheduler, "has_idle_capacity", lambda: False)
+    assert run_job(roadmap["prefetch_job_id"])
+    job = DatabaseOperations.get_job(roadmap["prefetch_job_id"], "user@example.com")
+    assert job["status"] == "queued"
+    assert not DatabaseOperations.get_latest_note("user@example.com", roadmap["topics"][0]["title"], "details")
+
+def test_deleting_the_roadmap_cancels_its_prefetch(client, auth, run_job):
+    roadmap = create_roadmap(client, auth)
+    response = client.delete("/delete_roadmap", json={"topic": roadmap["topic"]}, headers=auth())
+    assert response.status_code == 200
+    assert not run_job(roadmap["prefetch_job_id"])
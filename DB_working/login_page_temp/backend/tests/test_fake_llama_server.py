@@ -0,0 +1,33 @@
+# tests/test_fake_llama_server.py
+import json
+from fake_llama_server import canned_response
+from roadmap_routes import create_roadmap_prompt, create_details_prompt, create_sub_details_prompt, create_quiz_prompt
+
+def answer(prompts):
+    system_prompt, prompt = prompts
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}]
+    return canned_response(messages, None)
+
+def test_roadmap_answers_follow_the_requested_topic():
+    go = json.loads(answer(create_roadmap_prompt("golang")))
+    rust = json.loads(answer(create_roadmap_prompt("rust")))
+    assert go["corrected_topic"] == "Golang"
+    assert rust["corrected_topic"] == "Rust"
+    assert go["topics"] != rust["topics"]
+
+def test_details_answers_follow_the_requested_topic():
+    first = answer(create_details_prompt("Goroutines"))
+    second = answer(create_details_prompt("Channels"))
+    assert "Goroutines Section 1" in first
+    assert "Channels Section 1" in second
+
+def test_topic_is_taken_from_the_task_not_the_instructions():
+    assert "Closures concept" not in answer(create_sub_details_prompt("Closures", "JavaScript"))
+    quiz = answer(create_quiz_prompt("Rust", 5, "MCQ"))
+    assert json.loads(quiz)["questions"]
+
+def test_generated_roadmaps_for_different_topics_do_not_conflict(client, auth):
+    first = client.post("/generate_roadmap", json={"query": "golang"}, headers=auth())
+    second = client.post("/generate_roadmap", json={"query": "rust"}, headers=auth())
+    assert first.status_code == 200 and first.get_json()["topic"] == "Golang"
+    assert second.status_code == 200 and second.get_json()["topic"] == "Rust"
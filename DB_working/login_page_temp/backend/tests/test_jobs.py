@@ -0,0 +1,34 @@
+# tests/test_jobs.py
+from db_operations import DatabaseOperations
+from jobs import enqueue_job, job_handlers
+from utils import LLMConnectionError
+
+def test_background_quiz_is_queued_then_run(client, auth, run_job):
+    response = client.post(
+        "/generate_quiz", json={"topic": "Graph Theory", "num_questions": 5, "background": True}, headers=auth()
+    )
+    assert response.status_code == 202
+    job_id = response.get_json()["job_id"]
+    assert response.headers["Location"] == f"/jobs/{job_id}"
+    assert client.get(f"/jobs/{job_id}", headers=auth()).get_json()["status"] == "queued"
+
+    assert run_job(job_id)
+    job = client.get(f"/jobs/{job_id}", headers=auth()).get_json()
+    assert job["status"] == "done"
+    assert len(job["result"]["questions"]) == 5
+    assert client.get(f"/jobs/{job_id}", headers=auth("other@example.com")).status_code == 404
+
+def test_cancelled_job_is_not_run(client, auth, run_job):
+    job_id = enqueue_job("quiz", "user@example.com", {"topic": "Graph Theory", "num_questions": 5, "quiz_type": "MCQ"})
+    assert client.delete(f"/jobs/{job_id}", headers=auth()).status_code == 200
+    assert not run_job(job_id)
+
+def test_unavailable_llm_is_retried_later(monkeypatch, run_job):
+    def unavailable(job):
+        raise LLMConnectionError("AI server is unavailable.")
+    monkeypatch.setitem(job_handlers, "quiz", unavailable)
+    job_id = enqueue_job("quiz", "user@example.com", {}, max_attempts=3)
+    assert run_job(job_id)
+    job = DatabaseOperations.get_job(job_id, "user@example.com")
+    assert job["status"] == "queued" and job["attempts"] == 1
+    assert "unavailable" in job["error"]
@@ -0,0 +1,44 @@
+# tests/test_llm_backends.py
+import pytest
+from llm_backends import LLMBackendPool, NoHealthyBackendError
+
+URLS = ["http://a:8080", "http://b:8080", "http://c:8080"]
+
+class HealthSession:
+    """Stands in for requests.Session in probe(): answers /health per backend"""
+    def __init__(self, statuses):
+        self.statuses = statuses
+
+    def get(self, url, timeout=None):
+        status = self.statuses[url.rsplit("/", 1)[0]]
+        return type("Response", (), {"status_code": status, "close": lambda self: None})()
+
+def test_calls_go_to_the_least_loaded_backend():
+    pool = LLMBackendPool(URLS)
+    held = [pool.acquire() for _ in range(3)]
+    assert {backend.base_url for backend in held} == set(URLS)
+    pool.release(held[1])
+    assert pool.acquire() is held[1]
+
+def test_sticky_key_keeps_a_conversation_on_one_backend():
+    pool = LLMBackendPool(URLS)
+    first = pool.acquire("user@example.com")
+    pool.acquire()
+    assert pool.acquire("user@example.com") is first
+
+def test_failing_backend_is_ejected_and_readmitted_by_a_probe():
+    pool = LLMBackendPool(URLS[:2], eject_after=2)
+    bad = pool.backends[0]
+    for _ in range(2):
+        bad.outstanding += 1
+        pool.release(bad, ok=False)
+    assert not bad.healthy
+    assert all(pool.acquire() is pool.backends[1] for _ in range(3))
+    pool.probe(HealthSession({URLS[0]: 200, URLS[1]: 200}))
+    assert bad.healthy and bad.consecutive_failures == 0
+
+def test_no_healthy_backend_raises():
+    pool = LLMBackendPool(URLS[:1], eject_after=1)
+    pool.probe(HealthSession({URLS[0]: 503}))
+    with pytest.raises(NoHealthyBackendError):
+        pool.acquire()
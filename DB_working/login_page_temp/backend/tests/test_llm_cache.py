@@ -0,0 +1,33 @@
+# tests/test_llm_cache.py
+import time
+from llm_cache import LLMResponseCache, llm_cache
+from utils import get_local_llm_response
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = LLMResponseCache(max_entries=2, persist=False)
+    cache.set("a", "answer a")
+    cache.set("b", "answer b")
+    cache.get("a")
+    cache.set("c", "answer c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "answer a" and cache.get("c") == "answer c"
+
+def test_entries_expire_after_the_ttl():
+    cache = LLMResponseCache(ttl_seconds=0.05, persist=False)
+    cache.set("a", "answer a")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+def test_mongo_tier_serves_what_the_memory_tier_dropped():
+    cache = LLMResponseCache(persist=True)
+    cache.set("a", "answer a", {"model": "local-model"})
+    cache.clear()
+    assert cache.get("a") == "answer a"
+    assert cache.get_stats()["mongo_hits"] == 1
+
+def test_regenerate_bypasses_the_lookup_but_refreshes_the_entry(llm_calls):
+    get_local_llm_response("Define entropy", profile="chat", cache=True)
+    fresh = get_local_llm_response("Define entropy", profile="chat", cache=True, regenerate=True)
+    assert llm_calls() == 2
+    assert get_local_llm_response("Define entropy", profile="chat", cache=True) == fresh
+    assert llm_calls() == 2
@@ -0,0 +1,32 @@
+# tests/test_llm_profiles.py
+import pytest
+from llm_cache import make_cache_key
+from llm_profiles import get_generation_profile, JSON_STOPS
+from utils import _build_chat_request, get_local_llm_response
+
+def payload(profile, prompt="Explain gradient descent"):
+    return _build_chat_request(prompt, get_generation_profile(profile), system_prompt="You are a tutor.")
+
+def test_profile_sets_budget_stops_and_thinking():
+    data = payload("details")
+    assert data["max_tokens"] == 1536
+    assert data["stop"] == JSON_STOPS
+    assert data["chat_template_kwargs"] == {"enable_thinking": False}
+    assert "stop" not in payload("roadmap")
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError):
+        get_generation_profile("essay")
+
+def test_cache_key_depends_on_the_profile_not_on_transport_fields():
+    assert make_cache_key(payload("chat")) != make_cache_key(payload("explain"))
+    assert make_cache_key(payload("details")) != make_cache_key(payload("quiz"))
+    streamed = dict(payload("chat"), stream=True, cache_prompt=False)
+    assert make_cache_key(streamed) == make_cache_key(payload("chat"))
+
+def test_cached_answer_is_reused_only_under_the_same_profile(llm_calls):
+    first = get_local_llm_response("Explain gradient descent", profile="chat", cache=True)
+    assert get_local_llm_response("Explain gradient descent", profile="chat", cache=True) == first
+    assert llm_calls() == 1
+    get_local_llm_response("Explain gradient descent", profile="explain", cache=True)
+    assert llm_calls() == 2
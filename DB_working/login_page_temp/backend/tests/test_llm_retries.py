@@ -0,0 +1,64 @@
+# tests/test_llm_retries.py
+import pytest
+import roadmap_routes
+import utils
+from config import GRADING_CHUNK_RETRIES, LLM_RETRY_AFTER_MAX, LLM_RETRY_MAX_DELAY
+from llm_scheduler import LLMBusyError
+from utils import LLMConnectionError, _TransientLLMError, parse_retry_after, retry_delay
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+    assert parse_retry_after(None) is None
+
+def test_retry_delay_is_jittered_backoff_at_least_retry_after():
+    assert 0 <= retry_delay(LLMConnectionError("down"), 5) <= LLM_RETRY_MAX_DELAY
+    assert retry_delay(_TransientLLMError("down", retry_after=2), 0) == 2
+    assert retry_delay(LLMBusyError("busy", retry_after=LLM_RETRY_AFTER_MAX + 1), 0) is None
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(roadmap_routes.time, "sleep", recorded.append)
+    return recorded
+
+def failing_grader(error, monkeypatch):
+    calls = []
+
+    def grade_chunk(chunk, route):
+        calls.append(chunk)
+        raise error
+    monkeypatch.setattr(roadmap_routes, "grade_chunk", grade_chunk)
+    return calls
+
+def test_busy_grading_chunk_waits_for_retry_after(monkeypatch, sleeps):
+    calls = failing_grader(LLMBusyError("busy", retry_after=1), monkeypatch)
+    with pytest.raises(LLMBusyError):
+        roadmap_routes.grade_chunk_with_retry([{"question": "Q"}], "test")
+    assert len(calls) == GRADING_CHUNK_RETRIES + 1
+    assert sleeps == [1] * GRADING_CHUNK_RETRIES
+
+def test_long_retry_after_is_not_waited_out(monkeypatch, sleeps):
+    calls = failing_grader(LLMBusyError("busy", retry_after=LLM_RETRY_AFTER_MAX + 5), monkeypatch)
+    with pytest.raises(LLMBusyError):
+        roadmap_routes.grade_chunk_with_retry([{"question": "Q"}], "test")
+    assert len(calls) == 1 and sleeps == []
+
+def test_bad_output_is_retried_without_waiting(monkeypatch, sleeps):
+    failing_grader(ValueError("bad JSON"), monkeypatch)
+    graded = roadmap_routes.grade_chunk_with_retry([{"question": "Q"}], "test")
+    assert graded[0]["graded"] is False
+    assert sleeps == []
+
+def test_transient_llm_errors_back_off(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(utils.time, "sleep", recorded.append)
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise _TransientLLMError("down", retry_after=0.5)
+        return "ok"
+    assert utils._call_with_retries(flaky) == "ok"
+    assert len(recorded) == 2 and all(delay >= 0.5 for delay in recorded)
@@ -0,0 +1,110 @@
+# tests/test_llm_scheduler.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from llm_scheduler import LLMScheduler, LLMBusyError, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, PRIORITY_SPECULATIVE
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        yield pool
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.001)
+
+def test_full_queue_is_rejected_and_a_queue_timeout_is_busy(executor):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue_depth=1, queue_timeout=0.2)
+    assert scheduler.acquire() == 0.0
+    queued = executor.submit(scheduler.acquire)
+    wait_until(lambda: scheduler._queue)
+    with pytest.raises(LLMBusyError) as rejected:
+        scheduler.acquire()
+    assert rejected.value.retry_after >= 1
+    with pytest.raises(LLMBusyError):
+        queued.result()
+    assert scheduler.get_stats()["rejected"] == 1 and scheduler.get_stats()["timed_out"] == 1
+
+def test_released_slot_goes_to_the_highest_priority_waiter():
+    scheduler = LLMScheduler(max_concurrency=1, queue_timeout=5)
+    scheduler.acquire()
+    order = []
+
+    def wait(priority, name):
+        scheduler.acquire(priority)
+        order.append(name)
+        scheduler.release()
+    waiters = []
+    for count, (priority, name) in enumerate([(PRIORITY_BACKGROUND, "pdf"), (PRIORITY_INTERACTIVE, "chat")], 1):
+        waiters.append(threading.Thread(target=wait, args=(priority, name)))
+        waiters[-1].start()
+        wait_until(lambda: len(scheduler._queue) == count)
+    scheduler.release()
+    for waiter in waiters:
+        waiter.join()
+    assert order == ["chat", "pdf"]
+
+def test_speculative_work_only_takes_idle_slots():
+    scheduler = LLMScheduler(max_concurrency=2, speculative_reserved_slots=1)
+    assert scheduler.has_idle_capacity()
+    scheduler.acquire()
+    with pytest.raises(LLMBusyError):
+        scheduler.acquire(PRIORITY_SPECULATIVE)
+    scheduler.release()
+    scheduler.acquire(PRIORITY_SPECULATIVE)
+
+def test_submit_holds_one_slot_that_inner_calls_reuse(executor):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue_depth=4, queue_timeout=1)
+
+    def task():
+        # Would deadlock if the call inside the task queued for a second slot
+        with scheduler.slot() as waited:
+            return waited, scheduler.get_stats()["active"]
+
+    assert scheduler.submit(executor, PRIORITY_INTERACTIVE, task).result(timeout=5) == (0.0, 1)
+    assert scheduler.get_stats()["active"] == 0
+
+def test_submit_with_a_full_queue_fails_without_queuing(executor):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue_depth=0, queue_timeout=1)
+    scheduler.acquire()
+    ran = threading.Event()
+    future = scheduler.submit(executor, PRIORITY_INTERACTIVE, ran.set)
+    with pytest.raises(LLMBusyError):
+        future.result(timeout=0)
+    assert not ran.is_set()
+    scheduler.release()
+
+def test_submitted_work_waits_in_priority_order(executor):
+    scheduler = LLMScheduler(max_concurrency=1, max_queue_depth=4, queue_timeout=5)
+    scheduler.acquire()
+    order = []
+    submitters = [
+        threading.Thread(target=lambda p=p: scheduler.submit(executor, p, order.append, p).result(timeout=5))
+        for p in (PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE)
+    ]
+    submitters[0].start()
+    while scheduler.get_stats()["queue_depth"] < 1:
+        pass
+    submitters[1].start()
+    while scheduler.get_stats()["queue_depth"] < 2:
+        pass
+    scheduler.release()
+    for thread in submitters:
+        thread.join(5)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND]
+
+def test_chunked_grading_keeps_answer_order(client, auth):
+    answers = [{"question": f"Q{i}", "user_answer": "A", "ideal_answer": "A"} for i in range(8)]
+    response = client.post("/analyze_answers", json={"answers": answers}, headers=auth())
+    assert response.status_code == 200
+    assert len(response.get_json()["graded_answers"]) == 8
+
+def test_unpacked_explanations_cover_every_item(client, auth):
+    items = [{"type": "mcq", "question": f"Q{i}", "user_answer": "a", "correct_answer": "b"} for i in range(6)]
+    response = client.post("/explain_quiz_batch", json={"items": items}, headers=auth())
+    assert response.status_code == 200
+    explanations = response.get_json()["explanations"]
+    assert [result["index"] for result in explanations] == list(range(6))
+    assert all(result.get("explanation") for result in explanations)
@@ -0,0 +1,40 @@
+# tests/test_llm_schemas.py
+import roadmap_routes
+from llm_schemas import ROADMAP_SCHEMA, MCQ_QUESTION_SCHEMA, DESCRIPTIVE_QUESTION_SCHEMA, quiz_schema
+from utils import parse_json_response
+
+def test_quiz_schema_fixes_the_count_and_the_kinds():
+    questions = quiz_schema(5, 5, 0)["properties"]["questions"]
+    assert questions["minItems"] == questions["maxItems"] == 5
+    assert questions["items"] is MCQ_QUESTION_SCHEMA
+    assert quiz_schema(3, 0, 3)["properties"]["questions"]["items"] is DESCRIPTIVE_QUESTION_SCHEMA
+    assert quiz_schema(4, 3, 1)["properties"]["questions"]["items"] == {
+        "anyOf": [MCQ_QUESTION_SCHEMA, DESCRIPTIVE_QUESTION_SCHEMA]
+    }
+
+def test_unconstrained_answers_still_parse():
+    assert parse_json_response('```json\n{"topics": []}\n```') == {"topics": []}
+    assert parse_json_response('Here you go: [{"term": "x"}] Enjoy!') == [{"term": "x"}]
+
+def spy_on_schemas(monkeypatch):
+    schemas = []
+    real = roadmap_routes.async_get_local_llm_response
+
+    async def spy(prompt, **kwargs):
+        schemas.append(kwargs.get("json_schema"))
+        return await real(prompt, **kwargs)
+    monkeypatch.setattr(roadmap_routes, "async_get_local_llm_response", spy)
+    return schemas
+
+def test_routes_send_their_schema(client, auth, monkeypatch):
+    schemas = spy_on_schemas(monkeypatch)
+    assert client.post("/generate_roadmap", json={"query": "Graph Theory"}, headers=auth()).status_code == 200
+    assert schemas == [ROADMAP_SCHEMA]
+
+    schemas.clear()
+    response = client.post(
+        "/generate_quiz", json={"topic": "Graph Theory", "num_questions": 10, "quiz_type": "Both"}, headers=auth()
+    )
+    assert response.status_code == 200
+    counts = [schema["properties"]["questions"]["maxItems"] for schema in schemas]
+    assert sum(counts) == len(response.get_json()["questions"]) == 10
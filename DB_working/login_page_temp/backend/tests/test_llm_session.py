@@ -0,0 +1,22 @@
+# tests/test_llm_session.py
+import os
+from concurrent.futures import ThreadPoolExecutor
+from utils import get_llm_session, get_llm_client_stats, get_local_llm_response
+
+def fake_server_pool():
+    pools = [pool for pool in get_llm_client_stats()["pools"] if pool["host"] == os.environ["LLAMA_CPP_BACKENDS"]]
+    return pools[0] if pools else {"connections_opened": 0, "requests_sent": 0}
+
+def test_one_session_is_shared_by_every_thread():
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        sessions = set(pool.map(lambda _: id(get_llm_session()), range(8)))
+    assert sessions == {id(get_llm_session())}
+
+def test_sequential_calls_reuse_a_kept_alive_connection():
+    get_local_llm_response("Define a graph")
+    before = fake_server_pool()
+    for index in range(5):
+        get_local_llm_response(f"Define graph term {index}")
+    after = fake_server_pool()
+    assert after["requests_sent"] - before["requests_sent"] >= 5
+    assert after["connections_opened"] - before["connections_opened"] <= 1
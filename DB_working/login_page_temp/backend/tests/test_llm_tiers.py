@@ -0,0 +1,51 @@
+# tests/test_llm_tiers.py
+# The suite configures only large-tier backends. Small-tier profiles (details,
+# quiz_explain) are then served by "large" by design, which is not a fallback;
+# a real fallback is simulated by giving the small tier a backend that is down.
+import asyncio
+import pytest
+from llm_async import async_get_local_llm_response
+from llm_backends import LLMBackend
+from llm_metrics import llm_metrics
+from utils import get_local_llm_response, stream_local_llm_response, llm_tiers
+
+@pytest.fixture
+def small_tier_down(monkeypatch):
+    pool = llm_tiers.tiers["small"].pool
+    backend = LLMBackend("http://127.0.0.1:9")
+    backend.healthy = False
+    monkeypatch.setattr(pool, "backends", [backend])
+    monkeypatch.setattr(pool, "health_interval", 0)
+
+@pytest.mark.parametrize("profile", ["default", "quiz_explain", "details"])
+def test_answers_of_the_usual_tier_are_cached(llm_calls, profile):
+    for _ in range(2):
+        get_local_llm_response("Tier test", profile=profile, cache=True)
+    assert llm_calls() == 1
+    served = [call for call in llm_metrics.recent_calls() if call["outcome"] == "ok"][-1]
+    assert served["tier"] == "large"
+
+def test_streamed_single_tier_answers_are_cached(llm_calls):
+    for _ in range(2):
+        "".join(stream_local_llm_response("Tier test", profile="quiz_explain", cache=True))
+    assert llm_calls() == 1
+
+def test_fallback_answers_are_not_cached(llm_calls, small_tier_down):
+    for _ in range(2):
+        get_local_llm_response("Tier test", profile="quiz_explain", cache=True)
+    assert llm_calls() == 2
+
+def test_streamed_fallback_answers_are_not_cached(llm_calls, small_tier_down):
+    for _ in range(2):
+        "".join(stream_local_llm_response("Tier test", profile="quiz_explain", cache=True))
+    assert llm_calls() == 2
+
+def test_async_fallback_answers_are_not_cached(llm_calls, small_tier_down):
+    for _ in range(2):
+        asyncio.run(async_get_local_llm_response("Tier test", profile="quiz_explain", cache=True))
+    assert llm_calls() == 2
+
+def test_async_single_tier_answers_are_cached(llm_calls):
+    for _ in range(2):
+        asyncio.run(async_get_local_llm_response("Tier test", profile="details", cache=True))
+    assert llm_calls() == 1
@@ -0,0 +1,26 @@
+# tests/test_monitoring.py
+import pytest
+from llm_metrics import LLMMetrics, llm_metrics
+
+@pytest.mark.parametrize("path", ["/llm_status", "/metrics"])
+def test_monitoring_is_served_to_allowed_addresses_only(client, path):
+    assert client.get(path).status_code == 200
+    assert client.get(path, environ_base={"REMOTE_ADDR": "203.0.113.5"}).status_code == 403
+
+def test_calls_are_counted_per_route_with_tokens_and_latency(client, auth):
+    assert client.post("/generate_roadmap", json={"query": "Graph Theory"}, headers=auth()).status_code == 200
+    call = llm_metrics.recent_calls()[-1]
+    assert call["route"] == "roadmap_bp.generate_roadmap" and call["outcome"] == "ok"
+    assert call["prompt_tokens"] and call["completion_tokens"] and call["duration"] >= 0
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'llm_calls_total{route="roadmap_bp.generate_roadmap",profile="roadmap",outcome="ok"}' in text
+    assert 'llm_tokens_total{route="roadmap_bp.generate_roadmap",kind="completion"}' in text
+
+def test_histograms_render_cumulative_buckets():
+    metrics = LLMMetrics()
+    metrics.record_call("chat", "chat", "ok", 0.3, queue_wait=0.1)
+    metrics.record_call("chat", "chat", "busy", 50.0)
+    text = metrics.render_prometheus()
+    assert 'llm_calls_total{route="chat",profile="chat",outcome="busy"} 1' in text
+    assert 'llm_call_duration_seconds_count{route="chat",profile="chat"} 2' in text
+    assert 'llm_call_duration_seconds_bucket{route="chat",profile="chat",le="+Inf"} 2' in text
@@ -0,0 +1,57 @@
+# tests/test_pdf_summary.py
+import io
+import time
+import pytest
+import chatbot_routes
+from db_operations import DatabaseOperations
+
+LARGE_DOCUMENT = "\n".join(
+    f"Chapter {n} Topic\n" + "Gradient descent updates the parameters against the gradient. " * 400
+    for n in range(1, 9)
+)
+
+def post_pdf(client, auth, **form):
+    data = {"message": "Summarise this", "files": (io.BytesIO(b"%PDF-1.4"), "book.pdf"), **form}
+    return client.post("/ask", data=data, headers=auth(), content_type="multipart/form-data", buffered=False)
+
+def test_streamed_summary_is_saved_when_the_client_disconnects(client, auth, monkeypatch):
+    monkeypatch.setattr(chatbot_routes, "extract_text_from_pdf", lambda stream: LARGE_DOCUMENT)
+    response = post_pdf(client, auth, stream="true")
+    first = next(iter(response.response))
+    assert b"event: progress" in first
+    response.close()
+
+    deadline = time.time() + 30
+    while not DatabaseOperations.get_pdf_summary_by_name("user@example.com", "book.pdf") and time.time() < deadline:
+        time.sleep(0.05)
+    summary = DatabaseOperations.get_pdf_summary_by_name("user@example.com", "book.pdf")
+    assert summary and summary["summary_content"]
+
+def test_streamed_summary_is_saved_once(client, auth, monkeypatch):
+    monkeypatch.setattr(chatbot_routes, "extract_text_from_pdf", lambda stream: LARGE_DOCUMENT)
+    body = post_pdf(client, auth, stream="true").get_data(as_text=True)
+    assert "event: done" in body
+    assert len(DatabaseOperations.get_user_pdf_summaries("user@example.com")) == 1
+
+PARTS = [{"title": f"Chapter {n}", "text": f"Chapter {n} text about gradient descent."} for n in range(1, 4)]
+
+def test_failed_part_falls_back_to_its_opening_text(monkeypatch):
+    real_response = chatbot_routes.get_local_llm_response
+
+    def flaky(prompt, **kwargs):
+        if "PART 2 OF 3" in prompt:
+            raise chatbot_routes.LLMConnectionError("AI server is unavailable.")
+        return real_response(prompt, **kwargs)
+    monkeypatch.setattr(chatbot_routes, "get_local_llm_response", flaky)
+    summaries = chatbot_routes.summarize_parts(PARTS, route="test")
+    assert len(summaries) == 3
+    assert "Chapter 2 text about gradient descent." in summaries[1]
+    assert "Chapter 1 text" not in summaries[0] and "Chapter 3 text" not in summaries[2]
+
+def test_parts_are_queued_behind_the_scheduler(monkeypatch):
+    def busy(priority):
+        raise chatbot_routes.LLMBusyError("AI server is busy.", retry_after=3)
+    monkeypatch.setattr(chatbot_routes.llm_scheduler, "acquire", busy)
+    with pytest.raises(chatbot_routes.LLMBusyError) as error:
+        chatbot_routes.summarize_parts(PARTS, route="test")
+    assert error.value.retry_after == 3
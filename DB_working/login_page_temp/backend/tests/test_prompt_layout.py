@@ -0,0 +1,41 @@
+# tests/test_prompt_layout.py
+import pytest
+from chat_prompts import MASTER_SYSTEM_PROMPT, create_master_prompt
+from chatbot_routes import create_chat_prompt, create_chunk_summary_prompt
+from llm_profiles import get_generation_profile
+from roadmap_routes import create_roadmap_prompt, create_details_prompt, create_sub_details_prompt, create_quiz_prompt
+from utils import _build_chat_request
+
+# Two calls of each builder with different inputs
+BUILDERS = {
+    "summary": (lambda: create_master_prompt("Gradient descent"), lambda: create_master_prompt("TCP windows")),
+    "summary_chunk": (lambda: create_chunk_summary_prompt("Gradient descent", 1, 3, "Optimisation"),
+                      lambda: create_chunk_summary_prompt("TCP windows", 2, 3)),
+    "roadmap": (lambda: create_roadmap_prompt("Gradient Descent"), lambda: create_roadmap_prompt("TCP")),
+    "details": (lambda: create_details_prompt("Gradient Descent"), lambda: create_details_prompt("TCP")),
+    "sub_details": (lambda: create_sub_details_prompt("Momentum", "Gradient Descent"),
+                    lambda: create_sub_details_prompt("Window", "TCP")),
+    "quiz": (lambda: create_quiz_prompt("Gradient Descent", 5, "MCQ"), lambda: create_quiz_prompt("TCP", 10, "Both", 2, 3)),
+    "chat": (lambda: create_chat_prompt("Hi", True), lambda: create_chat_prompt("What is TCP?", False)),
+}
+
+@pytest.mark.parametrize("name", BUILDERS)
+def test_system_prompt_is_static_and_inputs_go_in_the_user_tail(name):
+    first, second = (build() for build in BUILDERS[name])
+    assert first[0] == second[0]
+    for text in ("Gradient", "TCP", "What is TCP?"):
+        assert text not in first[0]
+    assert first[1] != second[1]
+
+def test_master_prompt_keeps_the_instructions_out_of_the_user_message():
+    system_prompt, prompt = create_master_prompt("Gradient descent")
+    assert system_prompt == MASTER_SYSTEM_PROMPT
+    assert "Gradient descent" in prompt and "ROLE" not in prompt
+
+def test_request_sends_the_static_system_message_first_with_prompt_caching():
+    system_prompt, prompt = create_master_prompt("Gradient descent")
+    data = _build_chat_request(prompt, get_generation_profile("summary"), system_prompt=system_prompt)
+    assert data["messages"] == [
+        {"role": "system", "content": system_prompt}, {"role": "user", "content": prompt}
+    ]
+    assert data["cache_prompt"] is True
@@ -0,0 +1,28 @@
+# tests/test_quiz_explanations.py
+import json
+import roadmap_routes
+
+ITEMS = [{"type": "mcq", "question": f"Q{i}", "user_answer": "a", "correct_answer": "b"} for i in range(3)]
+
+def test_packed_answer_gaps_are_retried_once_each(monkeypatch):
+    calls = []
+
+    def fake_llm(prompt, profile="default", **kwargs):
+        calls.append(profile)
+        if profile == "quiz_explain_batch":
+            return json.dumps([{"explanation": "packed 0"}, {"explanation": ""}, "not an object"])
+        return "single"
+    monkeypatch.setattr(roadmap_routes, "get_local_llm_response", fake_llm)
+
+    results = sorted(roadmap_routes.explain_quiz_items(ITEMS, "test"), key=lambda result: result["index"])
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert [result["explanation"] for result in results] == ["packed 0", "single", "single"]
+    assert calls.count("quiz_explain") == 2
+
+def test_unusable_packed_answer_falls_back_for_every_item(monkeypatch):
+    def fake_llm(prompt, profile="default", **kwargs):
+        return "[]" if profile == "quiz_explain_batch" else "single"
+    monkeypatch.setattr(roadmap_routes, "get_local_llm_response", fake_llm)
+
+    results = list(roadmap_routes.explain_quiz_items(ITEMS, "test"))
+    assert sorted(result["index"] for result in results) == [0, 1, 2]
@@ -0,0 +1,59 @@
+# tests/test_quiz_generation.py
+import json
+import roadmap_routes
+from roadmap_routes import merge_quiz_chunks
+
+def mcq(question):
+    return {"type": "mcq", "question": question, "options": ["A", "B", "C", "D"], "answer": "A"}
+
+def answer(*questions):
+    return json.dumps({"questions": [mcq(question) for question in questions]})
+
+def test_merge_drops_repeats_across_chunks():
+    merged = merge_quiz_chunks([answer("What is a gradient?", "What is a loss?"), answer(" what is a GRADIENT? ", "What is a step?")])
+    assert [q["question"] for q in merged["questions"]] == ["What is a gradient?", "What is a loss?", "What is a step?"]
+
+def fake_quiz_llm(monkeypatch, top_up_questions):
+    """Every chunk answers the same questions; a top-up request answers `top_up_questions`"""
+    prompts = []
+
+    async def respond(prompt, **kwargs):
+        prompts.append(prompt)
+        if "do not repeat them" in prompt:
+            return answer(*top_up_questions)
+        count = int(prompt.split("Generate EXACTLY ")[1].split()[0])
+        return answer(*[f"Repeated question {i}?" for i in range(1, count + 1)])
+    monkeypatch.setattr(roadmap_routes, "async_get_local_llm_response", respond)
+    return prompts
+
+def generate_quiz(client, auth, num_questions):
+    return client.post("/generate_quiz", json={"topic": "Gradient Descent", "num_questions": num_questions}, headers=auth())
+
+def test_repeats_are_asked_for_again(client, auth, monkeypatch):
+    prompts = fake_quiz_llm(monkeypatch, [f"New question {i}?" for i in range(1, 16)])
+    response = generate_quiz(client, auth, 20)
+    assert response.status_code == 200
+    questions = [q["question"] for q in response.get_json()["questions"]]
+    assert len(questions) == len(set(questions)) == 20
+    # One request per chunk of 5, then a single top-up for the 15 repeats listing the kept questions
+    assert len(prompts) == 5 and "Generate EXACTLY 15 questions" in prompts[-1]
+    assert "- Repeated question 1?" in prompts[-1]
+
+def test_quiz_still_short_after_the_top_up_is_not_padded(client, auth, monkeypatch):
+    fake_quiz_llm(monkeypatch, ["Repeated question 1?", "New question?"])
+    response = generate_quiz(client, auth, 20)
+    assert response.status_code == 200
+    questions = [q["question"] for q in response.get_json()["questions"]]
+    assert len(questions) == len(set(questions)) == 6
+    assert not any("(variant)" in question for question in questions)
+
+def test_bad_question_count_is_rejected(client, auth):
+    for num_questions in ("ten", None, 0, -3, [5]):
+        response = generate_quiz(client, auth, num_questions)
+        assert response.status_code == 400
+        assert "num_questions" in response.get_json()["error"]
+
+def test_blocking_generation_passes_the_profile_through_the_fan_out():
+    # The path background quiz jobs take
+    quiz_data = roadmap_routes.generate_quiz_data("Graph Theory", 10, "Both")
+    assert len(quiz_data["questions"]) == 10
@@ -0,0 +1,97 @@
+# tests/test_semantic_cache.py
+import numpy as np
+import pytest
+from llm_semantic_cache import (
+    SemanticCache, EmbeddingClient, _Index, normalize_text, distinguishing_marks, same_subject
+)
+from utils import llm_breaker
+
+def unit(values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_normalize_text_keeps_symbols_that_are_part_of_names():
+    assert normalize_text("  Cloud-Computing ") == normalize_text("cloud computing") == "cloud computing"
+    assert normalize_text('"Linear Algebra."') == "linear algebra"
+    assert len({normalize_text(topic) for topic in ("C", "C#", "C++")}) == 3
+    assert normalize_text(".NET") != normalize_text("NET")
+
+def test_distinguishing_marks():
+    assert distinguishing_marks("Calculus 1") != distinguishing_marks("Calculus 2")
+    assert distinguishing_marks("Linear Algebra I") != distinguishing_marks("Linear Algebra II")
+    assert distinguishing_marks("Python3") == distinguishing_marks("python 3")
+    assert distinguishing_marks("clud computing") == distinguishing_marks("Cloud Computing") == set()
+
+def test_near_duplicates_hit_but_different_marks_do_not():
+    # The fake embedding ignores symbols and is close for one-word typos
+    cache = SemanticCache(enabled=True, threshold=0.5)
+    cache.set("roadmap", "C", "c roadmap")
+    cache.set("roadmap", "Calculus 1", "calculus 1 roadmap")
+    cache.set("roadmap", "Cloud Computing Basics", "cloud roadmap")
+    assert cache.get("roadmap", "c") == "c roadmap"
+    assert cache.get("roadmap", "Cloud-Computing basics") == "cloud roadmap"
+    assert cache.get("roadmap", "C#") is None
+    assert cache.get("roadmap", "C++") is None
+    assert cache.get("roadmap", "Calculus 2") is None
+
+def test_same_subject_compares_content_words():
+    assert same_subject("explain cloud computing", "Cloud Computing")
+    assert same_subject("clud computing basics", "Cloud Computing")
+    assert not same_subject("explain microeconomics", "explain macroeconomics")
+    assert not same_subject("organic chemistry", "inorganic chemistry")
+    assert not same_subject("Joins in SQL", "Joins in NoSQL")
+
+def test_one_word_different_prompts_do_not_share_hits():
+    cache = SemanticCache(enabled=True, threshold=0.5)
+    cache.set("details", "explain microeconomics", "micro answer")
+    cache.set("details", "Cloud Computing Basics", "cloud answer")
+    assert cache.get("details", "explain macroeconomics") is None
+    assert cache.get("details", "Quantum Computing Basics") is None
+    assert cache.get("details", "clud computing basics") == "cloud answer"
+
+@pytest.fixture
+def open_breaker():
+    for _ in range(llm_breaker.failure_threshold):
+        llm_breaker.record_failure()
+    yield
+    llm_breaker.record_success()
+
+def test_embeddings_are_skipped_while_the_circuit_is_open(open_breaker):
+    client = EmbeddingClient()
+    assert client.embed("cloud computing") is None
+    assert client._unavailable_until == 0.0
+
+def test_unreachable_embedding_server_counts_against_the_circuit():
+    client = EmbeddingClient(url="http://127.0.0.1:9/embedding")
+    try:
+        assert client.embed("cloud computing") is None
+        assert llm_breaker.get_stats()["consecutive_failures"] == 1
+    finally:
+        llm_breaker.record_success()
+
+def test_index_grows_updates_and_evicts_oldest():
+    index = _Index()
+    vectors = [unit(np.random.default_rng(i).normal(size=8)) for i in range(300)]
+    for i, vector in enumerate(vectors):
+        index.add(f"text {i}", vector, i, max_entries=200)
+    assert len(index) <= 200
+    assert "text 0" not in index.rows and index.texts[-1] == "text 299"
+    assert index.nearest(vectors[299])[0] == index.rows["text 299"]
+    index.add("text 299", vectors[0], "updated", max_entries=200)
+    assert index.contents[index.rows["text 299"]] == "updated"
+    assert len(index.texts) == len(index.rows)
+
+def test_from_entries_keeps_the_latest_entry_per_text():
+    a, b = unit([1, 0]), unit([0, 1])
+    index = _Index.from_entries([("x", a, 1), ("y", b, 2), ("x", b, 3)], max_entries=10)
+    assert index.texts == ["y", "x"]
+    assert index.contents[index.rows["x"]] == 3
+
+def test_load_rebuilds_from_mongo_and_keeps_newer_entries():
+    SemanticCache(enabled=True).set("details", "Goroutines", "stored answer")
+    cache = SemanticCache(enabled=True, threshold=0.99)
+    cache._indexes["details"] = _Index()
+    cache._indexes["details"].add("channels", unit([1] * 64), "fresh answer", 10)
+    cache.load()
+    assert cache.get("details", "goroutines") == "stored answer"
+    assert cache._indexes["details"].contents[cache._indexes["details"].rows["channels"]] == "fresh answer"
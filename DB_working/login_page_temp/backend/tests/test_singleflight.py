@@ -0,0 +1,52 @@
+# tests/test_singleflight.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils import SingleFlight
+
+# Holds the executing call back until every caller has joined it
+release = threading.Event()
+
+@pytest.fixture(autouse=True)
+def reset_release():
+    release.clear()
+
+def run_concurrently(flight, key, fn, callers=4):
+    """Start `callers` calls of flight.do(key, fn) while fn is held back; returns their futures"""
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        futures = [pool.submit(flight.do, key, fn) for _ in range(callers)]
+        while flight.get_stats()["coalesced"] < callers - 1:
+            time.sleep(0.01)
+        release.set()
+    return futures
+
+def test_concurrent_identical_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+
+    def generate():
+        executions.append(1)
+        release.wait(5)
+        return "answer"
+    futures = run_concurrently(flight, "key", generate)
+    assert [future.result() for future in futures] == ["answer"] * 4
+    assert len(executions) == 1
+    assert flight.get_stats() == {"executed": 1, "coalesced": 3, "in_flight": 0}
+
+def test_the_error_is_shared_and_the_key_freed():
+    flight = SingleFlight()
+
+    def fail():
+        release.wait(5)
+        raise ValueError("bad answer")
+    futures = run_concurrently(flight, "key", fail)
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    assert flight.do("key", lambda: "retried") == "retried"
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+    assert flight.do("a", lambda: 1) == 1 and flight.do("b", lambda: 2) == 2
+    assert flight.get_stats()["executed"] == 2
@@ -0,0 +1,91 @@
+# tests/test_streaming.py
+# SSE bodies are generated after the view returns, outside its request context;
+# async views (ask, generate_roadmap, generate_details) are the ones that broke.
+import json
+import pytest
+from llm_metrics import llm_metrics
+from utils import ThinkTagFilter
+
+def sse_events(response):
+    """[(event, payload)] of a text/event-stream response"""
+    assert response.mimetype == "text/event-stream"
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        event, data = "message", None
+        for line in block.splitlines():
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+def last_route():
+    return llm_metrics.recent_calls()[-1]["route"]
+
+def test_ask_streams_tokens_then_done(client, auth):
+    response = client.post("/ask", data={"message": "What is a closure?", "stream": "true"}, headers=auth())
+    events = sse_events(response)
+    assert [event for event, _ in events if event != "message"] == ["done"]
+    assert any("token" in payload for event, payload in events if event == "message")
+    assert events[-1][1]["chat_reply"]
+    assert last_route().endswith("ask_ai")
+
+def test_generate_quiz_from_async_view(client, auth):
+    response = client.post("/generate_quiz", json={"topic": "Rust", "num_questions": 3}, headers=auth())
+    assert response.status_code == 200
+    assert response.get_json()["questions"]
+
+def test_sub_details_stream(client, auth):
+    response = client.post("/generate_sub_details", json={
+        "term": "Ownership", "context": "Rust", "stream": True
+    }, headers=auth())
+    events = sse_events(response)
+    assert events[-1][0] == "done" and events[-1][1]["sub_details"]
+    assert last_route().endswith("generate_sub_details")
+
+def test_explain_quiz_stream(client, auth):
+    response = client.post("/explain_quiz", json={
+        "type": "mcq", "question": "2 + 2?", "user_answer": "5", "correct_answer": "4", "stream": True
+    }, headers=auth())
+    events = sse_events(response)
+    assert events[-1][0] == "done" and events[-1][1]["explanation"]
+    assert last_route().endswith("explain_quiz")
+
+def test_generate_roadmap_streams_topics_then_done(client, auth):
+    response = client.post("/generate_roadmap", json={"query": "golang", "stream": True}, headers=auth())
+    events = sse_events(response)
+    topics = [payload for event, payload in events if event == "topic"]
+    assert topics
+    assert events[-1][0] == "done"
+    assert events[-1][1]["topic"] == "Golang"
+    assert events[-1][1]["topics"] == topics
+    assert last_route().endswith("generate_roadmap")
+
+def test_generate_details_streams_sections_then_done(client, auth):
+    response = client.post("/generate_details", json={"title": "Goroutines", "stream": True}, headers=auth())
+    events = sse_events(response)
+    sections = [payload for event, payload in events if event == "section"]
+    assert sections
+    assert events[-1] == ("done", {"details": sections})
+    assert last_route().endswith("generate_details")
+
+    # A stored note is replayed as the same events
+    again = sse_events(client.post("/generate_details", json={"title": "Goroutines", "stream": True}, headers=auth()))
+    assert again == events
+
+@pytest.mark.parametrize("chunks", [
+    ["<think>plan</think>\n\nHello", " world"],
+    ["<thi", "nk>plan</th", "ink>  Hello wor", "ld"],
+    ["Hello <", "think>hidden<", "/think>world"],
+])
+def test_think_blocks_are_hidden_even_when_split_across_chunks(chunks):
+    think = ThinkTagFilter()
+    visible = "".join(think.feed(chunk) for chunk in chunks) + think.flush()
+    assert visible.replace(" ", "") == "Helloworld"
+    assert "plan" not in visible and "hidden" not in visible
+
+def test_partial_tag_at_the_end_is_flushed_as_text():
+    think = ThinkTagFilter()
+    assert think.feed("a < b and b <th") == "a < b and b "
+    assert think.flush() == "<th"
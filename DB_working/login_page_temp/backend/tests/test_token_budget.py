@@ -0,0 +1,50 @@
+# tests/test_token_budget.py
+import token_budget
+from llm_profiles import get_generation_profile
+from token_budget import (
+    TokenCounter, token_counter, measure_prompt, prompt_budget, fit_history, fit_text, truncate_to_tokens, split_to_tokens
+)
+
+PARAGRAPH = "Gradient descent updates the parameters against the gradient of the loss.\n"
+
+def test_small_prompts_are_estimated_without_the_tokenizer():
+    before = token_counter.get_stats()["tokenized"]
+    decision = measure_prompt("chat", "You are a tutor.", "Hi")
+    assert decision["fits"] and decision["counted"] == "estimate"
+    assert token_counter.get_stats()["tokenized"] == before
+
+def test_unreachable_tokenizer_falls_back_to_the_estimate():
+    counter = TokenCounter(url="http://127.0.0.1:9/tokenize")
+    assert counter.count("four words of text") == (token_budget.estimate_tokens("four words of text"), False)
+
+def test_truncation_stays_within_the_budget_at_a_word_boundary():
+    text = PARAGRAPH * 50
+    truncated = truncate_to_tokens(text, 100)
+    assert token_counter.count(truncated)[0] <= 100
+    assert text.startswith(truncated) and text[len(truncated)] in " \n"
+
+def test_split_covers_the_text_in_chunks_within_the_budget():
+    text = PARAGRAPH * 50
+    chunks = split_to_tokens(text, 120)
+    assert len(chunks) > 1 and "".join(chunks) == text
+    assert all(token_counter.count(chunk)[0] <= 120 for chunk in chunks)
+
+def small_chat_window(monkeypatch, budget=400):
+    """Give the chat profile a context window with `budget` prompt tokens"""
+    size = get_generation_profile("chat")["max_tokens"] + token_budget.TEMPLATE_OVERHEAD_TOKENS + budget
+    monkeypatch.setitem(token_budget.LLM_CONTEXT_LIMITS, "chat", size)
+    assert prompt_budget("chat") == budget
+
+def test_history_is_dropped_oldest_first_until_the_prompt_fits(monkeypatch):
+    small_chat_window(monkeypatch)
+    history = [f"Message {i}: " + PARAGRAPH * 10 for i in range(6)]
+    prompt, decision = fit_history("chat", "You are a tutor.", "\n".join, history)
+    assert decision["fits"] and decision["action"] == "trimmed_history"
+    assert "Message 5" in prompt and "Message 0" not in prompt
+    assert prompt == "\n".join(history[decision["dropped_messages"]:])
+
+def test_oversized_text_is_truncated_to_fit(monkeypatch):
+    small_chat_window(monkeypatch)
+    prompt, decision = fit_text("chat", "You are a tutor.", lambda text: f"Explain:\n{text}", PARAGRAPH * 100)
+    assert decision["fits"] and decision["action"] == "truncated"
+    assert decision["original_prompt_tokens"] > decision["budget"] >= decision["prompt_tokens"]
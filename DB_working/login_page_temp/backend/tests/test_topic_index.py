@@ -0,0 +1,105 @@
+# tests/test_topic_index.py
+import pytest
+from db_operations import DatabaseOperations
+from llm_semantic_cache import normalize_text
+from topic_index import topic_similarity, same_topic, topic_index
+from config import TOPIC_MATCH_SUGGEST
+
+def similarity(a, b):
+    return topic_similarity(normalize_text(a), normalize_text(b))
+
+def same(a, b):
+    return same_topic(normalize_text(a), normalize_text(b))
+
+@pytest.mark.parametrize("a, b", [
+    ("Calculus 1", "Calculus 2"),
+    ("Physics 101", "Physics 102"),
+    ("Linear Algebra I", "Linear Algebra II"),
+    ("Python 2", "Python 3"),
+    ("C", "C#"),
+    ("C#", "C++"),
+    (".NET", "NET"),
+])
+def test_numbered_parts_and_symbols_are_distinct_topics(a, b):
+    assert similarity(a, b) == 0.0
+    assert not same(a, b)
+
+@pytest.mark.parametrize("a, b", [
+    ("Microeconomics", "Macroeconomics"),
+    ("Organic Chemistry", "Inorganic Chemistry"),
+    ("Calculus", "Precalculus"),
+    ("Statistics", "Statics"),
+    ("SQL", "NoSQL"),
+    ("Cloud Computing", "Quantum Computing"),
+    ("Linear Algebra", "Nonlinear Algebra"),
+    ("Java", "Lava"),
+])
+def test_near_names_are_not_the_same_topic(a, b):
+    assert not same(a, b)
+
+@pytest.mark.parametrize("a, b", [
+    ("Cloud-Computing", "cloud computing"),
+    ("clud computing", "Cloud Computing"),
+    ("Calclus 2", "Calculus 2"),
+    ("Machine Lerning", "Machine Learning"),
+    ("Pythn", "Python"),
+])
+def test_retyped_and_misspelt_topics_are_the_same(a, b):
+    assert same(a, b)
+
+def test_similar_topics_score_as_suggestions():
+    assert similarity("Cloud Computing Security", "Cloud Computing") >= TOPIC_MATCH_SUGGEST
+
+def seed_roadmap(email, topic):
+    DatabaseOperations.save_roadmap(email, topic, {"topics": [{"id": 1, "title": topic, "description": ""}]})
+    topic_index.invalidate(email)
+
+def generate(client, auth, query, **extra):
+    return client.post("/generate_roadmap", json={"query": query, **extra}, headers=auth())
+
+def test_misspelt_topic_returns_existing_roadmap(client, auth, llm_calls):
+    seed_roadmap("user@example.com", "Cloud Computing")
+    response = generate(client, auth, "clud computing")
+    assert response.status_code == 409
+    assert response.get_json()["topic"] == "Cloud Computing"
+    assert response.get_json()["matched_by"] == "same"
+    assert llm_calls() == 0
+
+def test_next_numbered_part_is_generated(client, auth):
+    seed_roadmap("user@example.com", "Calculus 1")
+    response = generate(client, auth, "Calculus 2")
+    assert response.status_code == 200
+    assert response.get_json()["topic"] == "Calculus 2"
+
+def test_symbol_topics_are_generated_separately(client, auth):
+    seed_roadmap("user@example.com", "C")
+    assert generate(client, auth, "C#").status_code == 200
+    assert generate(client, auth, "C++").status_code == 200
+
+@pytest.mark.parametrize("existing, query", [
+    ("Microeconomics", "Macroeconomics"),
+    ("Organic Chemistry", "Inorganic Chemistry"),
+    ("Calculus", "Precalculus"),
+    ("Statistics", "Statics"),
+    ("SQL", "NoSQL"),
+    ("Cloud Computing", "Quantum Computing"),
+])
+def test_near_names_are_generated(client, auth, existing, query):
+    seed_roadmap("user@example.com", existing)
+    response = generate(client, auth, query)
+    assert response.status_code == 200
+    assert response.get_json()["topic"].casefold() == query.casefold()
+
+def test_similar_topics_are_suggested_without_blocking(client, auth):
+    seed_roadmap("user@example.com", "Cloud Computing")
+    response = generate(client, auth, "Cloud Computing Security")
+    assert response.status_code == 200
+    assert response.get_json()["topic"] == "Cloud Computing Security"
+    assert response.get_json()["did_you_mean"] == ["Cloud Computing"]
+
+def test_confirm_new_bypasses_all_matching(client, auth):
+    seed_roadmap("user@example.com", "Cloud Computing")
+    same = generate(client, auth, "clud computing", confirm_new=True)
+    assert same.status_code == 200
+    assert same.get_json()["topic"] == "Clud Computing"
+    assert "did_you_mean" not in same.get_json()
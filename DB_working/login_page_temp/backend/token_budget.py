@@ -0,0 +1,189 @@
+# token_budget.py
+# Keeps prompts inside the model's context window. Tokens are counted with llama.cpp's
+# /tokenize endpoint (memoised; a character-based estimate stands in when the server
+# is unreachable or the prompt is obviously small). Each generation profile gets a
+# prompt budget: its context limit minus the tokens reserved for the answer. Callers
+# trim chat history, truncate text or split documents with the helpers below and
+# pass the returned decision dict on to the client.
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+import requests
+from config import (
+    LLAMA_CPP_CONTEXT_SIZE, LLM_CONTEXT_LIMITS, LLAMA_CPP_TOKENIZE_URL, TOKEN_ESTIMATE_CHARS_PER_TOKEN,
+    LLAMA_CPP_CONNECT_TIMEOUT
+)
+from llm_profiles import get_generation_profile
+
+TOKENIZE_TIMEOUT = 30
+# After a failed /tokenize call only estimates are used for this long
+TOKENIZE_RETRY_AFTER = 60
+TOKEN_MEMO_SIZE = 2048
+# Chat template markup around the system and user messages
+TEMPLATE_OVERHEAD_TOKENS = 64
+# Prompts whose estimate is below this share of the budget skip the tokenizer round-trip
+ESTIMATE_SAFE_FRACTION = 0.5
+
+def estimate_tokens(text):
+    """Upper-bound-ish token count from the text length alone"""
+    return math.ceil(len(text or "") / TOKEN_ESTIMATE_CHARS_PER_TOKEN)
+
+class TokenCounter:
+    """Counts tokens with llama.cpp, memoising recent texts by hash"""
+
+    def __init__(self, url=LLAMA_CPP_TOKENIZE_URL):
+        self.url = url
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+        self._unavailable_until = 0.0
+        self._stats = {"tokenized": 0, "memo_hits": 0, "estimated": 0}
+
+    def count(self, text):
+        """(tokens, exact): exact is False when the estimate had to be used"""
+        text = text or ""
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            tokens = self._memo.get(key)
+            if tokens is not None:
+                self._memo.move_to_end(key)
+                self._stats["memo_hits"] += 1
+                return tokens, True
+            if time.time() < self._unavailable_until:
+                self._stats["estimated"] += 1
+                return estimate_tokens(text), False
+        # Imported here so the budget helpers can be used without the LLM client
+        from utils import get_llm_session
+        try:
+            response = get_llm_session().post(
+                self.url, json={"content": text, "add_special": False},
+                timeout=(LLAMA_CPP_CONNECT_TIMEOUT, TOKENIZE_TIMEOUT)
+            )
+            response.raise_for_status()
+            tokens = len(response.json()["tokens"])
+        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+            print(f"Tokenize request failed, estimating token counts: {e}")
+            with self._lock:
+                self._unavailable_until = time.time() + TOKENIZE_RETRY_AFTER
+                self._stats["estimated"] += 1
+            return estimate_tokens(text), False
+        with self._lock:
+            self._memo[key] = tokens
+            while len(self._memo) > TOKEN_MEMO_SIZE:
+                self._memo.popitem(last=False)
+            self._stats["tokenized"] += 1
+        return tokens, True
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+token_counter = TokenCounter()
+
+# --- Budgets ---
+def context_limit(profile):
+    """Context window available to one request of this profile"""
+    return LLM_CONTEXT_LIMITS.get(profile["name"], LLAMA_CPP_CONTEXT_SIZE)
+
+def prompt_budget(profile):
+    """Tokens left for system + user prompt once the answer's max_tokens are reserved"""
+    if isinstance(profile, str):
+        profile = get_generation_profile(profile)
+    return context_limit(profile) - profile["max_tokens"] - TEMPLATE_OVERHEAD_TOKENS
+
+def measure_prompt(profile_name, system_prompt, prompt):
+    """Decision dict for sending this prompt with this profile; `fits` says whether it can be sent"""
+    profile = get_generation_profile(profile_name)
+    budget = prompt_budget(profile)
+    text = f"{system_prompt or ''}\n{prompt}"
+    estimate = estimate_tokens(text)
+    if estimate <= budget * ESTIMATE_SAFE_FRACTION:
+        tokens, counted = estimate, "estimate"
+    else:
+        tokens, exact = token_counter.count(text)
+        counted = "tokenizer" if exact else "estimate"
+    return {
+        "profile": profile_name,
+        "context_limit": context_limit(profile),
+        "budget": budget,
+        "prompt_tokens": tokens,
+        "counted": counted,
+        "fits": tokens <= budget,
+        "action": "none"
+    }
+
+# --- Making prompts fit ---
+def fit_history(profile_name, system_prompt, build_prompt, history):
+    """Drop the oldest history messages until build_prompt(remaining_history) fits.
+    Returns (prompt, decision); decision["fits"] is False if even no history is too long."""
+    for dropped in range(len(history) + 1):
+        prompt = build_prompt(history[dropped:])
+        decision = measure_prompt(profile_name, system_prompt, prompt)
+        if decision["fits"] or dropped == len(history):
+            if dropped:
+                decision["action"] = "trimmed_history"
+                decision["dropped_messages"] = dropped
+            return prompt, decision
+
+def fit_text(profile_name, system_prompt, build_prompt, text):
+    """build_prompt(text), truncating `text` if the prompt does not fit. Returns (prompt, decision)."""
+    prompt = build_prompt(text)
+    decision = measure_prompt(profile_name, system_prompt, prompt)
+    if decision["fits"]:
+        return prompt, decision
+    overhead = measure_prompt(profile_name, system_prompt, build_prompt(""))["prompt_tokens"]
+    original_tokens = decision["prompt_tokens"]
+    prompt = build_prompt(truncate_to_tokens(text, max(0, decision["budget"] - overhead)))
+    decision = measure_prompt(profile_name, system_prompt, prompt)
+    decision["action"] = "truncated"
+    decision["original_prompt_tokens"] = original_tokens
+    return prompt, decision
+
+def truncate_to_tokens(text, max_tokens):
+    """Longest prefix of `text` (cut at a word boundary) within max_tokens"""
+    tokens, _ = token_counter.count(text)
+    while tokens > max_tokens and text:
+        # Cut proportionally with a small margin, then re-count; converges in a few rounds
+        cut = int(len(text) * max_tokens / tokens * 0.97)
+        space = text.rfind(" ", 0, cut)
+        text = text[:space if space > cut * 0.9 else cut]
+        tokens, _ = token_counter.count(text)
+    return text
+
+def split_to_tokens(text, max_tokens):
+    """Split `text` into chunks of at most max_tokens, breaking at paragraph or line ends.
+    The document is tokenized once to learn its characters per token; every chunk is
+    then checked and split again if it still runs over."""
+    tokens, _ = token_counter.count(text)
+    if tokens <= max_tokens:
+        return [text]
+    chars_per_token = len(text) / max(tokens, 1)
+    target = max(1, int(max_tokens * chars_per_token * 0.95))
+    chunks, current = [], ""
+    for piece in re.split(r"(?<=\n)", text):
+        if current and len(current) + len(piece) > target:
+            chunks.append(current)
+            current = ""
+        while len(piece) > target:
+            # A single line longer than a chunk
+            chunks.append(piece[:target])
+            piece = piece[target:]
+        current += piece
+    if current.strip():
+        chunks.append(current)
+    result = []
+    for chunk in chunks:
+        if token_counter.count(chunk)[0] > max_tokens and len(chunk) > 1:
+            middle = len(chunk) // 2
+            result.extend(split_to_tokens(chunk[:middle], max_tokens) + split_to_tokens(chunk[middle:], max_tokens))
+        else:
+            result.append(chunk)
+    return result
+
+def get_token_budget_stats():
+    stats = token_counter.get_stats()
+    stats["context_size"] = LLAMA_CPP_CONTEXT_SIZE
+    stats["context_limits"] = dict(LLM_CONTEXT_LIMITS)
+    return stats
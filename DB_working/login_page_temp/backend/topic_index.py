@@ -0,0 +1,171 @@
+# topic_index.py
+# Per-user index of roadmap topics. generate_roadmap consults it before calling the
+# LLM, so "clud computing" or "Cloud-Computing" resolve to the user's existing
+# "Cloud Computing" roadmap without a generation. Keys are normalised topics.
+# Only a retyped or misspelt topic (a couple of character edits) counts as the same one;
+# near names ("Microeconomics" / "Macroeconomics", "SQL" / "NoSQL") and topics that differ
+# in a number, roman numeral or symbol ("Calculus 1" / "Calculus 2", "C" / "C#") never do.
+# Candidates scored by trigram overlap and edit distance are only offered as suggestions.
+import threading
+import time
+from collections import OrderedDict
+from config import (
+    TOPIC_INDEX_TTL, TOPIC_INDEX_MAX_USERS, TOPIC_MATCH_MAX_EDITS, TOPIC_MATCH_SUGGEST, TOPIC_MATCH_MAX_SUGGESTIONS
+)
+from db_operations import DatabaseOperations
+from llm_semantic_cache import normalize_text, distinguishing_marks
+
+def trigrams(text):
+    """Character trigrams of `text`, padded so short words and word starts count too"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def trigram_similarity(a, b):
+    """Jaccard similarity of the trigram sets"""
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return len(grams_a & grams_b) / len(grams_a | grams_b)
+
+def edit_distance(a, b):
+    """Levenshtein distance"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        previous = current
+    return previous[-1]
+
+def topic_similarity(a, b):
+    """0-1 score of two normalised topics: the better of trigram overlap and edit-distance ratio.
+    Trigrams catch reordered or extra words, the edit ratio catches typos in short topics.
+    Topics with different distinguishing marks score 0: they are numbered parts or other names."""
+    if a == b:
+        return 1.0
+    longest = max(len(a), len(b))
+    if not longest or distinguishing_marks(a) != distinguishing_marks(b):
+        return 0.0
+    edit_ratio = 1.0 - edit_distance(a, b) / longest
+    return max(trigram_similarity(a, b), edit_ratio)
+
+# Word prefixes that turn a topic into a different one ("Organic" / "Inorganic Chemistry")
+MEANINGFUL_PREFIXES = (
+    "micro", "macro", "non", "no", "in", "un", "pre", "post", "anti", "sub", "super", "inter", "intra",
+    "multi", "mono", "poly", "hyper", "hypo", "semi", "meta", "bio", "geo", "neuro", "astro"
+)
+
+def strip_prefix(word):
+    """`word` without its longest meaningful prefix (keeping a stem of at least 3 letters)"""
+    for prefix in sorted(MEANINGFUL_PREFIXES, key=len, reverse=True):
+        if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+            return word[len(prefix):]
+    return word
+
+def prefix_variant(a, b):
+    """True when a word of one topic is the other's word with a prefix added or swapped"""
+    words_a, words_b = a.split(), b.split()
+    if len(words_a) != len(words_b):
+        return False
+    for word_a, word_b in zip(words_a, words_b):
+        if word_a != word_b and (
+            strip_prefix(word_a) == strip_prefix(word_b) or strip_prefix(word_a) == word_b
+            or word_a == strip_prefix(word_b)
+        ):
+            return True
+    return False
+
+def allowed_edits(a, b):
+    shortest = min(len(a), len(b))
+    if shortest < 5:
+        return 0
+    return 1 if shortest < 10 else TOPIC_MATCH_MAX_EDITS
+
+def same_topic(a, b):
+    """Two normalised topics name the same roadmap: equal, or a small typo apart"""
+    if a == b:
+        return True
+    if distinguishing_marks(a) != distinguishing_marks(b) or prefix_variant(a, b):
+        return False
+    return edit_distance(a, b) <= allowed_edits(a, b)
+
+class TopicIndex:
+    """user_email -> {normalised topic: stored topic}, loaded from Mongo and kept for a TTL"""
+
+    def __init__(self, ttl=TOPIC_INDEX_TTL, max_users=TOPIC_INDEX_MAX_USERS):
+        self.ttl = ttl
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"exact": 0, "same": 0, "suggested": 0, "misses": 0, "loads": 0}
+
+    def _topics(self, user_email):
+        with self._lock:
+            entry = self._users.get(user_email)
+            if entry and time.time() - entry[0] < self.ttl:
+                self._users.move_to_end(user_email)
+                return entry[1]
+        # Other nodes may have added roadmaps, so entries expire after the TTL
+        topics = {}
+        for topic in DatabaseOperations.get_user_roadmap_topics(user_email):
+            topics.setdefault(normalize_text(topic), topic)
+        with self._lock:
+            self._users[user_email] = (time.time(), topics)
+            self._users.move_to_end(user_email)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            self._stats["loads"] += 1
+        return topics
+
+    def invalidate(self, user_email):
+        """Drop a user's entry after one of their roadmaps was saved or deleted"""
+        with self._lock:
+            self._users.pop(user_email, None)
+
+    def match(self, user_email, query):
+        """Look `query` up among the user's topics.
+        Returns ("exact" | "same", [topic]) when it names an existing roadmap,
+        ("suggest", [topics...]) for similar but different topics, or (None, []) otherwise."""
+        key = normalize_text(query)
+        if not key:
+            return None, []
+        topics = self._topics(user_email)
+        if key in topics:
+            self._bump("exact")
+            return "exact", [topics[key]]
+
+        same = sorted(
+            (edit_distance(key, normalized), topic) for normalized, topic in topics.items()
+            if same_topic(key, normalized)
+        )
+        if same:
+            self._bump("same")
+            return "same", [same[0][1]]
+        scored = sorted(
+            ((topic_similarity(key, normalized), topic) for normalized, topic in topics.items()),
+            reverse=True
+        )
+        suggestions = [topic for score, topic in scored if score >= TOPIC_MATCH_SUGGEST]
+        if suggestions:
+            self._bump("suggested")
+            return "suggest", suggestions[:TOPIC_MATCH_MAX_SUGGESTIONS]
+        self._bump("misses")
+        return None, []
+
+    def _bump(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["users"] = len(self._users)
+        return stats
+
+topic_index = TopicIndex()
@@ -1,41 +1,726 @@
 # utils.py
 import requests
+from flask import Response, request
+from requests.adapters import HTTPAdapter
 import json
+import random
 import re
-
-LLAMA_CPP_URL = "http://127.0.0.1:8080/v1/chat/completions"
+import threading
+import time
+from contextlib import contextmanager
+from config import (
+    LLAMA_CPP_BACKENDS, LLAMA_CPP_PARALLEL, LLAMA_CPP_CONNECT_TIMEOUT, LLAMA_CPP_READ_TIMEOUT,
+    LLAMA_CPP_HEALTH_INTERVAL, LLAMA_CPP_EJECT_AFTER, LLAMA_CPP_CACHE_PROMPT, LLAMA_CPP_MODEL,
+    LLAMA_CPP_SMALL_BACKENDS, LLAMA_CPP_SMALL_MODEL, LLAMA_CPP_BACKEND_COUNT, LLM_TIER_FALLBACKS,
+    LLM_BREAKER_FAILURE_THRESHOLD,
+    LLM_BREAKER_RESET_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY, LLM_RETRY_AFTER_MAX
+)
+from llm_backends import LLMBackendPool, LLMTier, LLMTierRouter, NoHealthyBackendError
+from llm_cache import llm_cache, make_cache_key
+from llm_scheduler import llm_scheduler, LLMBusyError
+from llm_profiles import get_generation_profile
+from llm_metrics import llm_metrics, resolve_route
 
 class LLMConnectionError(Exception):
     """Custom exception for LLM connection errors"""
     pass
 
-def get_local_llm_response(prompt_text):
-    """
-    Sends a prompt to the local llama.cpp server and gets a response.
-    It also cleans the response by removing <think> blocks.
-    Raises LLMConnectionError if connection fails.
-    """
-    
-    prompt_text += " /no-think" # Suppress the <think> block
-    headers = { "Content-Type": "application/json" }
+class _TransientLLMError(LLMConnectionError):
+    """Connection refused/reset or a 502/503/504 from llama.cpp; worth retrying.
+    retry_after is the server's Retry-After in seconds when it sent one."""
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class _RejectedLLMRequest(LLMConnectionError):
+    """llama.cpp answered with a 4xx: the server is up but refused this request"""
+    pass
+
+OFFLINE_MESSAGE = "AI server is offline. Please start the LLM server on port 8080 and try again."
+
+# --- Pooled HTTP client ---
+# One keep-alive session is shared by every blueprint so requests reuse the
+# connections to llama.cpp instead of opening (and TIME_WAIT-ing) one per call.
+_session = None
+_session_lock = threading.Lock()
+_client_stats = {"requests": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+def get_llm_session():
+    """Return the process-wide requests.Session used to talk to llama.cpp"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=LLAMA_CPP_BACKEND_COUNT,
+                    pool_maxsize=LLAMA_CPP_PARALLEL,
+                    max_retries=0
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({
+                    "Content-Type": "application/json",
+                    "Connection": "keep-alive"
+                })
+                _session = session
+    return _session
+
+# --- Backends ---
+def _backend_pool(base_urls):
+    return LLMBackendPool(base_urls, eject_after=LLAMA_CPP_EJECT_AFTER, health_interval=LLAMA_CPP_HEALTH_INTERVAL)
+
+llm_tiers = LLMTierRouter([
+    LLMTier("large", LLAMA_CPP_MODEL, _backend_pool(LLAMA_CPP_BACKENDS), LLM_TIER_FALLBACKS.get("large")),
+    LLMTier("small", LLAMA_CPP_SMALL_MODEL, _backend_pool(LLAMA_CPP_SMALL_BACKENDS), LLM_TIER_FALLBACKS.get("small"))
+])
+
+def _acquire_backend(tier_name, sticky_key=None, call=None, failed_tiers=None):
+    """Pick (tier, backend) for a call; `call` records which tier actually served it.
+    Retries pass the tiers that already failed so they move on to the fallback tier."""
+    llm_tiers.start_health_checks(get_llm_session)
+    try:
+        tier, backend = llm_tiers.acquire(tier_name, sticky_key, failed_tiers or ())
+    except NoHealthyBackendError as e:
+        print(f"Error connecting to local LLM server: {e}")
+        raise _TransientLLMError(OFFLINE_MESSAGE)
+    if call is not None:
+        call["tier"] = tier.name
+        # The tier this call normally lands on (the request's model): tiers without backends
+        # are skipped by design, so only a healthy-backend miss counts as a fallback
+        call["requested_tier"] = llm_tiers.chain(tier_name)[0].name
+    return tier, backend
+
+def served_by_requested_tier(call):
+    """False when a fallback tier answered because the usual one had no healthy backend:
+    the cache key names the usual tier's model, so such an answer is not cached"""
+    return call.get("tier") == call.get("requested_tier")
+
+def _payload_for(tier, data):
+    """The request body for a tier; a fallback tier gets its own model name"""
+    return data if data["model"] == tier.model else dict(data, model=tier.model)
+
+def _count(key):
+    with _stats_lock:
+        _client_stats[key] += 1
+
+def get_llm_client_stats():
+    """Return request counters plus per-pool connection stats for the LLM client"""
+    with _stats_lock:
+        stats = dict(_client_stats)
+    pools = []
+    session = _session
+    if session is not None:
+        for adapter in set(session.adapters.values()):
+            manager = adapter.poolmanager
+            for key in list(manager.pools.keys()):
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                pools.append({
+                    "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                    "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                    "idle_connections": pool.pool.qsize() if pool.pool is not None else 0,
+                    "connections_opened": pool.num_connections,
+                    "requests_sent": pool.num_requests
+                })
+    stats["pools"] = pools
+    stats["tiers"] = llm_tiers.get_stats()
+    stats["cache"] = llm_cache.get_stats()
+    stats["singleflight"] = llm_singleflight.get_stats()
+    stats["scheduler"] = llm_scheduler.get_stats()
+    stats["circuit_breaker"] = llm_breaker.get_stats()
+    return stats
+
+def _build_chat_request(prompt_text, profile, stream=False, json_schema=None, system_prompt=None):
+    """Build the /v1/chat/completions payload shared by the blocking and streaming calls"""
+    messages = []
+    if system_prompt:
+        # Static instructions first so consecutive requests share a token prefix
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt_text})
     data = {
-        "model": "local-model",
-        "messages": [{"role": "user", "content": prompt_text}],
-        "temperature": 0.1,
-        "max_tokens": 12000
+        "model": llm_tiers.model_for(profile["tier"]),
+        "messages": messages,
+        "temperature": profile["temperature"],
+        "max_tokens": profile["max_tokens"],
+        # Suppress the <think> block through the chat template
+        "chat_template_kwargs": profile["chat_template_kwargs"],
+        "cache_prompt": LLAMA_CPP_CACHE_PROMPT
     }
+    if profile["slot"] is not None:
+        data["id_slot"] = profile["slot"]
+    if profile["stop"]:
+        data["stop"] = profile["stop"]
+    if json_schema is not None:
+        # llama.cpp compiles the schema to a grammar, so the output always parses
+        data["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": profile["name"], "schema": json_schema}
+        }
+    if stream:
+        data["stream"] = True
+        # Ask for a final usage chunk so streamed calls can be metered too
+        data["stream_options"] = {"include_usage": True}
+    return data
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures; open fails fast for
+    `reset_timeout` seconds, then half-open lets one trial call decide whether to close again."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=LLM_BREAKER_FAILURE_THRESHOLD, reset_timeout=LLM_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._stats = {"rejected": 0, "opened": 0}
+
+    def ensure_not_open(self):
+        """Cheap pre-check (no state change) so callers fail fast before queueing"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.time() - self._opened_at)
+                if remaining > 0:
+                    self._stats["rejected"] += 1
+                    raise LLMConnectionError(f"AI server is unavailable. Please try again in {int(remaining) + 1} seconds.")
+
+    def before_call(self):
+        """Raise LLMConnectionError immediately while the circuit is open"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self.reset_timeout - (time.time() - self._opened_at)
+                if remaining > 0:
+                    self._stats["rejected"] += 1
+                    raise LLMConnectionError(f"AI server is unavailable. Please try again in {int(remaining) + 1} seconds.")
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self._stats["rejected"] += 1
+                    raise LLMConnectionError("AI server is recovering. Please try again shortly.")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self._stats["opened"] += 1
+                    print(f"LLM circuit opened after {self._failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.time()
+
+    def record(self, error=None):
+        """Record a call outcome; only errors that mean the server is unhealthy count as failures"""
+        if error is None or isinstance(error, _RejectedLLMRequest) or not isinstance(error, LLMConnectionError):
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({"state": self.state, "consecutive_failures": self._failures})
+        return stats
+
+llm_breaker = CircuitBreaker()
+
+def _backoff_delay(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def parse_retry_after(value):
+    """Seconds from a Retry-After header (the HTTP-date form is ignored)"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(error, attempt):
+    """Pause before retrying after `error`: jittered backoff, but never shorter than the
+    error's Retry-After. None when that hint exceeds LLM_RETRY_AFTER_MAX (do not retry)."""
+    retry_after = getattr(error, "retry_after", None) or 0
+    if retry_after > LLM_RETRY_AFTER_MAX:
+        return None
+    return max(_backoff_delay(attempt), retry_after)
+
+def _call_with_retries(fn):
+    """Run fn behind the circuit breaker, retrying transient failures with jittered backoff"""
+    attempt = 0
+    while True:
+        llm_breaker.before_call()
+        try:
+            result = fn()
+        except Exception as e:
+            llm_breaker.record(e)
+            delay = retry_delay(e, attempt) if isinstance(e, _TransientLLMError) and attempt < LLM_MAX_RETRIES else None
+            if delay is not None:
+                time.sleep(delay)
+                attempt += 1
+                continue
+            raise
+        llm_breaker.record()
+        return result
+
+# --- Single-flight coalescing ---
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Lets concurrent callers with the same key share one execution (and its result or error)"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _InFlightCall()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+llm_singleflight = SingleFlight()
+
+# --- Call instrumentation ---
+def _call_outcome(e):
+    """Outcome label for a failed call"""
+    if isinstance(e, LLMBusyError):
+        return "busy"
+    if isinstance(e, _RejectedLLMRequest):
+        return "rejected"
+    if isinstance(e, LLMConnectionError):
+        return "unavailable"
+    if isinstance(e, (GeneratorExit, KeyboardInterrupt)) or type(e).__name__ == "CancelledError":
+        return "cancelled"
+    return "error"
+
+@contextmanager
+def track_llm_call(route, profile_name):
+    """Record the wrapped LLM call in llm_metrics. The block fills in the yielded dict:
+    queue_wait from the scheduler, usage/timings from llama.cpp's response,
+    tier/requested_tier from the backend router."""
+    call = {"queue_wait": None, "usage": None, "timings": None, "tier": None, "requested_tier": None}
+    started = time.time()
+    try:
+        yield call
+    except BaseException as e:
+        llm_metrics.record_call(route, profile_name, _call_outcome(e), time.time() - started, **call)
+        raise
+    llm_metrics.record_call(route, profile_name, "ok", time.time() - started, **call)
+
+def _raise_llm_error(e):
+    """Translate a requests exception into the matching LLMConnectionError subclass"""
+    _count("errors")
+    error_msg = f"Error connecting to local LLM server: {e}"
+    print(error_msg)
+    status = e.response.status_code if getattr(e, "response", None) is not None else None
+    if isinstance(e, requests.exceptions.ConnectionError) or status in (502, 503, 504):
+        retry_after = parse_retry_after(e.response.headers.get("Retry-After")) if status else None
+        raise _TransientLLMError(OFFLINE_MESSAGE, retry_after)
+    if status is not None and status < 500:
+        raise _RejectedLLMRequest(f"AI server rejected the request (HTTP {status}).")
+    raise LLMConnectionError(OFFLINE_MESSAGE)
+
+def _post_chat_completion(data, sticky_key=None, call=None, tier_name="large", failed_tiers=None):
+    """POST a chat completion to a backend of the given model tier and return the cleaned
+    message content. `call` (from track_llm_call) receives the response's usage and timings;
+    `failed_tiers` (a set shared across retries) collects tiers whose backend failed."""
+    tier, backend = _acquire_backend(tier_name, sticky_key, call, failed_tiers)
+    ok = False
+    _count("requests")
     try:
-        response = requests.post(LLAMA_CPP_URL, headers=headers, data=json.dumps(data), timeout=300)
+        response = get_llm_session().post(
+            backend.chat_url,
+            data=json.dumps(_payload_for(tier, data)),
+            timeout=(LLAMA_CPP_CONNECT_TIMEOUT, LLAMA_CPP_READ_TIMEOUT)
+        )
+        ok = response.status_code < 500
         response.raise_for_status()
-        content = response.json()['choices'][0]['message']['content']
+        body = response.json()
+        if call is not None:
+            call["usage"] = body.get("usage")
+            call["timings"] = body.get("timings")
+        content = body['choices'][0]['message']['content']
         # Reliably remove the <think> block if the AI still adds it
         content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL).strip()
         return content
-    except requests.exceptions.ConnectionError as e:
-        error_msg = f"Error connecting to local LLM server: {e}"
-        print(error_msg)
-        raise LLMConnectionError("AI server is offline. Please start the LLM server on port 8080 and try again.")
     except requests.exceptions.RequestException as e:
-        error_msg = f"Error connecting to local LLM server: {e}"
-        print(error_msg)
-        raise LLMConnectionError("AI server is offline. Please start the LLM server on port 8080 and try again.")
\ No newline at end of file
+        _raise_llm_error(e)
+    finally:
+        if not ok and failed_tiers is not None:
+            failed_tiers.add(tier.name)
+        llm_tiers.release(tier, backend, ok)
+
+def get_local_llm_response(prompt_text, profile="default", cache=False, regenerate=False, priority=None,
+                           sticky_key=None, json_schema=None, system_prompt=None, route=None):
+    """
+    Sends a prompt to the local llama.cpp server and gets a response.
+    It also cleans the response by removing <think> blocks.
+    `profile` names a generation profile (token budget, stops, temperature,
+    priority class); `priority` overrides the profile's priority class.
+    json_schema constrains the output to that schema (see llm_schemas).
+    system_prompt is sent as a separate system message ahead of prompt_text;
+    keep it static so llama.cpp can reuse the cached prefix across requests.
+    With cache=True the response is served from / stored in the LLM cache;
+    regenerate=True skips the lookup but still refreshes the cached entry.
+    Identical requests already in flight are coalesced into one generation,
+    which then waits for a scheduler slot in the given priority class.
+    sticky_key (e.g. the user's email) keeps a conversation on one backend.
+    The profile's model tier picks the backend pool (falling back to another tier).
+    route names the caller in llm_metrics (defaults to the Flask endpoint).
+    Raises LLMConnectionError if connection fails, LLMBusyError if the queue is full.
+    """
+    profile = get_generation_profile(profile)
+    if priority is None:
+        priority = profile["priority"]
+    route = resolve_route(route)
+    data = _build_chat_request(prompt_text, profile, json_schema=json_schema, system_prompt=system_prompt)
+    request_key = make_cache_key(data)
+    if cache:
+        if regenerate:
+            llm_cache.record_bypass()
+        else:
+            cached = llm_cache.get(request_key)
+            if cached is not None:
+                llm_metrics.record_call(route, profile["name"], "cache_hit", 0.0)
+                return cached
+
+    def generate():
+        with track_llm_call(route, profile["name"]) as call:
+            llm_breaker.ensure_not_open()  # fail fast instead of queueing during an outage
+            with llm_scheduler.slot(priority) as waited:
+                call["queue_wait"] = waited
+                failed_tiers = set()
+                content = _call_with_retries(
+                    lambda: _post_chat_completion(data, sticky_key, call, profile["tier"], failed_tiers)
+                )
+        if cache and served_by_requested_tier(call):
+            llm_cache.set(request_key, content, {"model": data["model"]})
+        return content
+
+    return llm_singleflight.do(request_key, generate)
+
+def parse_json_response(response_str):
+    """
+    Parse a structured LLM answer. Schema-constrained output parses directly;
+    code fences or stray text (servers without grammar support) are tolerated.
+    """
+    text = response_str.strip()
+    if text.startswith("```"):
+        text = re.sub(r'^```(?:json)?\s*', '', text)
+        text = re.sub(r'\s*```$', '', text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    match = re.search(r'[\[{].*[\]}]', text, re.DOTALL)
+    if not match:
+        raise ValueError(f"Could not find valid JSON in LLM response. Response preview: {text[:500]}")
+    return json.loads(match.group(0))
+
+# --- Streaming ---
+class ThinkTagFilter:
+    """Strips <think>...</think> blocks from a token stream, even when a tag is split across chunks"""
+    OPEN_TAG = "<think>"
+    CLOSE_TAG = "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._in_think = False
+        self._started = False
+
+    @staticmethod
+    def _partial_tag_length(text, tag):
+        # Length of the longest prefix of `tag` that `text` ends with
+        for size in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:size]):
+                return size
+        return 0
+
+    def _emit(self, text):
+        # Mirror the .strip() of the blocking path for leading whitespace
+        if not self._started:
+            text = text.lstrip()
+            if text:
+                self._started = True
+        return text
+
+    def feed(self, chunk):
+        """Add a chunk of raw model output and return the part that is safe to show"""
+        self._buffer += chunk
+        visible = []
+        while self._buffer:
+            tag = self.CLOSE_TAG if self._in_think else self.OPEN_TAG
+            idx = self._buffer.find(tag)
+            if idx != -1:
+                if not self._in_think:
+                    visible.append(self._buffer[:idx])
+                self._buffer = self._buffer[idx + len(tag):]
+                self._in_think = not self._in_think
+                continue
+            keep = self._partial_tag_length(self._buffer, tag)
+            if not self._in_think:
+                visible.append(self._buffer[:len(self._buffer) - keep])
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            break
+        return self._emit("".join(visible))
+
+    def flush(self):
+        """Return whatever is still buffered once the stream has ended"""
+        rest = "" if self._in_think else self._buffer
+        self._buffer = ""
+        return self._emit(rest)
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a streamed JSON answer: feed() returns each element of the
+    target array as soon as the element is complete. The target is the array under
+    `key` in the root object, or the root itself when the answer is a bare array.
+    Elements that fail to parse are skipped; callers still validate the full answer.
+    """
+
+    def __init__(self, key=None):
+        self.key = key
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string = []        # current string outside any element (a candidate key)
+        self._last_string = None
+        self._array_depth = None  # depth just inside the target array, once it has opened
+        self._element = None      # characters of the element being read
+        self._done = False
+
+    def feed(self, text):
+        """Consume a chunk of the answer; returns the elements completed by it"""
+        items = []
+        for ch in text:
+            if self._done:
+                break
+            if self._element is not None:
+                if not self._in_string and self._depth == self._array_depth and ch in ",]":
+                    # A scalar element ends at the next separator
+                    self._emit(items)
+                    self._done = ch == "]"
+                    continue
+                self._element.append(ch)
+            elif self._array_depth is not None and self._depth == self._array_depth and not self._in_string:
+                if ch == "]":
+                    self._done = True
+                    continue
+                if ch in ", \t\r\n":
+                    continue
+                self._element = [ch]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._element is None:
+                        self._last_string = "".join(self._string)
+                elif self._element is None:
+                    self._string.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._string = []
+            elif ch in "{[":
+                self._depth += 1
+                if self._array_depth is None and ch == "[" and (
+                        self._depth == 1 or (self._depth == 2 and self.key and self._last_string == self.key)):
+                    self._array_depth = self._depth
+            elif ch in "}]":
+                self._depth -= 1
+                if self._element is not None and self._depth == self._array_depth:
+                    self._emit(items)
+        return items
+
+    def _emit(self, items):
+        raw = "".join(self._element).strip()
+        self._element = None
+        try:
+            items.append(json.loads(raw))
+        except json.JSONDecodeError:
+            print(f"Skipping unparseable streamed element: {raw[:80]}")
+
+def stream_local_llm_response(prompt_text, profile="default", cache=False, regenerate=False, priority=None,
+                              sticky_key=None, json_schema=None, system_prompt=None, route=None):
+    """
+    Streams a completion from the local llama.cpp server (stream: true),
+    yielding text chunks with <think> blocks removed as they arrive.
+    Cache hits are yielded as a single chunk; see get_local_llm_response.
+    The scheduler slot is held until the stream is exhausted or closed.
+    Raises LLMConnectionError if connection fails, LLMBusyError if the queue is full.
+    """
+    profile = get_generation_profile(profile)
+    if priority is None:
+        priority = profile["priority"]
+    # Resolved up front: the generator body may run after the request context is gone
+    route = resolve_route(route)
+    data = _build_chat_request(prompt_text, profile, stream=True, json_schema=json_schema, system_prompt=system_prompt)
+    cache_key = make_cache_key(data) if cache else None
+    if cache:
+        if regenerate:
+            llm_cache.record_bypass()
+        else:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                llm_metrics.record_call(route, profile["name"], "cache_hit", 0.0)
+                yield cached
+                return
+
+    think_filter = ThinkTagFilter()
+    chunks = []
+    failed_tiers = set()
+    with track_llm_call(route, profile["name"]) as call:
+        llm_breaker.ensure_not_open()
+        with llm_scheduler.slot(priority) as waited:
+            call["queue_wait"] = waited
+            attempt = 0
+            while True:
+                llm_breaker.before_call()
+                try:
+                    yield from _stream_chat_completion(
+                        data, think_filter, chunks, sticky_key, call, profile["tier"], failed_tiers
+                    )
+                except GeneratorExit:
+                    # Client went away mid-stream; the server itself was fine
+                    llm_breaker.record()
+                    raise
+                except Exception as e:
+                    llm_breaker.record(e)
+                    # Only retry while nothing has reached the client yet
+                    delay = None
+                    if isinstance(e, _TransientLLMError) and not chunks and attempt < LLM_MAX_RETRIES:
+                        delay = retry_delay(e, attempt)
+                    if delay is not None:
+                        time.sleep(delay)
+                        attempt += 1
+                        continue
+                    raise
+                llm_breaker.record()
+                break
+
+    if cache and served_by_requested_tier(call):
+        llm_cache.set(cache_key, "".join(chunks).strip(), {"model": data["model"]})
+
+def _stream_chat_completion(data, think_filter, chunks, sticky_key=None, call=None, tier_name="large",
+                           failed_tiers=None):
+    """POST a streaming chat completion to a backend, yielding filtered text chunks"""
+    tier, backend = _acquire_backend(tier_name, sticky_key, call, failed_tiers)
+    ok = False
+    _count("requests")
+    try:
+        with get_llm_session().post(
+            backend.chat_url,
+            data=json.dumps(_payload_for(tier, data)),
+            timeout=(LLAMA_CPP_CONNECT_TIMEOUT, LLAMA_CPP_READ_TIMEOUT),
+            stream=True
+        ) as response:
+            ok = response.status_code < 500
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                line = line.decode("utf-8")
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                event = json.loads(payload)
+                if call is not None:
+                    # usage/timings arrive on the last chunks
+                    call["usage"] = event.get("usage") or call["usage"]
+                    call["timings"] = event.get("timings") or call["timings"]
+                choices = event.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    text = think_filter.feed(delta)
+                    if text:
+                        chunks.append(text)
+                        yield text
+        text = think_filter.flush()
+        if text:
+            chunks.append(text)
+            yield text
+    except requests.exceptions.RequestException as e:
+        _raise_llm_error(e)
+    finally:
+        if not ok and failed_tiers is not None:
+            failed_tiers.add(tier.name)
+        llm_tiers.release(tier, backend, ok)
+
+# --- Server-Sent Events helpers ---
+def wants_event_stream(flag=None):
+    """True when the client opted into SSE with a `stream` flag or an Accept: text/event-stream header"""
+    if isinstance(flag, str):
+        flag = flag.strip().lower() in ("1", "true", "yes")
+    if flag:
+        return True
+    return request.accept_mimetypes.best == "text/event-stream"
+
+def sse_event(payload, event=None):
+    """Format one Server-Sent Event carrying a JSON payload"""
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(payload)}\n\n"
+
+def sse_response(events):
+    """Wrap an event generator in an unbuffered text/event-stream response.
+    The generator runs after the view has returned and without its request context
+    (async views cannot hand theirs over), so it must only use values captured up
+    front: request data, the user, and the metrics route from resolve_route()."""
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )